@@ -0,0 +1,173 @@
+import os
+import re
+import csv
+import json
+import time
+import argparse
+import subprocess
+from utils import RESULTS_DIR, log_message
+
+INSTALL_TIMINGS_FILE = os.path.join(RESULTS_DIR, "package_install_timings.csv")  # per-package install time of every build
+SLOW_INSTALL_SECONDS = 60  # package installs taking longer are reported while the build runs
+TERMINATE_TIMEOUT = 30  # seconds repo2docker gets to stop after an abort before it is killed
+
+# Build output that makes the build fail for sure, however long it keeps running. Every package of DESCRIPTION must
+# install for the final project install to succeed, so an unavailable or unbuildable package is fatal.
+BUILD_FATAL_PATTERNS = [
+    r"ERROR: configuration failed for package ['‘](?P<package>[^'’]+)['’]",
+    r"ERROR: compilation failed for package ['‘](?P<package>[^'’]+)['’]",
+    r"ERROR: dependenc(?:y|ies) .* (?:is|are) not available for package ['‘](?P<package>[^'’]+)['’]",
+    r"package ['‘](?P<package>[^'’]+)['’] is not available (?:for this version of R|\(for R version)",
+    r"E: Unable to locate package (?P<package>\S+)",
+]
+
+INSTALL_START_PATTERN = re.compile(r"^\* installing \*(?P<kind>source|binary)\* package ['‘](?P<package>[^'’]+)['’]")
+# Parallel installs (Ncpus > 1) announce each package when it starts and print its output only once it finished
+PARALLEL_START_PATTERN = re.compile(r"^begin installing package ['‘](?P<package>[^'’]+)['’]")
+INSTALL_DONE_PATTERN = re.compile(r"^\* DONE \((?P<package>[^)]+)\)")
+INSTALL_FAILED_PATTERN = re.compile(r"^ERROR: .* for package ['‘](?P<package>[^'’]+)['’]")
+
+
+def load_build_monitor_config(path):
+    """Overrides the fatal patterns ("fatal", a list of regexes; empty disables aborts) or the slow install
+    threshold ("slow_seconds") from a JSON file."""
+    global SLOW_INSTALL_SECONDS
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if "fatal" in config:
+        BUILD_FATAL_PATTERNS[:] = config["fatal"]
+    SLOW_INSTALL_SECONDS = config.get("slow_seconds", SLOW_INSTALL_SECONDS)
+
+
+class BuildAborted(subprocess.CalledProcessError):
+    """Raised when a build was stopped because its output matched a fatal pattern. Never worth retrying."""
+
+    def __init__(self, returncode, cmd, reason):
+        super().__init__(returncode, cmd)
+        self.reason = reason
+
+    def __str__(self):
+        return f"Build aborted: {self.reason}"
+
+
+class BuildMonitor:
+    """Parses repo2docker output line by line: times every R package install and detects fatal errors."""
+
+    def __init__(self, project_id, image_name):
+        self.project_id = project_id
+        self.image_name = image_name
+        self.fatal_patterns = [re.compile(pattern) for pattern in BUILD_FATAL_PATTERNS]
+        self.started = {}  # package -> (kind, monotonic start time)
+        self.installs = []  # (package, kind, seconds, status)
+
+    def feed(self, line):
+        """Processes one line of build output. Returns the fatal error line if the build should be aborted."""
+        line = line.strip()
+        match = INSTALL_START_PATTERN.match(line)
+        if match:
+            package = match.group("package")
+            start = self.started.get(package, (None, time.monotonic()))[1]
+            self.started[package] = (match.group("kind"), start)
+        elif match := PARALLEL_START_PATTERN.match(line):
+            self.started.setdefault(match.group("package"), ("source", time.monotonic()))
+        elif match := INSTALL_DONE_PATTERN.match(line):
+            self.finish_install(match.group("package"), "installed")
+        elif match := INSTALL_FAILED_PATTERN.match(line):
+            self.finish_install(match.group("package"), "failed")
+
+        for pattern in self.fatal_patterns:
+            if pattern.search(line):
+                return line
+        return None
+
+    def finish_install(self, package, status):
+        if package not in self.started:
+            return
+        kind, start = self.started.pop(package)
+        seconds = time.monotonic() - start
+        self.installs.append((package, kind, seconds, status))
+        if seconds >= SLOW_INSTALL_SECONDS:
+            log_message(self.project_id, "CONTAINER BUILD", f"🐢 Installing {package} ({kind}) took {seconds:.0f} seconds.")
+
+    def record(self, outcome):
+        """Appends the install timings of this build to the timings CSV and logs the slowest installs."""
+        if not self.installs:
+            return
+        write_header = not os.path.exists(INSTALL_TIMINGS_FILE)
+        os.makedirs(os.path.dirname(INSTALL_TIMINGS_FILE), exist_ok=True)
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        with open(INSTALL_TIMINGS_FILE, "a", newline="") as csvfile:
+            writer = csv.writer(csvfile)
+            if write_header:
+                writer.writerow(["Project ID", "Image", "Package", "Kind", "Seconds", "Status", "Build Outcome", "Timestamp"])
+            for package, kind, seconds, status in self.installs:
+                writer.writerow([self.project_id, self.image_name, package, kind, f"{seconds:.2f}", status, outcome, timestamp])
+
+        slowest = sorted(self.installs, key=lambda install: install[2], reverse=True)[:5]
+        total = sum(install[2] for install in self.installs)
+        log_message(self.project_id, "CONTAINER BUILD",
+                    f"📦 {len(self.installs)} package install(s) took {total:.0f} seconds; slowest: "
+                    f"{', '.join(f'{package} ({seconds:.0f}s)' for package, _, seconds, _ in slowest)}.")
+
+
+def run_monitored_build(project_id, build_command, log_path, image_name):
+    """Runs a repo2docker build, appending its output to `log_path` while parsing it live.
+
+    Raises BuildAborted as soon as a line matches a fatal pattern, or CalledProcessError if the build fails.
+    """
+    monitor = BuildMonitor(project_id, image_name)
+    outcome = "failed"
+    with open(log_path, "a", encoding="utf-8") as log_file:
+        process = subprocess.Popen(build_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, errors="replace", bufsize=1)
+        try:
+            for line in process.stdout:
+                log_file.write(line)
+                fatal = monitor.feed(line)
+                if fatal:
+                    outcome = "aborted"
+                    log_message(project_id, "CONTAINER BUILD", f"🛑 Aborting build on fatal error: {fatal}")
+                    log_file.write(f"\n[osf-to-binder] Build aborted on fatal error: {fatal}\n")
+                    process.terminate()
+                    try:
+                        process.wait(timeout=TERMINATE_TIMEOUT)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+                        process.wait()
+                    raise BuildAborted(process.returncode, build_command, fatal)
+            process.wait()
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, build_command)
+            outcome = "built"
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            monitor.record(outcome)
+
+
+def report_install_timings(top=20):
+    """Prints the packages with the highest total and median install time across all recorded builds."""
+    if not os.path.exists(INSTALL_TIMINGS_FILE):
+        print(f"ℹ️ No install timings recorded yet in {INSTALL_TIMINGS_FILE}.")
+        return
+
+    seconds = {}
+    with open(INSTALL_TIMINGS_FILE, "r", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            if row["Status"] == "installed":
+                seconds.setdefault((row["Package"], row["Kind"]), []).append(float(row["Seconds"]))
+
+    print(f"{'Package':<30} {'Kind':<7} {'Builds':>6} {'Median (s)':>10} {'Total (s)':>10}")
+    ranked = sorted(seconds.items(), key=lambda item: sum(item[1]), reverse=True)[:top]
+    for (package, kind), values in ranked:
+        median = sorted(values)[len(values) // 2]
+        print(f"{package:<30} {kind:<7} {len(values):>6} {median:>10.1f} {sum(values):>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report R package install times parsed from repo2docker builds")
+    parser.add_argument("--top", type=int, default=20, help="Number of packages to list")
+    args = parser.parse_args()
+    report_install_timings(args.top)
@@ -1,55 +1,50 @@
 import os
-import requests
-from git import Repo
-from osfclient.api import OSF
-from utils import log_message
-from utils import LOGS_DIR
-import time
-import shutil
+from utils import log_message, get_osf_client
+from package_resolver import load_package_index, resolve_closure, write_install_plan
+from retry_policy import with_retries
+from publish_queue import enqueue_publish
     
 DOCKERHUB_USERNAME = "meet261"
 
-def create_github_repo(repo_name, org="code-inspect-binder"):
-    """Creates a GitHub repository under the specified organization."""
-    token = os.getenv("GITHUB_ACCESS_TOKEN")
-    if not token:
-        log_message(repo_name, "REPO2DOCKER SETUP", "❌ GitHub access token not found in environment variables.")
-        return False
+def fetch_osf_metadata(project_id):
+    """Fetches OSF project title and description, retrying transient OSF errors."""
+    osf = get_osf_client()
+    try:
+        project = with_retries(project_id, "osf", osf.project, project_id)
+        return project.title, project.description or "No description provided."
+    except Exception as e:
+        log_message(project_id, "REPO2DOCKER SETUP", f"⚠️ OSF API failed: {e}")
+        return f"osf_{project_id}", "This repository was automatically generated for use with repo2docker."
 
-    headers = {"Authorization": f"token {token}"}
-    payload = {"name": repo_name, "private": False, "auto_init": True}
-    url = f"https://api.github.com/orgs/{org}/repos"
-    response = requests.post(url, json=payload, headers=headers)
-
-    if response.status_code == 201:
-        log_message(repo_name, "REPO2DOCKER SETUP", f"✅ GitHub repository '{repo_name}' created successfully.")
-        return True
-    elif response.status_code == 422:
-        log_message(repo_name, "REPO2DOCKER SETUP", f"ℹ️ GitHub repository '{repo_name}' already exists.")
-        return True
-    else:
-        log_message(repo_name, "REPO2DOCKER SETUP", f"❌ Failed to create GitHub repository: {response.json()}")
-        return False
-    
-def fetch_osf_metadata(project_id, retries=5, delay=5):
-    """Fetches OSF project title and description with retry logic."""
-    osf = OSF()
-    for attempt in range(retries):
-        try:
-            project = osf.project(project_id)
-            title = project.title
-            description = project.description or "No description provided."
-            return title, description
-        except Exception as e:
-            if attempt < retries - 1:
-                time.sleep(delay * (2 ** attempt))  # exponential backoff
-            else:
-                log_message(project_id, "REPO2DOCKER SETUP", f"⚠️ OSF API failed after {retries} attempts: {e}")
-                return f"osf_{project_id}", "This repository was automatically generated for use with repo2docker."
-
-
-def create_repo2docker_files(project_dir, project_id, add_github_repo=False, flowr_enabled=False):
-    """Creates necessary repo2docker files in the project directory."""
+
+def resolve_dependencies(project_dir, project_id, dependencies):
+    """Resolves the dependencies against the cached package indexes and writes an install plan.
+
+    Returns the dependencies without the names that could not be resolved, or the unchanged list if no
+    package index is available.
+    """
+    package_index = load_package_index()
+    if package_index is None:
+        log_message(project_id, "REPO2DOCKER SETUP", "⚠️ No cached package index found. Skipping package resolution (run package_resolver.py --update-index).")
+        return dependencies
+
+    resolution = resolve_closure(dependencies, package_index)
+    if resolution["unresolved"]:
+        log_message(project_id, "REPO2DOCKER SETUP", f"⚠️ Unresolvable package(s) removed from DESCRIPTION: {', '.join(resolution['unresolved'])}")
+
+    closure_size = sum(len(wave) for wave in resolution["waves"])
+    write_install_plan(project_dir, project_id, resolution)
+    log_message(project_id, "REPO2DOCKER SETUP", f"✅ Install plan written: {closure_size} package(s) in {len(resolution['waves'])} wave(s).")
+
+    return [dep for dep in dependencies if dep not in resolution["unresolved"]]
+
+
+def create_repo2docker_files(project_dir, project_id, add_github_repo=False, flowr_enabled=False, resolve_packages=False):
+    """Creates necessary repo2docker files in the project directory.
+
+    With `resolve_packages=True`, dependencies are resolved offline before writing DESCRIPTION; unresolvable
+    names are dropped and an install.R with the ordered install plan is added.
+    """
     repo_suffix = "-f" if flowr_enabled else ""
     repo_name = f"osf_{project_id}{repo_suffix}"
     dependencies_file = os.path.join(project_dir, "dependencies.txt")
@@ -73,6 +68,9 @@ def create_repo2docker_files(project_dir, project_id, add_github_repo=False, flo
             elif is_r_libraries_section and line:
                 dependencies.append(line)
 
+    if resolve_packages:
+        dependencies = resolve_dependencies(project_dir, project_id, dependencies)
+
     description_path = os.path.join(project_dir, "DESCRIPTION")
     with open(description_path, "w", encoding="utf-8") as desc:
         desc.write("Package: repo2dockerProject\n")
@@ -184,30 +182,6 @@ def create_repo2docker_files(project_dir, project_id, add_github_repo=False, flo
         os.chmod(postbuild_path, 0o775)
 
     if add_github_repo:
-        if not create_github_repo(repo_name, org="code-inspect-binder"):
-            return False
-
-        github_repo_url = f"https://github.com/code-inspect-binder/{repo_name}.git"
-        log_message(project_id, "REPO2DOCKER SETUP", f"Initializing Git repository for {project_dir}...")
-        
-        try:
-            git_dir = os.path.join(project_dir, ".git")
-            if os.path.exists(git_dir):
-                shutil.rmtree(git_dir)
-
-            repo = Repo.init(project_dir)
-            repo.create_remote("origin", github_repo_url)
-
-            repo.git.add(all=True)
-            repo.index.commit("Initial commit for repo2docker project")
-            repo.git.checkout("-B", "main")
-            repo.remotes.origin.push(refspec="main:main", force=True)
-            log_message(project_id, "REPO2DOCKER SETUP", f"✅ Repo2docker files created and pushed to {github_repo_url}.")
-            return True
-        
-        except Exception as e:
-            log_message(project_id, "REPO2DOCKER SETUP", f"❌ Error pushing to GitHub: {e}")
-            return False
+        enqueue_publish(project_id, project_dir, repo_name)
 
     return True
-
@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import socket
+import argparse
+import threading
+import socketserver
+
+SOCKET_PATH = os.path.join("cache", "osf-to-binder.sock")  # local Unix socket the daemon listens on
+
+
+class SubmissionHandler(socketserver.StreamRequestHandler):
+    """Handles one submission: a JSON line with run.py arguments, answered with streamed JSON progress lines."""
+
+    def handle(self):
+        try:
+            self.handle_submission()
+        except Exception as e:
+            # Without this the handler thread dies silently and the client sees a clean end of the stream
+            print(f"❌ Submission failed: {e!r}")
+            self.send({"type": "error", "message": f"Submission failed: {e!r}"})
+
+    def handle_submission(self):
+        import run
+        from utils import add_log_listener, remove_log_listener, log_message
+        from tracing import tracing_session
+        from retry_policy import load_retry_config
+        from build_monitor import load_build_monitor_config
+
+        request = json.loads(self.rfile.readline())
+        argv = request["argv"]
+        client_cwd = request.get("cwd", os.getcwd())
+
+        try:
+            args = run.build_parser().parse_args(argv)
+        except SystemExit:
+            self.send({"type": "error", "message": f"Invalid arguments: {' '.join(argv)}"})
+            return
+
+        input_path = os.path.join(client_cwd, args.input)
+        project_ids, plan = run.schedule_projects(run.read_project_ids(input_path if os.path.isfile(input_path) else args.input), args)
+        if plan:
+            self.send({"type": "log", "message": plan})
+            self.send({"type": "done"})
+            return
+
+        def forward(project_id, log_entry):
+            if project_id in project_ids:
+                self.send({"type": "log", "message": log_entry})
+
+        if args.retry_config:
+            load_retry_config(os.path.join(client_cwd, args.retry_config))
+        if args.build_monitor_config:
+            load_build_monitor_config(os.path.join(client_cwd, args.build_monitor_config))
+
+        # Projects are processed one at a time; later submissions wait for the lock
+        with self.server.lock, tracing_session(trace=args.trace, profile=args.profile):
+            add_log_listener(forward)
+            try:
+                prefetch, prefetch_window = run.start_prefetch(project_ids, args)
+                for project_id in project_ids:
+                    if prefetch_window:
+                        prefetch_window.begin()
+                    try:
+                        success = run.run_project(project_id, args)
+                    except Exception as e:
+                        log_message(project_id, "ERROR", f"❌ Error occurred: {e!r}")
+                        success = False
+                    self.send({"type": "project", "project_id": project_id, "success": success})
+                if prefetch:
+                    prefetch.join()
+                run.drain_publish_queue()
+            finally:
+                remove_log_listener(forward)
+
+        self.send({"type": "done"})
+
+    def send(self, message):
+        try:
+            self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+            self.wfile.flush()
+        except OSError:
+            pass  # the client went away; keep processing
+
+
+class PipelineDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        super().__init__(socket_path, SubmissionHandler)
+        self.lock = threading.Lock()
+
+
+def serve(socket_path=SOCKET_PATH, flowr_server=True):
+    """Runs the daemon: imports the pipeline once, keeps Docker, OSF and flowR warm and serves submissions."""
+    import run  # noqa: F401 -- imports pandas, GitPython and osfclient once for all submissions
+    from deploy_container import check_docker_daemon, reap_orphaned_containers
+    from flowr_dependency_query import start_flowr_server, stop_flowr_server
+
+    if not check_docker_daemon("daemon"):
+        sys.exit(1)
+    reap_orphaned_containers()
+    if flowr_server:
+        start_flowr_server()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+
+    server = PipelineDaemon(socket_path)
+    print(f"🛰️ Pipeline daemon listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+        if flowr_server:
+            stop_flowr_server()
+
+
+def submit(argv, socket_path=SOCKET_PATH):
+    """Submits run.py arguments to the daemon and prints its progress. Returns the process exit code."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError as e:
+            print(f"❌ Cannot reach the pipeline daemon at {socket_path}: {e}")
+            return 1
+
+        sock.sendall((json.dumps({"argv": argv, "cwd": os.getcwd()}) + "\n").encode("utf-8"))
+
+        failed = 0
+        done = False
+        for line in sock.makefile("r", encoding="utf-8"):
+            message = json.loads(line)
+            if message["type"] == "log":
+                print(message["message"])
+            elif message["type"] == "project":
+                failed += not message["success"]
+            elif message["type"] == "error":
+                print(f"❌ {message['message']}")
+                return 1
+            elif message["type"] == "done":
+                done = True
+                break
+    if not done:
+        print("❌ The pipeline daemon closed the connection before the submission finished.")
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-running pipeline daemon with warm clients")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Path of the daemon's Unix socket")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Start the daemon")
+    serve_parser.add_argument("--no-flowr-server", action="store_true", help="Start a flowR container per file instead of a warm server")
+    submit_parser = subparsers.add_parser("submit", help="Submit project IDs with run.py options to the daemon")
+    submit_parser.add_argument("run_args", nargs=argparse.REMAINDER, help="Arguments as accepted by run.py")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.socket, flowr_server=not args.no_flowr_server)
+    else:
+        sys.exit(submit(args.run_args, args.socket))
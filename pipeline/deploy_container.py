@@ -1,11 +1,32 @@
 import os
-import subprocess
+import csv
 import sys
+import time
+import shutil
+import hashlib
 import argparse
-from git import Repo, GitCommandError
-from utils import log_message, LOGS_DIR, get_project_path
+import subprocess
+from utils import log_message, LOGS_DIR, CACHE_DIR, RESULTS_DIR, get_project_path, is_process_alive, get_process_start_time
+from package_check import read_description_imports
+from retry_policy import with_retries
+from build_monitor import BuildAborted, run_monitored_build
+from storage_manager import touch
+from docker_api import DockerAPIError, docker_available, delete_container, exec_capture, image_exists, tag_image
 
 DOCKERHUB_USERNAME = "meet261"
+OWNER_LABEL = "osf-to-binder.owner-pid"  # label recording which pipeline process started a container
+OWNER_START_LABEL = "osf-to-binder.owner-start"  # start time of that process, which tells it apart from a reused PID
+KEEP_ALIVE_LABEL = "osf-to-binder.keep-alive"  # set on containers kept running on purpose with --keep-alive
+MAX_RUNNING_CONTAINERS = 4  # default cap on concurrently running project containers
+IDLE_COMMAND = "tail -f /dev/null"
+DOCKER_CHECK_TTL = 60  # seconds a successful `docker info` check stays valid
+ENVIRONMENT_FILES = ("DESCRIPTION", "install.R", "runtime.txt", "postBuild", ".Rprofile")  # files repo2docker builds the environment from
+ENVIRONMENTS_DIR = os.path.join(CACHE_DIR, "environments")  # build contexts of shared environment images
+BUILD_CONTEXTS_DIR = os.path.join(CACHE_DIR, "build_contexts")  # slim per-project build contexts
+PROJECT_IMAGES_FILE = os.path.join(RESULTS_DIR, "project_images.csv")  # which shared image each project ran on
+GENERATED_RUNTIME_DIR = os.path.join(CACHE_DIR, "generated_runtime")  # runtime.txt contents written by run_container
+
+_docker_checked_at = 0.0
 
 def check_project_exists(project_id):
     """Checks if the project directory exists and returns the path if it does."""
@@ -22,9 +43,122 @@ def get_image_and_container_name(project_id, flowr_enabled=False):
     container_name = f"repo2docker-{project_id}{suffix}"
     return image_name, container_name
 
-def build_docker_image(project_id, project_path, flowr_enabled=False):
-    """Builds a Docker image for the project using repo2docker."""
+def get_generated_runtime_path(project_path):
+    """Returns the path recording the runtime.txt that `run_container` wrote into a project directory."""
+    return os.path.join(GENERATED_RUNTIME_DIR, f"{os.path.basename(os.path.normpath(project_path))}.txt")
+
+
+def record_generated_runtime(project_path):
+    """Remembers the runtime.txt just written by the pipeline, so it is not mistaken for a project file."""
+    runtime_path = os.path.join(project_path, "runtime.txt")
+    if not os.path.exists(runtime_path):
+        return
+    os.makedirs(GENERATED_RUNTIME_DIR, exist_ok=True)
+    shutil.copyfile(runtime_path, get_generated_runtime_path(project_path))
+
+
+def is_generated_runtime(project_path):
+    """Checks whether the project's runtime.txt is the one the pipeline wrote after an earlier run."""
+    runtime_path = os.path.join(project_path, "runtime.txt")
+    generated_path = get_generated_runtime_path(project_path)
+    if not os.path.exists(runtime_path) or not os.path.exists(generated_path):
+        return False
+    with open(runtime_path, "rb") as f, open(generated_path, "rb") as g:
+        return f.read() == g.read()
+
+
+def get_environment_files(project_path):
+    """Returns the environment files present in a project directory.
+
+    A runtime.txt written by an earlier run of the pipeline is left out, so reruns build the same environment
+    as the first run.
+    """
+    return [
+        file_name for file_name in ENVIRONMENT_FILES
+        if os.path.exists(os.path.join(project_path, file_name))
+        and not (file_name == "runtime.txt" and is_generated_runtime(project_path))
+    ]
+
+
+def get_environment_fingerprint(project_path):
+    """Computes a fingerprint of the environment a project needs.
+
+    DESCRIPTION contributes only its sorted Imports, since its other fields are project specific.
+    """
+    digest = hashlib.sha256()
+    digest.update(",".join(sorted(set(read_description_imports(project_path)))).encode("utf-8"))
+    for file_name in get_environment_files(project_path):
+        if file_name == "DESCRIPTION":
+            continue
+        digest.update(f"\0{file_name}\0".encode("utf-8"))
+        with open(os.path.join(project_path, file_name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def prepare_environment_context(project_path, context_path):
+    """Copies only the environment files of a project into a separate build context.
+
+    The image layers then depend on DESCRIPTION, install.R, runtime.txt, postBuild and .Rprofile only; the project
+    data stays out of the build context and is mounted at run time instead.
+    """
+    if os.path.exists(context_path):
+        shutil.rmtree(context_path)
+    os.makedirs(context_path)
+    for file_name in get_environment_files(project_path):
+        shutil.copy2(os.path.join(project_path, file_name), os.path.join(context_path, file_name))
+    return context_path
+
+
+def record_project_image(project_id, image_name, fingerprint):
+    """Records which shared environment image a project runs on."""
+    write_header = not os.path.exists(PROJECT_IMAGES_FILE)
+    with open(PROJECT_IMAGES_FILE, "a", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        if write_header:
+            writer.writerow(["Project ID", "Shared Image", "Environment Fingerprint"])
+        writer.writerow([project_id, image_name, fingerprint])
+
+
+def build_shared_image(project_id, project_path, flowr_enabled=False):
+    """Builds the project's environment once per fingerprint and tags the shared image with the project's image name.
+
+    The project source is not part of the shared image; `run_container` mounts it at run time.
+    """
     image_name, _ = get_image_and_container_name(project_id, flowr_enabled)
+    fingerprint = get_environment_fingerprint(project_path)
+    shared_image = f"repo2docker-env-{fingerprint[:12]}"
+
+    if image_exists(shared_image):
+        log_message(project_id, "CONTAINER BUILD", f"♻️ Reusing shared image '{shared_image}' for fingerprint {fingerprint[:12]}.")
+    else:
+        context_path = prepare_environment_context(project_path, os.path.join(ENVIRONMENTS_DIR, fingerprint))
+        log_message(project_id, "CONTAINER BUILD", f"📦 Building shared image '{shared_image}' for fingerprint {fingerprint[:12]}...")
+        if not build_docker_image(project_id, context_path, flowr_enabled, image_name=shared_image):
+            return None
+
+    try:
+        tag_image(shared_image, image_name)
+    except (subprocess.CalledProcessError, DockerAPIError) as e:
+        log_message(project_id, "CONTAINER BUILD", f"❌ Failed to tag shared image: {e}")
+        return None
+
+    touch("image", shared_image)  # the shared tag ages with the projects using it, not from its first build
+    record_project_image(project_id, shared_image, fingerprint)
+    return image_name
+
+
+def read_log_tail(path, size=16 * 1024):
+    """Returns the last `size` bytes of a log file, where build errors are reported."""
+    with open(path, "rb") as f:
+        f.seek(max(0, os.path.getsize(path) - size))
+        return f.read().decode("utf-8", errors="replace")
+
+
+def build_docker_image(project_id, project_path, flowr_enabled=False, image_name=None):
+    """Builds a Docker image for the project using repo2docker."""
+    if image_name is None:
+        image_name, _ = get_image_and_container_name(project_id, flowr_enabled)
 
     build_command = [
         "repo2docker",
@@ -37,11 +171,22 @@ def build_docker_image(project_id, project_path, flowr_enabled=False):
 
     log_message(project_id, "CONTAINER BUILD", "⚙️ Building Docker container...")
 
+    repo2docker_log_file = os.path.join(LOGS_DIR, f"{project_id}_repo2docker.log")
+    open(repo2docker_log_file, "w").close()
+
+    def get_error_text(error):
+        # An aborted build failed on a fatal error, whatever transient noise precedes it in the log
+        return "" if isinstance(error, BuildAborted) else read_log_tail(repo2docker_log_file)
+
     try:
-        repo2docker_log_file = os.path.join(LOGS_DIR, f"{project_id}_repo2docker.log")
-        subprocess.run(build_command, check=True, stdout=open(repo2docker_log_file, "w"), stderr=subprocess.STDOUT)
+        # Every attempt is appended to the same log, so failed attempts stay inspectable
+        with_retries(project_id, "build", run_monitored_build, project_id, build_command, repo2docker_log_file, image_name,
+                     error_text=get_error_text)
         log_message(project_id, "CONTAINER BUILD", "✅ Container built successfully.")
         return image_name
+    except BuildAborted as e:
+        log_message(project_id, "CONTAINER BUILD", f"❌ Failed to build container: {e}")
+        return None
     except subprocess.CalledProcessError as e:
         log_message(project_id, "CONTAINER BUILD", f"❌ Failed to build container: {e.returncode}")
         log_message(project_id, "CONTAINER BUILD", f"{' '.join(e.cmd)}")
@@ -49,13 +194,16 @@ def build_docker_image(project_id, project_path, flowr_enabled=False):
 
 
 def check_docker_daemon(project_id):
-    """Checks if the Docker daemon is running before proceeding."""
-    try:
-        subprocess.run(["docker", "info"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    """Checks if the Docker daemon is running before proceeding. A successful check is reused for DOCKER_CHECK_TTL seconds."""
+    global _docker_checked_at
+    if time.time() - _docker_checked_at < DOCKER_CHECK_TTL:
         return True
-    except subprocess.CalledProcessError:
-        log_message(project_id, "DOCKER CHECK", "❌ Docker daemon is not running. Please start Docker.")
-        return False
+
+    if docker_available():
+        _docker_checked_at = time.time()
+        return True
+    log_message(project_id, "DOCKER CHECK", "❌ Docker daemon is not running. Please start Docker.")
+    return False
 
 def push_image_to_dockerhub(project_id, flowr_enabled=False, push=True):
     """Pushes the image to Docker Hub if push=True."""
@@ -73,18 +221,24 @@ def push_image_to_dockerhub(project_id, flowr_enabled=False, push=True):
     log_message(project_id, "DOCKER PUSH", f"🔁 Attempting to push image to Docker Hub: {remote_image}")
 
     try:
-        subprocess.run(["docker", "tag", local_image, remote_image], check=True)
+        tag_image(local_image, remote_image)
         log_message(project_id, "DOCKER PUSH", f"✅ Tagged image as {remote_image}")
-        subprocess.run(["docker", "push", remote_image], check=True)
+        with_retries(project_id, "push", subprocess.run, ["docker", "push", remote_image], check=True,
+                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         log_message(project_id, "DOCKER PUSH", f"🚀 Pushed image to Docker Hub: {remote_image}")
         return True
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, DockerAPIError) as e:
         log_message(project_id, "DOCKER PUSH", f"❌ Failed to push image: {e}")
         return False
 
 
-def build_image(project_id, push=True, dockerhub_username=None, flowr_enabled=False):
-    """Builds the docker image using repo2docker."""
+def build_image(project_id, push=True, dockerhub_username=None, flowr_enabled=False, share_images=False, slim_build=False):
+    """Builds the docker image using repo2docker.
+
+    With `share_images=True`, projects with the same environment fingerprint share one image without their source.
+    With `slim_build=True`, the project image is built from its environment files only. In both modes the image
+    does not contain the project source and is not pushed; the source is mounted at run time.
+    """
     log_message(project_id, "CONTAINER BUILD", f"=== Building repository for project: {project_id} ===")
 
     try:
@@ -94,6 +248,15 @@ def build_image(project_id, push=True, dockerhub_username=None, flowr_enabled=Fa
 
         log_message(project_id, "CONTAINER BUILD", f"📦 Building repository...")
 
+        if share_images:
+            return build_shared_image(project_id, project_path, flowr_enabled) is not None
+
+        if slim_build:
+            image_name, _ = get_image_and_container_name(project_id, flowr_enabled)
+            context_path = prepare_environment_context(project_path, os.path.join(BUILD_CONTEXTS_DIR, image_name))
+            log_message(project_id, "CONTAINER BUILD", f"📦 Building from slim context {context_path} without project data.")
+            return build_docker_image(project_id, context_path, flowr_enabled) is not None
+
         image_name = build_docker_image(project_id, project_path, flowr_enabled)
         if image_name:
             if push and dockerhub_username:
@@ -105,8 +268,112 @@ def build_image(project_id, push=True, dockerhub_username=None, flowr_enabled=Fa
         return False
 
 
-def run_container(project_id, flowr_enabled=False):
-    """Runs the container for the project and logs R version and date to runtime.txt."""
+def list_pipeline_containers():
+    """Lists the pipeline's containers as dicts with name, owner PID and start time (None if unlabelled), keep-alive
+    flag, state and command."""
+    labels = "\t".join(f'{{{{.Label "{label}"}}}}' for label in (OWNER_LABEL, OWNER_START_LABEL, KEEP_ALIVE_LABEL))
+    command = [
+        "docker", "ps", "-a", "--no-trunc",
+        "--filter", "name=repo2docker-",
+        "--format", f'{{{{.Names}}}}\t{labels}\t{{{{.State}}}}\t{{{{.CreatedAt}}}}\t{{{{.Command}}}}'
+    ]
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return []
+
+    containers = []
+    for line in result.stdout.splitlines():
+        fields = line.split("\t")
+        if len(fields) < 7:
+            continue
+        name, owner, owner_start, keep_alive, state, created_at, container_command = fields[:7]
+        containers.append({
+            "name": name,
+            "owner_pid": int(owner) if owner.isdigit() else None,
+            "owner_start": int(owner_start) if owner_start.isdigit() else None,
+            "keep_alive": keep_alive == "1",
+            "state": state,
+            "created_at": created_at,
+            "command": container_command.strip('"'),
+        })
+    return containers
+
+
+def remove_container(project_id, container_name):
+    """Stops and removes a container. Returns True if it existed."""
+    removed = delete_container(container_name)
+    if removed:
+        log_message(project_id, "CONTAINER CLEANUP", f"🗑️ Stopped and removed container '{container_name}'.")
+    return removed
+
+
+def stop_project_container(project_id, flowr_enabled=False):
+    """Stops and removes the container of a project once its scripts have been executed."""
+    _, container_name = get_image_and_container_name(project_id, flowr_enabled)
+    return remove_container(project_id, container_name)
+
+
+def is_owner_alive(container):
+    """Checks whether the pipeline process that started a labelled container is still running.
+
+    A live process with the owner's PID but a different start time reused the PID after the owner exited.
+    """
+    if not is_process_alive(container["owner_pid"]):
+        return False
+    start_time = get_process_start_time(container["owner_pid"])
+    return container["owner_start"] is None or start_time is None or start_time == container["owner_start"]
+
+
+def reap_orphaned_containers():
+    """Removes idle containers left behind by pipeline runs that are no longer alive.
+
+    Containers kept running with --keep-alive are left alone. Containers without an owner label are from runs before
+    labelling existed and are reaped if they only run the idle command. Returns the number of containers removed.
+    """
+    reaped = 0
+    for container in list_pipeline_containers():
+        if container["keep_alive"]:
+            continue
+        if container["owner_pid"] is not None:
+            orphaned = not is_owner_alive(container)
+        else:
+            # Images with an entrypoint report it before the command, e.g. "/usr/local/bin/repo2docker-entrypoint tail -f /dev/null"
+            orphaned = container["command"] == IDLE_COMMAND or container["command"].endswith(f" {IDLE_COMMAND}")
+        if orphaned:
+            project_id = container["name"][len("repo2docker-"):]
+            if remove_container(project_id, container["name"]):
+                reaped += 1
+
+    if reaped:
+        print(f"🧹 Removed {reaped} orphaned container(s) from earlier runs.")
+    return reaped
+
+
+def enforce_container_cap(project_id, max_running):
+    """Removes this process's oldest running containers until a new one fits under `max_running`."""
+    if not max_running:
+        return
+
+    own_start = get_process_start_time(os.getpid())
+    running = [
+        c for c in list_pipeline_containers()
+        if c["state"] == "running" and c["owner_pid"] == os.getpid() and c["owner_start"] in (None, own_start)
+    ]
+    running.sort(key=lambda c: c["created_at"])
+    while len(running) >= max_running:
+        oldest = running.pop(0)
+        log_message(project_id, "CONTAINER RUN", f"ℹ️ {max_running} containers already running. Removing the oldest, '{oldest['name']}'.")
+        remove_container(oldest["name"][len("repo2docker-"):], oldest["name"])
+
+
+def run_container(project_id, flowr_enabled=False, max_running=MAX_RUNNING_CONTAINERS, workdir=None, keep_alive=False):
+    """Runs the container for the project and logs R version and date to runtime.txt.
+
+    At most `max_running` containers started by this process run at once; the oldest are removed first.
+    `workdir` overrides the image working directory, e.g. `/data` for images that do not contain the source.
+    With `keep_alive=True`, the container is labelled so later runs do not reap it as an orphan.
+    """
     log_message(project_id, "CONTAINER RUN", f"=== Running container for project: {project_id} ===")
 
     project_path = check_project_exists(project_id)
@@ -115,21 +382,27 @@ def run_container(project_id, flowr_enabled=False):
 
     image_name, container_name = get_image_and_container_name(project_id, flowr_enabled)
 
-    try:
-        subprocess.run(["docker", "rm", "-f", container_name], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if delete_container(container_name):
         log_message(project_id, "CONTAINER RUN", f"🗑️ Removed existing container '{container_name}'.")
-    except subprocess.CalledProcessError:
+    else:
         log_message(project_id, "CONTAINER RUN", f"ℹ️ No existing container '{container_name}' found to remove.")
 
-    container_command = ["tail", "-f", "/dev/null"]
+    enforce_container_cap(project_id, max_running)
+
+    container_command = IDLE_COMMAND.split()
+
+    owner_start = get_process_start_time(os.getpid())
+    labels = [f"{OWNER_LABEL}={os.getpid()}"]
+    labels += [f"{OWNER_START_LABEL}={owner_start}"] if owner_start is not None else []
+    labels += [f"{KEEP_ALIVE_LABEL}=1"] if keep_alive else []
 
     run_command = [
         "docker", "run", "-d",
         "--name", container_name,
+    ] + [arg for label in labels for arg in ("--label", label)] + [
         "--user", "root",
         "-v", f"{os.path.abspath(project_path)}:/data",
-        image_name
-    ] + container_command
+    ] + (["-w", workdir] if workdir else []) + [image_name] + container_command
 
     try:
         subprocess.run(run_command, check=True)
@@ -145,46 +418,27 @@ def run_container(project_id, flowr_enabled=False):
         "cat(paste0('r-', rver, '-', today), file='/data/runtime.txt')"
     )
 
-    try:
-        subprocess.run(["docker", "exec", container_name, "Rscript", "-e", container_r_command], check=True)
+    returncode, _, stderr = exec_capture(container_name, ["Rscript", "-e", container_r_command])
+    if returncode == 0:
         log_message(project_id, "CONTAINER RUN", "✅ runtime.txt written successfully inside the container.")
-    except subprocess.CalledProcessError as e:
-        log_message(project_id, "CONTAINER RUN", f"❌ Failed to write runtime.txt: {e}")
+        record_generated_runtime(project_path)
+    else:
+        log_message(project_id, "CONTAINER RUN", f"❌ Failed to write runtime.txt (exit code {returncode}): {stderr.strip()}")
 
-# Commit runtime.txt to GitHub
+    # runtime.txt is published with the repository by the publish queue, so a slow push never blocks execution
     runtime_path = os.path.join(project_path, "runtime.txt")
     if os.path.exists(runtime_path):
         with open(runtime_path) as f:
             content = f.read().strip()
         log_message(project_id, "CONTAINER RUN", f"📄 runtime.txt content:\n{content}")
-
-        try:
-            repo = Repo(project_path)
-
-            # Create remote if missing
-            if "origin" not in [remote.name for remote in repo.remotes]:
-                github_repo_url = f"https://github.com/code-inspect-binder/osf_{project_id}.git"
-                repo.create_remote("origin", github_repo_url)
-
-            repo.git.add("runtime.txt")
-
-            if repo.is_dirty():
-                repo.index.commit("Add runtime.txt generated by container")
-                repo.git.push("--set-upstream", "origin", "main")
-                log_message(project_id, "CONTAINER RUN", "✅ runtime.txt committed and pushed to GitHub.")
-            else:
-                log_message(project_id, "CONTAINER RUN", "ℹ️ No changes to commit for runtime.txt.")
-        except GitCommandError as e:
-            log_message(project_id, "CONTAINER RUN", f"❌ Git error: {e}")
-        except Exception as e:
-            log_message(project_id, "CONTAINER RUN", f"❌ Failed to push runtime.txt to GitHub: {e}")
     else:
         log_message(project_id, "CONTAINER RUN", "⚠️ runtime.txt not found after container execution.")
 
     return True
 
 
-def build_and_run(project_id, no_run=False, push=True, dockerhub_username=None, flowr_enabled=False):
+def build_and_run(project_id, no_run=False, push=True, dockerhub_username=None, flowr_enabled=False,
+                  max_running=MAX_RUNNING_CONTAINERS, share_images=False, slim_build=False, keep_alive=False):
     """Processes a project."""
     log_message(project_id, "CONTAINER BUILD", f"=== 🚀 Processing Project: '{project_id}' ===")
 
@@ -192,7 +446,8 @@ def build_and_run(project_id, no_run=False, push=True, dockerhub_username=None,
         return False
 
     try:
-        if not build_image(project_id, push=push, dockerhub_username=dockerhub_username, flowr_enabled=flowr_enabled):
+        if not build_image(project_id, push=push, dockerhub_username=dockerhub_username, flowr_enabled=flowr_enabled,
+                           share_images=share_images, slim_build=slim_build):
             log_message(project_id, "CONTAINER BUILD", f"⚠️ Failed to build repository.")
             return False
 
@@ -201,7 +456,9 @@ def build_and_run(project_id, no_run=False, push=True, dockerhub_username=None,
         if no_run:
             return True
 
-        if not run_container(project_id, flowr_enabled):
+        # Shared and slim images do not contain the project source, so scripts run on the mounted copy
+        workdir = "/data" if share_images or slim_build else None
+        if not run_container(project_id, flowr_enabled, max_running=max_running, workdir=workdir, keep_alive=keep_alive):
             log_message(project_id, "CONTAINER RUN", f"⚠️ Failed to run container.")
             return False
 
@@ -216,6 +473,7 @@ if __name__ == "__main__":
     parser.add_argument("project_id", nargs="+", help="Single project ID or file containing multiple IDs")
     parser.add_argument("--no-run", action="store_true", help="Only build the image without running the container")
     parser.add_argument("--flowr", action="store_true", help="Enable flowR configuration")
+    parser.add_argument("--slim-build", action="store_true", help="Build from the environment files only and mount the source at run time")
 
     args = parser.parse_args()
 
@@ -226,4 +484,4 @@ if __name__ == "__main__":
         project_ids = args.project_id
 
     for project_id in project_ids:
-        build_and_run(project_id, no_run=args.no_run, push=True, flowr_enabled=args.flowr)
+        build_and_run(project_id, no_run=args.no_run, push=True, flowr_enabled=args.flowr, slim_build=args.slim_build)
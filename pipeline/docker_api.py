@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import queue
+import socket
+import struct
+import subprocess
+import http.client
+from urllib.parse import quote, urlencode
+from tracing import span
+
+# The Engine API socket; point DOCKER_SOCKET at a fake server to test without Docker
+DOCKER_SOCKET = os.getenv("DOCKER_SOCKET", os.getenv("DOCKER_HOST", "unix:///var/run/docker.sock").replace("unix://", "", 1))
+DOCKER_BACKEND = os.getenv("DOCKER_BACKEND", "auto")  # "api", "cli" or "auto" (the API if its socket answers, else the CLI)
+API_VERSION = "v1.41"
+API_TIMEOUT = 60  # seconds to wait for a non-streaming API response
+POOL_SIZE = 8  # idle keep-alive connections kept for reuse
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_api_usable = None  # result of the first API ping, None until checked
+
+
+class DockerAPIError(Exception):
+    """Raised for Engine API responses with an error status."""
+
+    def __init__(self, status, message):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket."""
+
+    def __init__(self, socket_path, timeout=API_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = self.raw_sock = sock  # raw_sock outlives close(), which only detaches a streamed response
+
+
+def get_connection():
+    """Takes an idle connection from the pool or opens a new one."""
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return UnixHTTPConnection(DOCKER_SOCKET)
+
+
+def return_connection(connection, response):
+    """Returns a connection to the pool if the server keeps it open, otherwise closes it."""
+    if response.will_close:
+        connection.close()
+        return
+    try:
+        _pool.put_nowait(connection)
+    except queue.Full:
+        connection.close()
+
+
+def send_request(method, path, params=None, body=None):
+    """Sends an API request and returns (connection, response) with the body still unread."""
+    url = f"/{API_VERSION}{path}" + (f"?{urlencode(params)}" if params else "")
+    headers = {"Host": "docker"}
+    payload = None
+    if body is not None:
+        payload = json.dumps(body).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+
+    connection = get_connection()
+    try:
+        connection.request(method, url, body=payload, headers=headers)
+        return connection, connection.getresponse()
+    except (OSError, http.client.HTTPException):
+        connection.close()
+        # A pooled connection may have been closed by the daemon meanwhile; retry once on a fresh one
+        connection = UnixHTTPConnection(DOCKER_SOCKET)
+        connection.request(method, url, body=payload, headers=headers)
+        return connection, connection.getresponse()
+
+
+def api_request(method, path, params=None, body=None, allowed=()):
+    """Sends an API request and returns the decoded JSON body (or None if empty).
+
+    Raises DockerAPIError for error statuses, except those in `allowed`, for which None is returned.
+    """
+    connection, response = send_request(method, path, params, body)
+    data = response.read()
+    return_connection(connection, response)
+    if response.status in allowed:
+        return None
+    if response.status >= 400:
+        try:
+            message = json.loads(data).get("message", "")
+        except ValueError:
+            message = data.decode("utf-8", errors="replace")
+        raise DockerAPIError(response.status, message)
+    return json.loads(data) if data else None
+
+
+def use_api():
+    """Checks whether the Engine API is used, pinging its socket once per process in "auto" mode."""
+    global _api_usable
+    if DOCKER_BACKEND == "cli":
+        return False
+    if _api_usable is None:
+        try:
+            connection, response = send_request("GET", "/_ping")
+            response.read()
+            return_connection(connection, response)
+            _api_usable = response.status == 200
+        except (OSError, http.client.HTTPException):
+            _api_usable = False
+        if not _api_usable and DOCKER_BACKEND == "api":
+            raise RuntimeError(f"The Docker Engine API at {DOCKER_SOCKET} is not reachable.")
+    return _api_usable
+
+
+def quote_name(name):
+    return quote(name, safe="")
+
+
+def docker_available():
+    """Checks whether the Docker daemon responds."""
+    if use_api():
+        try:
+            api_request("GET", "/_ping")
+            return True
+        except (OSError, http.client.HTTPException, DockerAPIError):
+            return False
+    result = subprocess.run(["docker", "info"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+
+def is_container_running(container_name):
+    """Checks whether a container exists and is running."""
+    if use_api():
+        info = api_request("GET", f"/containers/{quote_name(container_name)}/json", allowed=(404,))
+        return bool(info and info["State"]["Running"])
+    result = subprocess.run(["docker", "inspect", "-f", "{{.State.Running}}", container_name],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    return result.returncode == 0 and "true" in result.stdout
+
+
+def image_exists(image_name):
+    """Checks whether an image exists locally."""
+    if use_api():
+        return api_request("GET", f"/images/{quote_name(image_name)}/json", allowed=(404,)) is not None
+    result = subprocess.run(["docker", "image", "inspect", image_name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+
+def tag_image(source, target):
+    """Tags an image. Raises DockerAPIError or CalledProcessError on failure."""
+    if use_api():
+        repo, _, tag = target.rpartition(":") if ":" in target.rsplit("/", 1)[-1] else (target, "", "latest")
+        api_request("POST", f"/images/{quote_name(source)}/tag", params={"repo": repo, "tag": tag})
+        return
+    subprocess.run(["docker", "tag", source, target], check=True, stdout=subprocess.DEVNULL)
+
+
+def delete_container(container_name):
+    """Stops and removes a container. Returns True if it existed."""
+    if use_api():
+        connection, response = send_request("DELETE", f"/containers/{quote_name(container_name)}", params={"force": "1"})
+        response.read()
+        return_connection(connection, response)
+        return response.status == 204
+    result = subprocess.run(["docker", "rm", "-f", container_name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+
+def start_exec(container_name, command):
+    """Creates and starts an exec instance attached to stdout and stderr. Returns (exec ID, connection, response).
+
+    The exec stream takes over the connection, so the caller closes it instead of returning it to the pool.
+    """
+    exec_id = api_request("POST", f"/containers/{quote_name(container_name)}/exec",
+                          body={"Cmd": command, "AttachStdout": True, "AttachStderr": True})["Id"]
+    connection, response = send_request("POST", f"/exec/{exec_id}/start", body={"Detach": False, "Tty": False})
+    if response.status >= 400:
+        message = response.read().decode("utf-8", errors="replace")
+        connection.close()
+        raise DockerAPIError(response.status, message)
+    return exec_id, connection, response
+
+
+def get_exec_exit_code(exec_id):
+    exit_code = api_request("GET", f"/exec/{exec_id}/json")["ExitCode"]
+    return exit_code if exit_code is not None else 1
+
+
+def read_exec_frames(connection, response, stdout_file, stderr_file, deadline=None):
+    """Copies the multiplexed stdout/stderr frames of an exec stream to files. Returns False on timeout."""
+    while True:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            connection.raw_sock.settimeout(remaining)
+        try:
+            header = response.read(8)
+            if len(header) < 8:
+                return True
+            stream, size = struct.unpack(">BxxxL", header)
+            target = stderr_file if stream == 2 else stdout_file
+            while size:
+                chunk = response.read(min(size, 64 * 1024))
+                if not chunk:
+                    return True
+                target.write(chunk)
+                size -= len(chunk)
+        except socket.timeout:
+            return False
+
+
+def exec_streamed(container_name, command, stdout_path, stderr_path, timeout=None):
+    """Runs a command in a container with its stdout and stderr streamed straight to files. Returns the exit code.
+
+    The output never passes through the orchestrator's memory, however much the command prints.
+    """
+    if not use_api():
+        return run_cli_streamed(["docker", "exec", container_name] + command, stdout_path, stderr_path, timeout)
+
+    deadline = time.monotonic() + timeout if timeout else None
+    with span(" ".join(command[:2]), category="docker-api", container=container_name), \
+            open(stdout_path, "wb") as stdout_file, open(stderr_path, "wb") as stderr_file:
+        try:
+            exec_id, connection, response = start_exec(container_name, command)
+        except DockerAPIError as e:
+            stderr_file.write(f"{e}\n".encode("utf-8"))
+            return 1
+        try:
+            finished = read_exec_frames(connection, response, stdout_file, stderr_file, deadline)
+        finally:
+            connection.close()
+        if not finished:
+            stderr_file.write(f"\nExecution timed out after {timeout} seconds\n".encode("utf-8"))
+            return 1
+    return get_exec_exit_code(exec_id)
+
+
+def exec_capture(container_name, command):
+    """Runs a short command in a container. Returns (exit code, stdout, stderr) as text."""
+    if not use_api():
+        result = subprocess.run(["docker", "exec", container_name] + command,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        return result.returncode, result.stdout, result.stderr
+
+    with span(" ".join(command[:2]), category="docker-api", container=container_name):
+        try:
+            exec_id, connection, response = start_exec(container_name, command)
+        except DockerAPIError as e:
+            return 1, "", str(e)
+        stdout, stderr = CaptureBuffer(), CaptureBuffer()
+        try:
+            read_exec_frames(connection, response, stdout, stderr)
+        finally:
+            connection.close()
+        return get_exec_exit_code(exec_id), stdout.text(), stderr.text()
+
+
+class CaptureBuffer:
+    """In-memory stand-in for a file opened in binary mode."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+
+    def text(self):
+        return b"".join(self.chunks).decode("utf-8", errors="replace")
+
+
+def run_cli_streamed(command, stdout_path, stderr_path, timeout=None):
+    """Runs a CLI command with its stdout and stderr streamed straight to files. Returns the exit code."""
+    with open(stdout_path, "wb") as stdout_file, open(stderr_path, "wb") as stderr_file:
+        process = subprocess.Popen(command, stdout=stdout_file, stderr=stderr_file)
+        try:
+            return process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            stderr_file.write(f"\nExecution timed out after {timeout} seconds\n".encode("utf-8"))
+            return 1
@@ -2,6 +2,8 @@ import os
 import re
 import pandas as pd
 from utils import LOGS_DIR, RESULTS_DIR, log_message
+from log_store import log_exists, read_section
+from results_store import load_results_frame
 
 
 RESULTS_FILE = os.path.join(RESULTS_DIR, "execution_results.csv")  # CSV file at the base level
@@ -90,33 +92,49 @@ error_patterns = {
     r"labels appear to be misencoded": "Encoding/String Handling Error",
 }
 
+# Statuses of scripts that were skipped before execution, with their (reason, error message) labels
+skipped_status_labels = {
+    "Skipped (missing deps)": ("Container Issue", "Missing Package"),
+}
+
+# Scripts skipped by the pre-screen carry their predicted error label in the status
+predicted_status_pattern = re.compile(r"^Skipped \(predicted: (.+)\)$")
+
 def analyze_project_log(project_id):
     exec_log = os.path.join(LOGS_DIR, f"{project_id}_execution.log")
-    if not os.path.exists(exec_log):
+    if not log_exists(exec_log):
         print(f"⚠️ Log file not found for project {project_id}")
         return
 
     try:
-        df = pd.read_csv(RESULTS_FILE)
+        df = load_results_frame()
     except pd.errors.EmptyDataError:
         print(f"⚠️ Results file exists but has no data. Skipping error analysis for project {project_id}")
         return
 
     df_project = df[df["Project ID"] == project_id]
 
-    with open(exec_log, "r", encoding="utf-8") as f:
-        log_content = f.read()
-
     for i, row in df_project.iterrows():
         file = row["R/Rmd Script"]
         status = row["Execution Status"]
+        if status in skipped_status_labels:
+            df.loc[i, "Reason"], df.loc[i, "Error Message"] = skipped_status_labels[status]
+            continue
+
+        predicted = predicted_status_pattern.match(status)
+        if predicted:
+            df.loc[i, "Reason"] = "Code Issue"
+            df.loc[i, "Error Message"] = predicted.group(1)
+            continue
+
         if status.lower() != "failed":
             df.loc[i, "Reason"] = "-"
             df.loc[i, "Error Message"] = "-"
             continue
 
-        pattern = re.compile(rf"File: .*{re.escape(file)}.*?\n(.*?)Execution halted", re.DOTALL)
-        match = pattern.search(log_content)
+        # Only the script's own section is decompressed, even if the log was rotated into compressed segments
+        section = read_section(exec_log, file)
+        match = re.search(r"(.*?)Execution halted", section, re.DOTALL) if section else None
 
         if not match:
             df.loc[i, "Reason"] = "Code Issue"
@@ -1,63 +1,95 @@
 import os
-import subprocess
 import sys
 import csv
 import shutil
 import time
+import argparse
 import pandas as pd
-from utils import METADATA_DIR, LOGS_DIR, RESULTS_DIR, log_message, get_src_path
+from contextlib import nullcontext
+from utils import LOGS_DIR, RESULTS_DIR, log_message, get_src_path
 from osf_zip_file_download import unzip_project
+from r_worker import start_r_worker, run_in_r_worker, stop_r_worker
+from resource_profiler import profile_container
+from execution_cache import get_image_digest, get_execution_cache_key, load_cached_execution, store_execution, invalidate_execution_cache
+from project_catalog import get_catalog
+from results_store import load_results_frame
+from docker_api import exec_capture, exec_streamed, is_container_running
 
 RESULTS_FILE = os.path.join(RESULTS_DIR, "execution_results.csv")  # CSV file at the base level
+TIMINGS_FILE = os.path.join(RESULTS_DIR, "execution_timings.csv")  # per-script wall times of the cold and warm paths
+SKIPPED_MISSING_DEPS = "Skipped (missing deps)"
+SKIPPED_PREDICTED = "Skipped (predicted: {label})"
 TIMEOUT = None  # the time to wait for the container to run the script. `int` for timout in seconds. None means no timeout.
+OUTPUT_CAP_BYTES = 64 * 1024  # bytes kept from the head and from the tail of each script output for the execution log
+RESULTS_COLUMNS = ["Project ID", "R/Rmd Script", "Execution Status"]
+RESOURCE_COLUMNS = ["Wall Time (s)", "CPU Time (s)", "Peak RSS (MB)", "Bytes Written"]
 
 
-def log_execution_to_csv(project_id, file_path, status):
-    """Logs execution results to a global CSV file."""
+def write_results_header():
+    """Creates the results CSV with its header."""
+    with open(RESULTS_FILE, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(RESULTS_COLUMNS + RESOURCE_COLUMNS)
+
+
+def format_resource_usage(usage):
+    """Maps the resource usage of a run to the resource columns of the results CSV."""
+    if not usage:
+        return {}
+    values = {
+        "Wall Time (s)": usage.get("wall_seconds"),
+        "CPU Time (s)": usage.get("cpu_seconds"),
+        "Peak RSS (MB)": usage["peak_rss_bytes"] / (1024 * 1024) if usage.get("peak_rss_bytes") is not None else None,
+        "Bytes Written": usage.get("bytes_written"),
+    }
+    return {column: (f"{value:.2f}" if isinstance(value, float) else value) for column, value in values.items() if value is not None}
+
+
+def log_execution_to_csv(project_id, file_path, status, usage=None):
+    """Logs execution results and the resource usage of the run (if measured) to a global CSV file."""
     file_name = os.path.basename(file_path)  # Extracts only the file name
 
     # Ensure header exists and prevent duplicates
     if not os.path.exists(RESULTS_FILE):
-        with open(RESULTS_FILE, "w", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["Project ID", "R/Rmd Script", "Execution Status"])
+        write_results_header()
     else:
         try:
-            df = pd.read_csv(RESULTS_FILE)
+            df = load_results_frame()
             if ((df["Project ID"] == project_id) & (df["R/Rmd Script"] == file_name)).any():
                 return  # Already logged
+            if not set(RESOURCE_COLUMNS).issubset(df.columns):
+                # Results written before resource profiling: add the resource columns
+                for column in RESOURCE_COLUMNS:
+                    df[column] = None
+                df.to_csv(RESULTS_FILE, index=False)
         except pd.errors.EmptyDataError:
             # File exists but is empty, so write headers
-            with open(RESULTS_FILE, "w", newline="") as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(["Project ID", "R/Rmd Script", "Execution Status"])
+            write_results_header()
 
-    # Append the result
+    with open(RESULTS_FILE, "r", newline="") as csvfile:
+        header = next(csv.reader(csvfile))
+
+    # Append the result, aligned with the header since error analysis may have added columns
     with open(RESULTS_FILE, "a", newline="") as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow([project_id, file_name, status])
+        writer = csv.DictWriter(csvfile, fieldnames=header, restval="", extrasaction="ignore")
+        writer.writerow({"Project ID": project_id, "R/Rmd Script": file_name, "Execution Status": status,
+                         **format_resource_usage(usage)})
 
     log_message(project_id, "R EXECUTION", f"✅ Logged execution result for {file_name} in {RESULTS_FILE}")
 
 def list_files(container_name, directory, extensions):
-    """Lists files with specific extensions in a given directory of the container."""
-    files = []
-    for ext in extensions:
-        command = [
-            "docker", "exec", container_name,
-            "find", directory, "-name", f"*{ext}"
-        ]
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode != 0:
-            log_message(container_name, "R EXECUTION", f"Error listing {ext} files in {directory}: {result.stderr}")
-        else:
-            files.extend(result.stdout.strip().split("\n"))
-
-    return [file for file in files if file]
+    """Lists files with specific extensions in a given directory of the container, grouped in the order of `extensions`."""
+    # One find for all extensions instead of one exec per extension
+    name_tests = [arg for i, ext in enumerate(extensions) for arg in ([] if i == 0 else ["-o"]) + ["-name", f"*{ext}"]]
+    returncode, stdout, stderr = exec_capture(container_name, ["find", directory, "("] + name_tests + [")"])
+    if returncode != 0:
+        log_message(container_name, "R EXECUTION", f"Error listing {', '.join(extensions)} files in {directory}: {stderr}")
+    files = [file for file in stdout.strip().split("\n") if file]
+    return sorted(files, key=lambda file: next(i for i, ext in enumerate(extensions) if file.endswith(ext)))
 
 
 def restore_project_src(project_id):
-    """Restores the project source directory from zip file."""
+    """Restores the project source directory from zip file, with the changes of any delta sync replayed."""
     src_path = get_src_path(project_id)
 
     log_message(project_id, "R EXECUTION", f"♻️ Restoring {src_path} from zip file...")
@@ -76,7 +108,95 @@ def restore_project_src(project_id):
     log_message(project_id, "R EXECUTION", f"✅ Restore completed.")
 
 
-def execute_r_file(container_name, r_file, log_file, project_id):
+def get_script_log_paths(project_id, script_file):
+    """Returns the paths of the per-script stdout and stderr log files."""
+    script_log_dir = os.path.join(LOGS_DIR, f"{project_id}_scripts")
+    os.makedirs(script_log_dir, exist_ok=True)
+    log_name = script_file.strip("/").replace("/", "__")
+    return (
+        os.path.join(script_log_dir, f"{log_name}.stdout.log"),
+        os.path.join(script_log_dir, f"{log_name}.stderr.log"),
+    )
+
+
+def read_capped_output(path, cap=OUTPUT_CAP_BYTES):
+    """Reads the head and tail of an output file, keeping at most `2 * cap` bytes in memory."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if size <= 2 * cap:
+            return f.read().decode("utf-8", errors="replace")
+        head = f.read(cap)
+        f.seek(size - cap)
+        tail = f.read(cap)
+
+    omitted = size - 2 * cap
+    return (
+        head.decode("utf-8", errors="replace")
+        + f"\n... [{omitted} bytes omitted, full output in {path}] ...\n"
+        + tail.decode("utf-8", errors="replace")
+    )
+
+
+def log_execution_timing(project_id, file_path, mode, seconds):
+    """Logs the wall time of one script run to the timings CSV."""
+    write_header = not os.path.exists(TIMINGS_FILE)
+    with open(TIMINGS_FILE, "a", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        if write_header:
+            writer.writerow(["Project ID", "R/Rmd Script", "Mode", "Seconds"])
+        writer.writerow([project_id, os.path.basename(file_path), mode, f"{seconds:.2f}"])
+
+
+def run_script(project_id, script_file, command, stdout_path, stderr_path, worker=None, worker_request=None, timeout=None,
+               container_name=None):
+    """Runs a script with the warm worker if one is given, otherwise with a cold exec of `command` in the container.
+
+    Falls back to the cold command if the worker has died. The container's cgroup is sampled during the run.
+    Returns a tuple of (exit code, resource usage dict or None).
+    """
+    start = time.time()
+    mode = "cold"
+    with (profile_container(container_name) if container_name else nullcontext()) as usage:
+        if worker is not None:
+            try:
+                returncode = run_in_r_worker(worker, project_id, *worker_request, stdout_path, stderr_path, timeout=timeout)
+                mode = "warm"
+            except RuntimeError as e:
+                log_message(project_id, "R EXECUTION", f"⚠️ {e}. Falling back to cold execution.")
+                worker = None
+
+        if worker is None:
+            returncode = exec_streamed(container_name, command, stdout_path, stderr_path, timeout=timeout)
+
+    seconds = time.time() - start
+    log_execution_timing(project_id, script_file, mode, seconds)
+    log_message(project_id, "R EXECUTION", f"⏱️ Script finished in {seconds:.2f} seconds ({mode}).")
+    return returncode, usage
+
+
+def run_cached_script(project_id, script_file, command, stdout_path, stderr_path, worker=None, worker_request=None,
+                      timeout=None, image_digest=None, container_name=None):
+    """Runs a script unless an outcome for the same image, script and inputs is cached.
+
+    Caching is disabled when `image_digest` is None. Returns a tuple of (exit code, whether the script ran,
+    resource usage of the run that produced the outcome).
+    """
+    cache_key = get_execution_cache_key(project_id, script_file, image_digest) if image_digest else None
+    if cache_key:
+        cached = load_cached_execution(project_id, cache_key, stdout_path, stderr_path)
+        if cached is not None:
+            log_message(project_id, "R EXECUTION", f"♻️ Reusing cached result for {script_file}.")
+            returncode, usage = cached
+            return returncode, False, usage
+
+    returncode, usage = run_script(project_id, script_file, command, stdout_path, stderr_path, worker, worker_request,
+                                   timeout=timeout, container_name=container_name)
+    if cache_key:
+        store_execution(project_id, cache_key, returncode, stdout_path, stderr_path, usage=usage)
+    return returncode, True, usage
+
+
+def execute_r_file(container_name, r_file, log_file, project_id, worker=None, image_digest=None):
     """Executes an R file inside the container, backs up, and restores project source."""
 
     # Get the correct working directory from the file path
@@ -84,39 +204,31 @@ def execute_r_file(container_name, r_file, log_file, project_id):
 
     log_message(project_id, "R EXECUTION", f"Executing {r_file} in container {container_name}...")
 
-    command = [
-        "docker", "exec", container_name,
-        "bash", "-c", f'cd "{r_script_dir}" && Rscript "{os.path.basename(r_file)}"'
-    ]
+    command = ["bash", "-c", f'cd "{r_script_dir}" && Rscript "{os.path.basename(r_file)}"']
     
-    try:
-        result = subprocess.run(
-            command, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, 
-            text=True, 
-            timeout=TIMEOUT
-        )
-    except subprocess.TimeoutExpired:
-        result = subprocess.CompletedProcess(args=command, returncode=1, stdout="", stderr=f"Execution timed out after {TIMEOUT} seconds")
+    stdout_path, stderr_path = get_script_log_paths(project_id, r_file)
+    worker_request = ("R", os.path.basename(r_file), r_script_dir or ".", "")
+    returncode, ran, usage = run_cached_script(project_id, r_file, command, stdout_path, stderr_path, worker, worker_request,
+                                               timeout=TIMEOUT, image_digest=image_digest, container_name=container_name)
 
     # Log execution results
     log_message(project_id, "R EXECUTION", f"File: {r_file}", execution_log=True)
     
-    if result.returncode == 0:
-        log_message(project_id, "R EXECUTION", f"Execution Successful:\n{result.stdout}", execution_log=True)
+    if returncode == 0:
+        log_message(project_id, "R EXECUTION", f"Execution Successful:\n{read_capped_output(stdout_path)}", execution_log=True)
         execution_status = "Successful"
     else:
-        log_message(project_id, "R EXECUTION", f"Execution Failed:\n{result.stderr}", execution_log=True)
+        log_message(project_id, "R EXECUTION", f"Execution Failed:\n{read_capped_output(stderr_path)}", execution_log=True)
         execution_status = "Failed"
     
     log_message(project_id, "R EXECUTION", "=" * 40, execution_log=True)
 
-    restore_project_src(project_id)
+    if ran:
+        restore_project_src(project_id)
 
-    log_execution_to_csv(project_id, r_file, execution_status)
+    log_execution_to_csv(project_id, r_file, execution_status, usage)
 
-def render_rmd_file(container_name, rmd_file, log_file, project_id):
+def render_rmd_file(container_name, rmd_file, log_file, project_id, worker=None, image_digest=None):
     """Renders an Rmd file inside the container, manages backup and restores output files."""
 
     log_message(project_id, "R EXECUTION", f"Rendering {rmd_file} in container {container_name}...")
@@ -124,38 +236,50 @@ def render_rmd_file(container_name, rmd_file, log_file, project_id):
     render_command = (
         f"R -e \"rmarkdown::render('{rmd_file}', output_dir='/data/{project_id}_src')\""
     )
-    command = ["docker", "exec", container_name, "bash", "-c", render_command]
-    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    command = ["bash", "-c", render_command]
+    stdout_path, stderr_path = get_script_log_paths(project_id, rmd_file)
+    worker_request = ("Rmd", rmd_file, ".", f"/data/{project_id}_src")
+    returncode, ran, usage = run_cached_script(project_id, rmd_file, command, stdout_path, stderr_path, worker, worker_request,
+                                               image_digest=image_digest, container_name=container_name)
 
     # Log rendering results
     log_message(project_id, "R EXECUTION", f"File: {rmd_file}", execution_log=True)
     
-    if result.returncode == 0:
-        log_message(project_id, "R EXECUTION", f"Rendering Successful:\n{result.stdout}", execution_log=True)
+    if returncode == 0:
+        log_message(project_id, "R EXECUTION", f"Rendering Successful:\n{read_capped_output(stdout_path)}", execution_log=True)
         execution_status = "Successful"
     else:
-        log_message(project_id, "R EXECUTION", f"Rendering Failed:\n{result.stderr}", execution_log=True)
+        log_message(project_id, "R EXECUTION", f"Rendering Failed:\n{read_capped_output(stderr_path)}", execution_log=True)
         execution_status = "Failed"
     
     log_message(project_id, "R EXECUTION", "=" * 40, execution_log=True)
 
-    restore_project_src(project_id)
+    if ran:
+        restore_project_src(project_id)
 
-    log_execution_to_csv(project_id, rmd_file, execution_status)
+    log_execution_to_csv(project_id, rmd_file, execution_status, usage)
     
-def run_all_files_in_container(project_id):
-    """Executes R and Rmd files in a container. Uses project_id_r_code_file.csv if available, falls back to all R/Rmd files if not."""
+def skip_file(project_id, file, status, reason):
+    """Records a script as skipped without executing it."""
+    log_message(project_id, "R EXECUTION", f"⏭️ Skipping {file}: {reason}")
+    log_message(project_id, "R EXECUTION", f"File: {file}", execution_log=True)
+    log_message(project_id, "R EXECUTION", f"{status}: {reason}", execution_log=True)
+    log_message(project_id, "R EXECUTION", "=" * 40, execution_log=True)
+    log_execution_to_csv(project_id, file, status)
+
+def run_all_files_in_container(project_id, warm=False, missing_deps=None, predicted_failures=None, use_cache=True):
+    """Executes R and Rmd files in a container. Uses project_id_r_code_file.csv if available, falls back to all R/Rmd files if not.
+
+    Scripts listed in `missing_deps` or `predicted_failures` (paths relative to the project source directory)
+    are skipped. With `use_cache=True`, scripts whose image, content and inputs are unchanged reuse their cached outcome.
+    """
+    missing_deps = missing_deps or {}
+    predicted_failures = predicted_failures or {}
     container_name = f"repo2docker-{project_id}"
     log_file = os.path.join(LOGS_DIR, f"{project_id}_execution.log")
 
     # Ensure the container is running
-    try:
-        inspect_command = ["docker", "inspect", "-f", "{{.State.Running}}", container_name]
-        result = subprocess.run(inspect_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-        if "true" not in result.stdout:
-            log_message(project_id, "R EXECUTION", f"Container {container_name} is not running.")
-            return
-    except subprocess.CalledProcessError:
+    if not is_container_running(container_name):
         log_message(project_id, "R EXECUTION", f"Container {container_name} is not running.")
         return
 
@@ -169,27 +293,22 @@ def run_all_files_in_container(project_id):
         log_message(project_id, "R EXECUTION", f"No R or Rmd files found in {src_dir} for container {container_name}.")
         return
 
-    # Try to load CSV (optional)
-    csv_path = os.path.join(METADATA_DIR, "project_id_r_code_file.csv")
+    # Match against the code files listed in the project catalog (optional)
     matched_files = []
 
-    if os.path.exists(csv_path):
-        try:
-            df = pd.read_csv(csv_path)
-            project_files = df[df["Project ID"] == project_id]["R Code File"].tolist()
-            matched_files = [
-                file for file in available_files
-                if os.path.basename(file).lower() in [f.lower() for f in project_files]
-            ]
+    try:
+        catalog = get_catalog()
+        if catalog.has_code_files:
+            matched_files = catalog.match_files(project_id, available_files)
             if matched_files:
                 log_message(project_id, "R EXECUTION", f"✅ Found {len(matched_files)} matched R files in CSV. Executing only matched files.")
             else:
                 log_message(project_id, "R EXECUTION", f"No matching R files found in CSV. Falling back to executing all available R/Rmd files.")
-        except Exception as e:
-            log_message(project_id, "R EXECUTION", f"Failed to parse CSV: {e}. Executing all available files.")
-            matched_files = []  # fallback
-    else:
-        log_message(project_id, "R EXECUTION", f"ℹ️ CSV file not found. Executing all available R/Rmd files.")
+        else:
+            log_message(project_id, "R EXECUTION", f"ℹ️ CSV file not found. Executing all available R/Rmd files.")
+    except Exception as e:
+        log_message(project_id, "R EXECUTION", f"Failed to parse CSV: {e}. Executing all available files.")
+        matched_files = []  # fallback
 
     if not matched_files:
         matched_files = available_files
@@ -198,52 +317,115 @@ def run_all_files_in_container(project_id):
 
     execution_start = time.time()
 
-    for file in matched_files:
-        file_start = time.time()
-        file = file[len("/data/"):]  # remove prefix
-        if file.endswith((".R", ".r")):
-            execute_r_file(container_name, file, log_file, project_id)
-        elif file.endswith((".Rmd", ".rmd")):
-            render_rmd_file(container_name, file, log_file, project_id)
-        file_end = time.time()
+    image_digest = get_image_digest(container_name) if use_cache else None
+    worker = start_r_worker(project_id, container_name) if warm else None
+
+    try:
+        for file in matched_files:
+            file_start = time.time()
+            file = file[len("/data/"):]  # remove prefix
+            relative_file = os.path.relpath(file, f"{project_id}_src")
+            if relative_file in missing_deps:
+                skip_file(project_id, file, SKIPPED_MISSING_DEPS, f"missing package(s) {', '.join(missing_deps[relative_file])}")
+            elif relative_file in predicted_failures:
+                label, evidence = predicted_failures[relative_file]
+                skip_file(project_id, file, SKIPPED_PREDICTED.format(label=label), evidence)
+            elif file.endswith((".R", ".r")):
+                execute_r_file(container_name, file, log_file, project_id, worker=worker, image_digest=image_digest)
+            elif file.endswith((".Rmd", ".rmd")):
+                render_rmd_file(container_name, file, log_file, project_id, worker=worker, image_digest=image_digest)
+            file_end = time.time()
+    finally:
+        if worker is not None:
+            stop_r_worker(worker, project_id)
 
     execution_end = time.time()
 
     log_message(project_id, "R EXECUTION", f"⏳ Total execution time for project {project_id}: {execution_end - execution_start:.2f} seconds", execution_log=True)
     log_message(project_id, "R EXECUTION", f"✅ Execution completed for project {project_id}. Logs at {log_file}. Results stored in {RESULTS_FILE}")
 
-def execute_r_scripts(project_id):
-    """Executes R scripts in the container."""
+def execute_r_scripts(project_id, warm=False, missing_deps=None, predicted_failures=None, use_cache=True):
+    """Executes R scripts in the container. With `warm=True`, scripts run in forks of a preloaded R session.
+
+    `missing_deps` maps scripts to the packages they need but the container lacks, and `predicted_failures`
+    maps scripts to a (label, evidence) tuple from the pre-screen; those scripts are skipped. `use_cache` enables the
+    execution result cache.
+    """
     # Creates the CSV file with headers if it doesn't exist.
     if not os.path.isfile(RESULTS_FILE):
-        with open(RESULTS_FILE, "w", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["Project ID", "R/Rmd Script", "Execution Status"])
+        write_results_header()
         log_message(project_id, "R EXECUTION", f"✅ Created new execution results file: {RESULTS_FILE}")
     else:
         log_message(project_id, "R EXECUTION", f"📂 Execution results will be appended to: {RESULTS_FILE}")
 
     log_message(project_id, "R EXECUTION", f"Executing R scripts in the container for project ID: {project_id}")
     try:
-        run_all_files_in_container(project_id)
+        run_all_files_in_container(project_id, warm=warm, missing_deps=missing_deps, predicted_failures=predicted_failures,
+                                   use_cache=use_cache)
         return True
     except Exception as e:
         log_message(project_id, "R EXECUTION", f"❌ Failed to execute R scripts: {e}")
         return False
 
+def compare_execution_modes():
+    """Prints the warm vs cold wall times of scripts that were executed in both modes."""
+    df = pd.read_csv(TIMINGS_FILE)
+    per_mode = df.groupby(["Project ID", "R/Rmd Script", "Mode"])["Seconds"].median().unstack("Mode")
+    if not {"cold", "warm"}.issubset(per_mode.columns):
+        print("ℹ️ No scripts have been executed in both cold and warm mode yet.")
+        return
+
+    both = per_mode.dropna(subset=["cold", "warm"])
+    print(f"Scripts executed in both modes: {len(both)}")
+    print(f"Total cold time: {both['cold'].sum():.2f} seconds")
+    print(f"Total warm time: {both['warm'].sum():.2f} seconds")
+    print(f"Median speedup per script: {(both['cold'] / both['warm']).median():.2f}x")
+
+def report_resource_usage(top=10):
+    """Prints the scripts with the highest wall time, CPU time, peak RSS and bytes written across the corpus."""
+    df = pd.read_csv(RESULTS_FILE)
+    if not set(RESOURCE_COLUMNS).issubset(df.columns):
+        print("ℹ️ No resource usage has been recorded yet.")
+        return
+
+    for column in RESOURCE_COLUMNS:
+        ranked = df.dropna(subset=[column]).nlargest(top, column)
+        print(f"\nTop {len(ranked)} scripts by {column}:")
+        for _, row in ranked.iterrows():
+            print(f"  {row[column]:>14.2f}  {row['Project ID']}  {row['R/Rmd Script']}  ({row['Execution Status']})")
+
+
 if __name__ == "__main__":
     """Main entry point when script is run directly."""
-    if len(sys.argv) < 2:
-        print("Usage: python3 execute_files_in_container.py <PROJECT_ID> [<PROJECT_ID> ...] or provide a file with project IDs.")
+    parser = argparse.ArgumentParser(description="Execute R/Rmd files of projects inside their containers")
+    parser.add_argument("project_id", nargs="*", help="Single project ID or file containing multiple IDs")
+    parser.add_argument("--warm-r", action="store_true", help="Run scripts in forks of a preloaded R session")
+    parser.add_argument("--compare-timings", action="store_true", help="Compare warm and cold execution times and exit")
+    parser.add_argument("--resource-report", type=int, nargs="?", const=10, metavar="N", help="Print the top N resource consumers across the corpus and exit")
+    parser.add_argument("--no-cache", action="store_true", help="Execute every script even if a cached outcome exists")
+    parser.add_argument("--invalidate-cache", action="store_true", help="Drop the cached outcomes of the projects before executing")
+    args = parser.parse_args()
+
+    if args.compare_timings:
+        compare_execution_modes()
+        sys.exit(0)
+
+    if args.resource_report:
+        report_resource_usage(args.resource_report)
+        sys.exit(0)
+
+    if not args.project_id:
+        parser.print_usage()
         sys.exit(1)
-        
+
     # Handle project IDs from a file or directly from input
-    project_ids = []
-    if len(sys.argv) == 2 and os.path.isfile(sys.argv[1]):
-        with open(sys.argv[1], "r") as file:
+    if len(args.project_id) == 1 and os.path.isfile(args.project_id[0]):
+        with open(args.project_id[0], "r") as file:
             project_ids = [line.strip() for line in file if line.strip()]
     else:
-        project_ids = sys.argv[1:]
+        project_ids = args.project_id
     
     for project_id in project_ids:
-        execute_r_scripts(project_id)
+        if args.invalidate_cache:
+            invalidate_execution_cache(project_id)
+        execute_r_scripts(project_id, warm=args.warm_r, use_cache=not args.no_cache)
@@ -0,0 +1,96 @@
+import os
+import json
+import shutil
+import hashlib
+import subprocess
+from utils import CACHE_DIR, log_message, get_project_path, get_script_dependencies_path
+from flowr_dependency_query import read_script_dependencies
+
+EXECUTION_CACHE_DIR = os.path.join(CACHE_DIR, "execution")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_project_cache_dir(project_id):
+    """Returns the directory holding the cached execution outcomes of a project."""
+    return os.path.join(EXECUTION_CACHE_DIR, project_id)
+
+
+def get_image_digest(container_name):
+    """Returns the ID of the image a container runs, or None if it cannot be inspected."""
+    result = subprocess.run(
+        ["docker", "inspect", "-f", "{{.Image}}", container_name],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def hash_file(path):
+    """Computes the SHA-256 of a file by streaming it."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_input_hashes(project_id, script_file):
+    """Hashes the files a script reads or sources according to flowR.
+
+    Inputs are resolved relative to the script's directory; inputs that do not exist are recorded as missing so a
+    file appearing later changes the key.
+    """
+    script_dependencies = read_script_dependencies(get_script_dependencies_path(project_id)) or {}
+    dependencies = script_dependencies.get(os.path.relpath(script_file, f"{project_id}_src"), {})
+    script_dir = os.path.dirname(os.path.join(get_project_path(project_id), script_file))
+
+    hashes = {}
+    for name in sorted(set(dependencies.get("readData", []) + dependencies.get("sourcedFiles", []))):
+        if not name:
+            continue
+        path = os.path.normpath(os.path.join(script_dir, name))
+        hashes[name] = hash_file(path) if os.path.isfile(path) else "missing"
+    return hashes
+
+
+def get_execution_cache_key(project_id, script_file, image_digest):
+    """Computes the cache key of a script run from the image digest, the script content and its input files."""
+    script_path = os.path.join(get_project_path(project_id), script_file)
+    key_data = {
+        "image": image_digest,
+        "script": script_file,
+        "script_hash": hash_file(script_path),
+        "inputs": get_input_hashes(project_id, script_file),
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_cached_execution(project_id, cache_key, stdout_path, stderr_path):
+    """Restores the output logs of a cached run. Returns a tuple of (exit code, resource usage), or None on a cache miss."""
+    cache_dir = get_project_cache_dir(project_id)
+    entry_path = os.path.join(cache_dir, f"{cache_key}.json")
+    if not os.path.exists(entry_path):
+        return None
+
+    with open(entry_path, "r", encoding="utf-8") as f:
+        entry = json.load(f)
+    shutil.copyfile(os.path.join(cache_dir, f"{cache_key}.stdout.log"), stdout_path)
+    shutil.copyfile(os.path.join(cache_dir, f"{cache_key}.stderr.log"), stderr_path)
+    return entry["returncode"], entry.get("usage")
+
+
+def store_execution(project_id, cache_key, returncode, stdout_path, stderr_path, usage=None):
+    """Caches the exit code, output logs and resource usage of a script run."""
+    cache_dir = get_project_cache_dir(project_id)
+    os.makedirs(cache_dir, exist_ok=True)
+    shutil.copyfile(stdout_path, os.path.join(cache_dir, f"{cache_key}.stdout.log"))
+    shutil.copyfile(stderr_path, os.path.join(cache_dir, f"{cache_key}.stderr.log"))
+    with open(os.path.join(cache_dir, f"{cache_key}.json"), "w", encoding="utf-8") as f:
+        json.dump({"returncode": returncode, "usage": usage}, f)
+
+
+def invalidate_execution_cache(project_id):
+    """Drops all cached execution outcomes of a project."""
+    cache_dir = get_project_cache_dir(project_id)
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+        log_message(project_id, "R EXECUTION", "🗑️ Execution cache invalidated.")
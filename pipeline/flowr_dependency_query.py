@@ -1,8 +1,22 @@
 import json
 import re
 import os
+import time
+import socket
+import itertools
 import subprocess
 import argparse
+from utils import REPOS_DIR
+from static_dependencies import FAST_PATH_MODES, extract_static_dependencies, compare_libraries
+
+FLOWR_IMAGE = "eagleoutice/flowr"
+FLOWR_SERVER_CONTAINER = "osf-to-binder-flowr-server"
+FLOWR_SERVER_PORT = 1042
+FLOWR_SERVER_MOUNT = "/repos"  # REPOS_DIR is mounted here in the server container
+FLOWR_SERVER_TIMEOUT = 600  # seconds to wait for the analysis of one file
+
+_flowr_server = None  # (host, port) of a warm flowR server, set by start_flowr_server
+_request_ids = itertools.count(1)
 
 
 def parse_flowr_output(raw_output):
@@ -23,6 +37,10 @@ def parse_flowr_output(raw_output):
         print(f"Error decoding JSON: {e}")
         return None
 
+    return parse_dependency_results(dependencies)
+
+def parse_dependency_results(dependencies):
+    """Extracts the dependency lists from the results of a flowR dependencies query."""
     result = {
         "libraries": [
             lib["libraryName"] for lib in dependencies.get("dependencies", {}).get("libraries", [])
@@ -71,8 +89,118 @@ def run_docker_flowr(query, file_path, project_path):
         print(f"Error running Docker command: {e}")
         return None
     
-def aggregate_dependencies(project_path):
-    """Aggregates dependencies across all R files in the project source directory."""    
+def start_flowr_server():
+    """Starts a long-running flowR server container so files can be analysed without starting a container each."""
+    global _flowr_server
+    subprocess.run(["docker", "rm", "-f", FLOWR_SERVER_CONTAINER], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    subprocess.run([
+        "docker", "run", "-d", "--name", FLOWR_SERVER_CONTAINER,
+        "-p", f"127.0.0.1:{FLOWR_SERVER_PORT}:{FLOWR_SERVER_PORT}",
+        "-v", f"{os.path.abspath(REPOS_DIR)}:{FLOWR_SERVER_MOUNT}:ro",
+        FLOWR_IMAGE, "--server", "--port", str(FLOWR_SERVER_PORT)
+    ], check=True, stdout=subprocess.DEVNULL)
+
+    address = ("127.0.0.1", FLOWR_SERVER_PORT)
+    for _ in range(60):
+        try:
+            with socket.create_connection(address, timeout=5) as sock:
+                if sock.makefile("r", encoding="utf-8").readline():
+                    _flowr_server = address
+                    print(f"flowR server ready on port {FLOWR_SERVER_PORT}.")
+                    return True
+        except OSError:
+            pass
+        time.sleep(1)
+
+    print("Error: flowR server did not become ready.")
+    return False
+
+def stop_flowr_server():
+    """Stops the warm flowR server."""
+    global _flowr_server
+    _flowr_server = None
+    subprocess.run(["docker", "rm", "-f", FLOWR_SERVER_CONTAINER], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def read_flowr_response(stream, request_id):
+    """Reads server messages until the response to the given request. Returns None on errors."""
+    for line in stream:
+        message = json.loads(line)
+        if message.get("type") == "error":
+            print(f"Error from flowR server: {message.get('reason')}")
+            return None
+        if message.get("id") == request_id:
+            return message
+    return None
+
+def query_flowr_server(query, file_path):
+    """Runs a flowR query for a file (absolute host path below REPOS_DIR) on the warm server."""
+    container_file_path = os.path.join(FLOWR_SERVER_MOUNT, os.path.relpath(file_path, os.path.abspath(REPOS_DIR)))
+    file_token = f"file-{next(_request_ids)}"
+    analysis_id, query_id = str(next(_request_ids)), str(next(_request_ids))
+
+    try:
+        with socket.create_connection(_flowr_server, timeout=FLOWR_SERVER_TIMEOUT) as sock:
+            stream = sock.makefile("rw", encoding="utf-8")
+            stream.readline()  # hello message
+            stream.write(json.dumps({"type": "request-file-analysis", "id": analysis_id, "filetoken": file_token,
+                                     "filepath": container_file_path}) + "\n")
+            stream.flush()
+            if read_flowr_response(stream, analysis_id) is None:
+                return None
+            stream.write(json.dumps({"type": "request-query", "id": query_id, "filetoken": file_token,
+                                     "query": [{"type": query}]}) + "\n")
+            stream.flush()
+            response = read_flowr_response(stream, query_id)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error querying flowR server: {e}")
+        return None
+
+    return response.get("results") if response else None
+
+def run_flowr_analysis(file_path, project_path):
+    """Extracts the dependencies of one file with flowR, using the warm flowR server if one is running."""
+    relative_file_path = os.path.relpath(file_path, project_path)
+    abs_file_path = os.path.abspath(file_path)
+    if _flowr_server and abs_file_path.startswith(os.path.abspath(REPOS_DIR) + os.sep):
+        results = query_flowr_server("dependencies", abs_file_path)
+        return parse_dependency_results(results) if results else None
+
+    raw_output = run_docker_flowr("dependencies", relative_file_path, project_path)
+    return parse_flowr_output(raw_output) if raw_output else None
+
+def analyse_file(file_path, project_path, fast_path="on", stats=None):
+    """Extracts the dependencies of one file.
+
+    With `fast_path` "on", files whose libraries are all loaded literally and that touch no files are handled by the
+    static extractor, and only the rest go to flowR. "off" sends every file to flowR; "verify" also sends the
+    fast path files to flowR and records whether both found the same libraries in `stats["comparisons"]`.
+    """
+    relative_file_path = os.path.relpath(file_path, project_path)
+    static_deps = None
+    if fast_path != "off":
+        static_deps, reason = extract_static_dependencies(file_path)
+        if static_deps is None:
+            print(f"{relative_file_path} needs flowR: {reason}")
+
+    if static_deps is not None and fast_path == "on":
+        kind = "static"
+        parsed_deps = static_deps
+    else:
+        kind = "flowr"
+        parsed_deps = run_flowr_analysis(file_path, project_path)
+        if static_deps is not None and parsed_deps is not None and stats is not None:
+            stats.setdefault("comparisons", {})[relative_file_path] = compare_libraries(static_deps, parsed_deps)
+
+    if stats is not None:
+        stats[kind] = stats.get(kind, 0) + 1
+    return parsed_deps
+
+def aggregate_dependencies(project_path, per_file=None, fast_path="on", stats=None):
+    """Aggregates dependencies across all R files in the project source directory.
+
+    If a `per_file` dict is given, it is filled with the parsed dependencies of each file, keyed by its path
+    relative to the project source directory. `fast_path` and `stats` are passed on to `analyse_file`.
+    """    
     if not os.path.exists(project_path):
         print(f"⚠️ Source directory not found at {project_path}. Skipping dependency extraction.")
         return {"libraries": set(), "sourcedFiles": set(), "readData": set(), "writtenData": set()}
@@ -84,14 +212,14 @@ def aggregate_dependencies(project_path):
             if file.endswith((".R", ".r", ".Rmd", ".rmd")):
                 relative_file_path = os.path.relpath(os.path.join(root, file), project_path)
                 print(f"Processing {relative_file_path}...")
-                raw_output = run_docker_flowr("dependencies", relative_file_path, project_path)
-                if raw_output:
-                    parsed_deps = parse_flowr_output(raw_output)
-                    if parsed_deps:
-                        dependencies["libraries"].update(parsed_deps["libraries"])
-                        dependencies["sourcedFiles"].update(parsed_deps["sourcedFiles"])
-                        dependencies["readData"].update(parsed_deps["readData"])
-                        dependencies["writtenData"].update(parsed_deps["writtenData"])
+                parsed_deps = analyse_file(os.path.join(root, file), project_path, fast_path=fast_path, stats=stats)
+                if parsed_deps:
+                    if per_file is not None:
+                        per_file[relative_file_path] = parsed_deps
+                    dependencies["libraries"].update(parsed_deps["libraries"])
+                    dependencies["sourcedFiles"].update(parsed_deps["sourcedFiles"])
+                    dependencies["readData"].update(parsed_deps["readData"])
+                    dependencies["writtenData"].update(parsed_deps["writtenData"])
     return dependencies
 
 def generate_requirements_file(dependencies, output_file):
@@ -121,10 +249,47 @@ def generate_requirements_file(dependencies, output_file):
 
     print(f"Dependencies file created: {output_file}")
 
-def extract_dependencies(input_dir, output_file):
-    """Processes a project to generate a dependencies file."""
-    dependencies = aggregate_dependencies(input_dir)
+def read_dependency_section(dependency_file, section):
+    """Reads the entries of one section (e.g. "# Data read") from a dependencies file."""
+    entries = []
+    if not os.path.exists(dependency_file):
+        return entries
+
+    with open(dependency_file, "r", encoding="utf-8") as f:
+        in_section = False
+        for line in f:
+            line = line.strip()
+            if line.startswith("#"):
+                in_section = line == section
+            elif in_section and line:
+                entries.append(line)
+    return entries
+
+def write_script_dependencies(per_file, output_file):
+    """Writes the per-script dependencies as JSON, keyed by script path relative to the source directory."""
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(per_file, f, indent=2, sort_keys=True)
+
+def read_script_dependencies(input_file):
+    """Reads per-script dependencies written by `write_script_dependencies`. Returns None if there are none."""
+    if not os.path.exists(input_file):
+        return None
+    with open(input_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def extract_dependencies(input_dir, output_file, script_dependencies_file=None, fast_path="on", stats=None):
+    """Processes a project to generate a dependencies file.
+
+    If `script_dependencies_file` is given, the dependencies of each script are also written there as JSON.
+    If a `stats` dict is given, it is filled with the number of files handled by the fast path ("static") and by
+    flowR ("flowr"), and in "verify" mode with the per-file comparisons.
+    """
+    per_file = {} if script_dependencies_file else None
+    dependencies = aggregate_dependencies(input_dir, per_file=per_file, fast_path=fast_path, stats=stats)
     generate_requirements_file(dependencies, output_file)
+    if script_dependencies_file:
+        write_script_dependencies(per_file, script_dependencies_file)
     
 
 # Main execution flow
@@ -132,10 +297,11 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="FlowR Dependency Extractor")
     parser.add_argument("--input-dir", required=True, help="Input directory of the project")
     parser.add_argument("--output-file", required=True, help="Output file to save dependencies")
+    parser.add_argument("--fast-path", choices=FAST_PATH_MODES, default="on", help="Handle literal library loads without flowR")
 
     args = parser.parse_args()
 
     print(f"Processing project: {args.input_dir}")
-    extract_dependencies(args.input_dir, args.output_file)
+    extract_dependencies(args.input_dir, args.output_file, fast_path=args.fast_path)
 
     print("\nProject processed successfully.")
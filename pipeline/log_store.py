@@ -0,0 +1,200 @@
+import os
+import re
+import glob
+import gzip
+import json
+import bisect
+import itertools
+import argparse
+import threading
+
+ROTATE_SIZE = 16 * 1024 * 1024  # an active log larger than this is compressed into a new segment
+BLOCK_SIZE = 256 * 1024  # uncompressed bytes per independently compressed block
+SECTION_PATTERN = re.compile(rb"^\[[^\]]*\] \[[^\]]*\] \[[^\]]*\] File: (.*?)\r?$")  # "File: <script>" lines of execution logs
+SECTION_END = "=" * 40  # separator log_message writes after every script section
+
+_rotate_lock = threading.Lock()
+
+
+def get_segment_paths(log_path):
+    """Lists the compressed segments of a log, oldest first."""
+    base = log_path[:-len(".log")]
+    return sorted(glob.glob(f"{glob.escape(base)}.[0-9][0-9][0-9][0-9].log.gz"))
+
+
+def get_index_path(segment_path):
+    """Returns the path to the block and section index of a segment."""
+    return f"{segment_path}.idx"
+
+
+def load_index(segment_path):
+    """Loads the index of a segment."""
+    with open(get_index_path(segment_path), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def log_exists(log_path):
+    """Checks whether a log has an active file or compressed segments."""
+    return os.path.exists(log_path) or bool(get_segment_paths(log_path))
+
+
+def compress_log(log_path):
+    """Compresses the active log into the next segment and removes it.
+
+    A segment is a series of gzip members of about BLOCK_SIZE uncompressed bytes each, ending on line boundaries, so
+    `zcat` reads it as one file while the index allows decompressing single blocks. The index records the
+    compressed and uncompressed offset of every block and the offset of every script section.
+    """
+    with _rotate_lock:
+        if not os.path.exists(log_path) or os.path.getsize(log_path) == 0:
+            return None
+
+        segments = get_segment_paths(log_path)
+        number = int(segments[-1][-len("0000.log.gz"):-len(".log.gz")]) + 1 if segments else 1
+        segment_path = f"{log_path[:-len('.log')]}.{number:04d}.log.gz"
+
+        blocks = []
+        sections = []
+        offset = 0
+        with open(log_path, "rb") as src, open(f"{segment_path}.tmp", "wb") as dst:
+            while data := src.read(BLOCK_SIZE):
+                if not data.endswith(b"\n"):
+                    data += src.readline()
+                line_offset = offset
+                for line in data.splitlines(keepends=True):
+                    match = SECTION_PATTERN.match(line)
+                    if match:
+                        sections.append([match.group(1).decode("utf-8", errors="replace"), line_offset])
+                    line_offset += len(line)
+                compressed = gzip.compress(data, mtime=0)
+                blocks.append([dst.tell(), len(compressed), offset, len(data)])
+                dst.write(compressed)
+                offset += len(data)
+
+        with open(get_index_path(segment_path), "w", encoding="utf-8") as f:
+            json.dump({"blocks": blocks, "sections": sections}, f)
+        os.replace(f"{segment_path}.tmp", segment_path)
+        os.remove(log_path)
+        return segment_path
+
+
+def rotate_if_needed(log_path, max_size=ROTATE_SIZE, at_boundary=True):
+    """Compresses the active log into a new segment once it exceeds `max_size` bytes.
+
+    Pass `at_boundary=False` while a script section is open, so the section is not split across segments.
+    """
+    if not at_boundary:
+        return
+    try:
+        if os.path.getsize(log_path) > max_size:
+            compress_log(log_path)
+    except FileNotFoundError:
+        pass
+
+
+def iter_segment_lines(segment_path, index, start):
+    """Yields the lines of a segment from an uncompressed offset, decompressing only the blocks from there on."""
+    blocks = index["blocks"]
+    first = max(0, bisect.bisect_right([block[2] for block in blocks], start) - 1)
+    with open(segment_path, "rb") as f:
+        for compressed_offset, compressed_length, block_offset, _ in blocks[first:]:
+            f.seek(compressed_offset)
+            data = gzip.decompress(f.read(compressed_length))
+            if block_offset < start:
+                data = data[start - block_offset:]
+            yield from data.decode("utf-8", errors="replace").splitlines(keepends=True)
+
+
+def read_section_lines(lines, skip_header=True):
+    """Collects the body of a section from the line after its "File:" line up to the separator.
+
+    Returns a tuple of (body, whether the separator was reached).
+    """
+    if skip_header:
+        next(lines, None)
+    body = []
+    for line in lines:
+        if line.rstrip().endswith(SECTION_END):
+            return "".join(body), True
+        body.append(line)
+    return "".join(body), False
+
+
+def iter_lines_after(log_path, segments, position):
+    """Yields the lines of the segments after `segments[position]`, then of the active log."""
+    for segment_path in segments[position + 1:]:
+        with gzip.open(segment_path, "rt", encoding="utf-8", errors="replace") as f:
+            yield from f
+    if os.path.exists(log_path):
+        with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+            yield from f
+
+
+def script_matches(name, script):
+    """Checks whether a section name refers to a script, given as path or as file name."""
+    return name == script or name.endswith(f"/{script}")
+
+
+def iter_sections(log_path, script):
+    """Yields the body of every section of a script in a log, oldest first, across segments and the active log.
+
+    A section split by a rotation (in logs written before rotation waited for section ends) continues in the
+    following segment.
+    """
+    segments = get_segment_paths(log_path)
+    for position, segment_path in enumerate(segments):
+        index = load_index(segment_path)
+        for name, offset in index["sections"]:
+            if script_matches(name, script):
+                body, complete = read_section_lines(iter_segment_lines(segment_path, index, offset))
+                if not complete:
+                    body += read_section_lines(iter_lines_after(log_path, segments, position), skip_header=False)[0]
+                yield body
+
+    if os.path.exists(log_path):
+        with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+            lines = iter(f)
+            for line in lines:
+                match = SECTION_PATTERN.match(line.encode("utf-8"))
+                if match and script_matches(match.group(1).decode("utf-8"), script):
+                    yield read_section_lines(itertools.chain([line], lines))[0]
+
+
+def read_section(log_path, script):
+    """Returns the body of the first section of a script in a log, or None if the script has no section."""
+    return next(iter_sections(log_path, script), None)
+
+
+def iter_log(log_path):
+    """Yields the full content of a log line by line, across segments and the active log."""
+    for segment_path in get_segment_paths(log_path):
+        with gzip.open(segment_path, "rt", encoding="utf-8", errors="replace") as f:
+            yield from f
+    if os.path.exists(log_path):
+        with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+            yield from f
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read and compress rotated pipeline logs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show_parser = subparsers.add_parser("show", help="Print the sections of a script from an execution log")
+    show_parser.add_argument("log", help="Log path, e.g. logs/<project_id>_execution.log")
+    show_parser.add_argument("script", help="Script path or file name")
+    cat_parser = subparsers.add_parser("cat", help="Print a whole log across its segments")
+    cat_parser.add_argument("log", help="Log path")
+    compress_parser = subparsers.add_parser("compress", help="Compress active logs into segments")
+    compress_parser.add_argument("logs", nargs="+", help="Log paths")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        for section in iter_sections(args.log, args.script):
+            print(section, end="")
+            print(SECTION_END)
+    elif args.command == "cat":
+        for line in iter_log(args.log):
+            print(line, end="")
+    else:
+        for log in args.logs:
+            segment = compress_log(log)
+            print(f"🗜️ {log} -> {segment}" if segment else f"ℹ️ {log} is empty or missing.")
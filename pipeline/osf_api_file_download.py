@@ -1,8 +1,18 @@
 import os
+import csv
+import json
 import time
+import shutil
+import hashlib
+import argparse
 import requests
-from utils import log_message
-from osfclient import OSF
+from utils import CACHE_DIR, RESULTS_DIR, log_message, get_osf_client, get_src_path
+from osf_zip_file_download import get_sync_overlay_path, load_sync_removals, save_sync_removals, load_extract_state, save_extract_state
+from retry_policy import with_retries
+
+MANIFESTS_DIR = os.path.join(CACHE_DIR, "manifests")  # remote size, modification time and hash of every synced file
+SYNC_CHANGES_FILE = os.path.join(RESULTS_DIR, "sync_changes.csv")  # every file added, modified or removed by a sync
+HASH_CHUNK_SIZE = 1024 * 1024
 
 def download_file(file, base_path, project_id, sub_path):
     """Downloads a file while preserving its directory structure."""
@@ -27,6 +37,18 @@ def download_folder(folder, base_path, project_id, sub_path=""):
     for subfolder in folder.folders:
         download_folder(subfolder, base_path, project_id, os.path.join(sub_path, folder.name))
 
+def get_project_storage(project_id):
+    """Returns the osfstorage of a project, retrying transient OSF errors. Returns None on failure."""
+    osf = get_osf_client()
+    try:
+        return with_retries(project_id, "osf", lambda: osf.project(project_id).storage('osfstorage'))
+    except requests.exceptions.HTTPError as e:
+        log_message(project_id, "DOWNLOAD", f"❌ HTTP error: {e.response.status_code}")
+        return None
+    except Exception as e:
+        log_message(project_id, "DOWNLOAD", f"❌ Unexpected error: {e}")
+        return None
+
 def download_project(project_id, download_directory):
     """Downloads an OSF project, preserving directory structure."""
     project_path = os.path.join(download_directory, f"{project_id}_repo")
@@ -37,27 +59,8 @@ def download_project(project_id, download_directory):
         log_message(project_id, "DOWNLOAD", f"⏭️ Project '{project_id}' already exists at {src_path}. Skipping download.")
         return project_path
 
-    osf = OSF()
-    retries = 3
-    wait_time = 20
-
-    for attempt in range(retries):
-        try:
-            project = osf.project(project_id)
-            storage = project.storage('osfstorage')
-            break
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 429:
-                log_message(project_id, "DOWNLOAD", f"🚨 Rate limit hit. Retrying in {wait_time} seconds... (Attempt {attempt + 1}/{retries})")
-                time.sleep(wait_time)
-            else:
-                log_message(project_id, "DOWNLOAD", f"❌ HTTP error: {e.response.status_code}")
-                return None
-        except Exception as e:
-            log_message(project_id, "DOWNLOAD", f"❌ Unexpected error: {e}")
-            return None
-    else:
-        log_message(project_id, "DOWNLOAD", f"❌ Failed to download project after {retries} attempts.")
+    storage = get_project_storage(project_id)
+    if storage is None:
         return None
 
     os.makedirs(project_path, exist_ok=True)
@@ -70,3 +73,181 @@ def download_project(project_id, download_directory):
 
     log_message(project_id, "DOWNLOAD", "✅ Project download completed.")
     return project_path
+
+
+def get_manifest_path(project_id):
+    """Returns the path to the sync manifest of a project."""
+    return os.path.join(MANIFESTS_DIR, f"{project_id}.json")
+
+def load_manifest(project_id):
+    """Loads the sync manifest of a project, mapping remote paths to their metadata at the last sync."""
+    manifest_path = get_manifest_path(project_id)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(project_id, manifest):
+    """Stores the sync manifest of a project."""
+    os.makedirs(MANIFESTS_DIR, exist_ok=True)
+    tmp_path = f"{get_manifest_path(project_id)}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, get_manifest_path(project_id))
+
+def get_remote_entry(file):
+    """Returns the manifest entry of a remote file: size, modification time and the strongest hash OSF reports."""
+    hashes = getattr(file, "hashes", None) or {}
+    algorithm = "sha256" if hashes.get("sha256") else "md5" if hashes.get("md5") else None
+    return {
+        "size": file.size,
+        "modified": file.date_modified,
+        "hash_algorithm": algorithm,
+        "hash": hashes.get(algorithm) if algorithm else None,
+    }
+
+def local_file_matches(path, entry):
+    """Checks whether a local file has the size and hash of a remote entry."""
+    if not os.path.isfile(path) or os.path.getsize(path) != entry["size"] or not entry["hash_algorithm"]:
+        return False
+    digest = hashlib.new(entry["hash_algorithm"])
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest() == entry["hash"]
+
+def record_sync_changes(project_id, changes):
+    """Appends the files changed by a sync to the sync changes CSV."""
+    write_header = not os.path.exists(SYNC_CHANGES_FILE)
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    with open(SYNC_CHANGES_FILE, "a", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        if write_header:
+            writer.writerow(["Project ID", "File", "Change", "Timestamp"])
+        for change, paths in changes.items():
+            for path in paths:
+                writer.writerow([project_id, path, change, timestamp])
+
+def write_remote_file(file, path):
+    """Downloads a remote file to a local path, truncating any partial earlier attempt."""
+    with open(path, "wb") as f:
+        file.write_to(f)
+
+def record_overlay_changes(project_id, src_path, changes):
+    """Snapshots the files changed by a sync into the project's sync overlay, which is replayed on every extraction
+    from the older zip. Changed paths are also dropped from the members deferred by lazy extraction."""
+    files_path = os.path.join(get_sync_overlay_path(project_id), "files")
+    removed = set(load_sync_removals(project_id))
+
+    for relative_path in changes["added"] + changes["modified"]:
+        overlay_file = os.path.join(files_path, relative_path)
+        os.makedirs(os.path.dirname(overlay_file), exist_ok=True)
+        shutil.copyfile(os.path.join(src_path, relative_path), overlay_file)
+        removed.discard(relative_path)
+
+    for relative_path in changes["removed"]:
+        overlay_file = os.path.join(files_path, relative_path)
+        if os.path.exists(overlay_file):
+            os.remove(overlay_file)
+        removed.add(relative_path)
+
+    save_sync_removals(project_id, removed)
+
+    state = load_extract_state(project_id)
+    if state and state["deferred"]:
+        changed = {os.path.normpath(path) for paths in changes.values() for path in paths}
+        deferred = [name for name in state["deferred"] if os.path.normpath(name) not in changed]
+        save_extract_state(project_id, complete=state["complete"] or not deferred, deferred=deferred)
+
+def sync_project(project_id):
+    """Brings the extracted source of a project up to date with its OSF storage, fetching only changed files.
+
+    Remote files are compared with the manifest of the last sync by size, modification time and hash. Files without
+    a manifest entry (e.g. extracted from the zip) are adopted without downloading if their size and hash match.
+    Files removed on OSF are deleted locally. The zip stays untouched: changed files are snapshotted into a sync
+    overlay that is replayed whenever the source is extracted from the zip again.
+
+    A project that was never extracted is not synced, since its zip download fetches the current version anyway.
+    Members deferred by lazy extraction are left to it unless they changed since the last sync.
+
+    Returns a dict with the "added", "modified" and "removed" paths (relative to the source directory), or None if
+    the storage listing could not be fetched.
+    """
+    src_path = get_src_path(project_id)
+    changes = {"added": [], "modified": [], "removed": []}
+    if not os.path.isdir(src_path) or not os.listdir(src_path):
+        log_message(project_id, "SYNC", "⏭️ Project not extracted yet. Skipping sync; the zip download fetches the current version.")
+        return changes
+
+    storage = get_project_storage(project_id)
+    if storage is None:
+        return None
+
+    manifest = load_manifest(project_id)
+    new_manifest = {}
+    state = load_extract_state(project_id)
+    deferred = {os.path.normpath(name) for name in state["deferred"]} if state else set()
+    left_deferred = 0
+
+    log_message(project_id, "SYNC", f"🔄 Comparing OSF storage with the local manifest ({len(manifest)} known file(s))...")
+    for file in storage.files:
+        relative_path = file.path.lstrip("/")
+        entry = get_remote_entry(file)
+        local_path = os.path.join(src_path, relative_path)
+        new_manifest[relative_path] = entry
+
+        known = manifest.get(relative_path)
+        if known == entry and os.path.isfile(local_path):
+            continue
+        if os.path.normpath(relative_path) in deferred and not os.path.exists(local_path) and known in (None, entry):
+            # Still in the zip (or the sync overlay) and extracted on demand; compared once it is on disk
+            if known is None:
+                del new_manifest[relative_path]
+            left_deferred += 1
+            continue
+        if known is None and local_file_matches(local_path, entry):
+            continue
+
+        change = "modified" if known is not None or os.path.exists(local_path) else "added"
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with_retries(project_id, "osf", write_remote_file, file, local_path)
+        changes[change].append(relative_path)
+        log_message(project_id, "SYNC", f"📥 Fetched '{relative_path}' ({change}).")
+
+    for relative_path in sorted(set(manifest) - set(new_manifest)):
+        local_path = os.path.join(src_path, relative_path)
+        if os.path.exists(local_path):
+            os.remove(local_path)
+        changes["removed"].append(relative_path)
+        log_message(project_id, "SYNC", f"🗑️ Removed '{relative_path}', which no longer exists on OSF.")
+
+    save_manifest(project_id, new_manifest)
+
+    if any(changes.values()):
+        record_sync_changes(project_id, changes)
+        record_overlay_changes(project_id, src_path, changes)
+
+    log_message(project_id, "SYNC", f"✅ Sync complete: {len(changes['added'])} added, {len(changes['modified'])} modified, {len(changes['removed'])} removed, {left_deferred} left to lazy extraction.")
+    return changes
+
+def has_changes(changes):
+    """Checks whether a sync result contains any change."""
+    return bool(changes) and any(changes.values())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync extracted OSF projects, fetching only new or changed files")
+    parser.add_argument("input", help="OSF project ID or file containing project IDs")
+    parser.add_argument("--changed-output", help="Write the IDs of projects with changes to this file, e.g. as input for run.py")
+    args = parser.parse_args()
+
+    if os.path.isfile(args.input):
+        with open(args.input, "r") as file:
+            project_ids = [line.strip() for line in file if line.strip()]
+    else:
+        project_ids = [args.input]
+
+    changed = [project_id for project_id in project_ids if has_changes(sync_project(project_id))]
+    print(f"🔄 {len(changed)} of {len(project_ids)} project(s) changed.")
+    if args.changed_output:
+        with open(args.changed_output, "w") as f:
+            f.write("".join(f"{project_id}\n" for project_id in changed))
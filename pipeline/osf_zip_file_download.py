@@ -1,85 +1,476 @@
-import pandas as pd
 import requests
 from tqdm import tqdm
-from utils import DOWNLOADS_DIR, METADATA_DIR, log_message, get_zip_file_path, get_project_path, get_src_path
+from utils import CACHE_DIR, DOWNLOADS_DIR, RESULTS_DIR, log_message, get_zip_file_path, get_project_path, get_src_path
+from retry_policy import with_retries
+from project_catalog import get_catalog
+from storage_manager import acquire, release, parse_size
 import os
+import csv
+import json
+import time
+import threading
+import shutil
 import zipfile
+import zlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
+EXTRACT_WORKERS = os.cpu_count() or 4  # number of threads decompressing members in parallel
+EXTRACT_CHUNK_SIZE = 1024 * 1024  # members are streamed to disk in 1MB chunks
+LAZY_SIZE_THRESHOLD = 100 * 1024 * 1024  # in lazy mode, non-script members larger than this are deferred
+SCRIPT_EXTENSIONS = (".r", ".rmd")
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # zips are streamed to disk in 1MB chunks
+LIMITED_CHUNK_SIZE = 64 * 1024  # smaller chunks under a bandwidth cap, so throttling stays smooth
+PREFETCH_STREAMS = 4  # concurrent downloads in bulk prefetch mode
+PREFETCH_WINDOW = 8  # scheduled projects a background prefetch may run ahead of the one being processed
+PREFETCH_REPORT_FILE = os.path.join(RESULTS_DIR, "prefetch_report.csv")
+SYNC_OVERLAYS_DIR = os.path.join(CACHE_DIR, "sync_overlays")  # files changed by delta syncs since the zip was downloaded
 
-def download_project(project_id):
-    log_message(project_id, "DOWNLOAD", f"Downloading project {project_id} from OSF...")
-    url = f"https://files.osf.io/v1/resources/{project_id}/providers/osfstorage/?zip="
+_downloads_lock = threading.Lock()
+_downloads_in_flight = {}  # project ID -> event set when its running download finishes
+
+
+def get_zip_url(project_id):
+    """Returns the OSF URL serving the zip archive of a project's storage."""
+    return f"https://files.osf.io/v1/resources/{project_id}/providers/osfstorage/?zip="
+
+
+def download_project(project_id, progress=None, limiter=None):
+    """Downloads the zip archive of a project. Returns "exists", "downloaded" or "failed".
+
+    `progress` receives the size of every written chunk; without it, a progress bar is shown for the project.
+    `limiter` is a BandwidthLimiter shared by concurrent downloads. If another thread is already downloading the
+    project, waits for that download instead of starting a second one.
+    """
     file_name = f"{DOWNLOADS_DIR}/{project_id}.zip"
 
+    with _downloads_lock:
+        in_flight = _downloads_in_flight.get(project_id)
+        if in_flight is None:
+            _downloads_in_flight[project_id] = threading.Event()
+    if in_flight is not None:
+        log_message(project_id, "DOWNLOAD", f"⏳ Waiting for the running download of project {project_id}...")
+        in_flight.wait()
+        return "downloaded" if os.path.exists(file_name) else "failed"
+
+    try:
+        return fetch_project_zip(project_id, file_name, progress, limiter)
+    finally:
+        with _downloads_lock:
+            _downloads_in_flight.pop(project_id).set()
+
+
+def fetch_project_zip(project_id, file_name, progress=None, limiter=None):
+    log_message(project_id, "DOWNLOAD", f"Downloading project {project_id} from OSF...")
+    url = get_zip_url(project_id)
+    part_file = f"{file_name}.part"  # renamed once complete, so a partial zip is never mistaken for a download
+
     # Skip if file already exists
     if os.path.exists(file_name):
         log_message(project_id, "DOWNLOAD", f"File already exists: {file_name}")
-        return
+        return "exists"
 
-    try:
+    def fetch_zip():
         response = requests.get(url, stream=True)
         response.raise_for_status()
+        chunk_size = LIMITED_CHUNK_SIZE if limiter else DOWNLOAD_CHUNK_SIZE
 
-        # Download with progress bar
-        with open(file_name, "wb") as f:
+        # Download with progress bar, unless the caller tracks progress itself
+        with open(part_file, "wb") as f:
             with tqdm(
                 desc=f"Downloading {project_id}",
                 unit="iB",
                 unit_scale=True,
                 unit_divisor=1024,
                 leave=True,
+                disable=progress is not None,
             ) as pbar:
-                for chunk in response.iter_content(chunk_size=1024*1024):  # 1MB chunks
+                for chunk in response.iter_content(chunk_size=chunk_size):
                     if chunk:  # filter out keep-alive new chunks
                         size = f.write(chunk)
                         pbar.update(size)
+                        if progress:
+                            progress(size)
+                        if limiter:
+                            limiter.consume(size)
+        os.replace(part_file, file_name)
+        clear_sync_overlay(project_id)  # the new zip already contains every earlier synced change
 
+    try:
+        with_retries(project_id, "osf", fetch_zip)
         log_message(project_id, "DOWNLOAD", f"✅ Download completed: {file_name}")
+        return "downloaded"
     except BaseException as e:
         # remove the uncomplete zip file
-        if os.path.exists(file_name):
-            os.remove(file_name)
+        if os.path.exists(part_file):
+            os.remove(part_file)
         if isinstance(e, requests.exceptions.RequestException):
             # continue the program
             log_message(project_id, "DOWNLOAD", f"❌ Download failed: {str(e)}")
+            return "failed"
         else:
             # Re-raise the exception to stop the program
             raise 
 
 
-def download_all_projects():
-    project_ids = (
-        pd.read_csv(f"{METADATA_DIR}/project_id_r_code_file.csv")["Project ID"]
-        .dropna()
-        .unique()
-    )
-    print(f"Downloading {len(project_ids)} projects...")
-    for project_id in tqdm(project_ids):
-        download_project(project_id)
-    print("All downloads completed.")
+class BandwidthLimiter:
+    """Token bucket capping the combined throughput of the downloads sharing it at `rate` bytes per second."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(rate, LIMITED_CHUNK_SIZE)  # at most one second of burst
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, size):
+        """Blocks the calling download until `size` more bytes fit within the rate."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= size
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+class PrefetchWindow:
+    """Keeps a background prefetch within the next `size` scheduled projects.
+
+    The processing loop calls `begin` before each project. Prefetched projects are held under the "prefetch" holder
+    until processed, so the disk budget cannot evict a zip before it is used.
+    """
+
+    def __init__(self, size=PREFETCH_WINDOW):
+        self.size = size
+        self.started = 0  # scheduled projects whose processing has started
+        self.condition = threading.Condition()
+
+    def begin(self):
+        """Marks the next scheduled project as being processed, moving the window forward."""
+        with self.condition:
+            self.started += 1
+            self.condition.notify_all()
+
+    def claim(self, index, project_id):
+        """Waits until the project at `index` of the schedule is within the window, then holds it.
+
+        Returns False without holding it if its processing has already started, so prefetching it is pointless.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: index < self.started + self.size)
+            if index < self.started:
+                return False
+            acquire(project_id, holder="prefetch")
+            return True
+
+
+def is_extracted(project_id):
+    """Checks whether the source of a project is fully extracted, so its zip is not needed."""
+    src_path = get_src_path(project_id)
+    state = load_extract_state(project_id)
+    return os.path.exists(src_path) and bool(os.listdir(src_path)) and (state is None or state["complete"])
+
+
+def record_prefetch(rows):
+    """Appends the outcome, size and duration of every prefetched project to the prefetch report."""
+    write_header = not os.path.exists(PREFETCH_REPORT_FILE)
+    os.makedirs(os.path.dirname(PREFETCH_REPORT_FILE), exist_ok=True)
+    with open(PREFETCH_REPORT_FILE, "a", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        if write_header:
+            writer.writerow(["Project ID", "Outcome", "Bytes", "Seconds", "Timestamp"])
+        writer.writerows(rows)
+
+
+def prefetch_projects(project_ids, streams=PREFETCH_STREAMS, bandwidth=None, show_progress=True, window=None):
+    """Downloads the zips of projects in the given order with `streams` concurrent downloads.
+
+    `bandwidth` caps the combined throughput in bytes per second. Projects whose zip exists or whose source is
+    fully extracted are skipped. With a PrefetchWindow, only projects within the window are downloaded and projects
+    whose processing started first are skipped. One aggregate progress bar replaces the per-project bars; the
+    outcome of every project is appended to the prefetch report. Returns the number of projects per outcome.
+    """
+    limiter = BandwidthLimiter(bandwidth) if bandwidth else None
+    counts = {}
+    rows = []
+    lock = threading.Lock()
+    start = time.time()
+    total_bytes = 0
+
+    pbar = tqdm(desc=f"Prefetching {len(project_ids)} projects", unit="iB", unit_scale=True, unit_divisor=1024,
+                disable=not show_progress)
+
+    def progress(size):
+        with lock:
+            pbar.update(size)
+
+    def prefetch(index, project_id):
+        nonlocal total_bytes
+        if window and not window.claim(index, project_id):
+            with lock:
+                counts["processed first"] = counts.get("processed first", 0) + 1
+            return
+        project_start = time.time()
+        if is_extracted(project_id):
+            outcome = "extracted"
+        else:
+            outcome = download_project(project_id, progress=progress, limiter=limiter)
+        if window and outcome == "failed":
+            release(project_id, holder="prefetch")
+        zip_file = get_zip_file_path(project_id)
+        size = os.path.getsize(zip_file) if outcome == "downloaded" and os.path.exists(zip_file) else 0
+        with lock:
+            counts[outcome] = counts.get(outcome, 0) + 1
+            total_bytes += size
+            rows.append([project_id, outcome, size, f"{time.time() - project_start:.2f}", time.strftime("%Y-%m-%d %H:%M:%S")])
+            pbar.set_postfix_str(", ".join(f"{count} {name}" for name, count in sorted(counts.items())))
+
+    os.makedirs(DOWNLOADS_DIR, exist_ok=True)
+    try:
+        with ThreadPoolExecutor(max_workers=streams) as executor:
+            list(executor.map(prefetch, range(len(project_ids)), project_ids))
+    finally:
+        pbar.close()
+        record_prefetch(rows)
+
+    elapsed = time.time() - start
+    rate = f" at {total_bytes / elapsed / (1024 * 1024):.1f} MB/s" if elapsed > 0 and total_bytes else ""
+    print(f"📥 Prefetched {len(project_ids)} projects in {elapsed:.0f} seconds with {streams} streams: "
+          f"{', '.join(f'{count} {name}' for name, count in sorted(counts.items())) or 'nothing to do'}; "
+          f"{total_bytes / (1024 * 1024):.1f} MB downloaded{rate}. Report: {PREFETCH_REPORT_FILE}")
+    return counts
+
+
+def download_all_projects(streams=PREFETCH_STREAMS, bandwidth=None, order="file"):
+    """Prefetches the zips of every project with listed code files, in the order of the planned schedule."""
+    project_ids = get_catalog().get_code_file_project_ids()
+    if order != "file":
+        from planner import plan_projects  # the planner imports this module
+        project_ids = [project_id for project_id, _ in plan_projects(project_ids, order)[0]]
+    return prefetch_projects(project_ids, streams=streams, bandwidth=bandwidth)
+
+
+def get_extract_state_path(project_id):
+    """Returns the path to the extraction state file of a project."""
+    return os.path.join(DOWNLOADS_DIR, f"{project_id}_extract.json")
+
+
+def load_extract_state(project_id):
+    """Loads the extraction state of a project. Returns None if no state was recorded."""
+    state_path = get_extract_state_path(project_id)
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_extract_state(project_id, complete, deferred):
+    """Records whether the extraction finished and which members were deferred in lazy mode."""
+    with open(get_extract_state_path(project_id), "w", encoding="utf-8") as f:
+        json.dump({"complete": complete, "deferred": sorted(deferred)}, f, indent=2)
 
 
-def unzip_project(project_id):
-    """Unzips a project from the download directory. Downloads the project if it doesn't exist."""
+def get_sync_overlay_path(project_id):
+    """Returns the directory holding the files changed by delta syncs of a project."""
+    return os.path.join(SYNC_OVERLAYS_DIR, project_id)
+
+
+def load_sync_removals(project_id):
+    """Loads the source paths removed on OSF since the zip was downloaded."""
+    removed_path = os.path.join(get_sync_overlay_path(project_id), "removed.json")
+    if not os.path.exists(removed_path):
+        return []
+    with open(removed_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_sync_removals(project_id, removed):
+    """Records the source paths removed on OSF since the zip was downloaded."""
+    overlay_path = get_sync_overlay_path(project_id)
+    os.makedirs(overlay_path, exist_ok=True)
+    with open(os.path.join(overlay_path, "removed.json"), "w", encoding="utf-8") as f:
+        json.dump(sorted(removed), f, indent=2)
+
+
+def clear_sync_overlay(project_id):
+    """Drops the synced changes of a project, e.g. once a newer zip was downloaded."""
+    shutil.rmtree(get_sync_overlay_path(project_id), ignore_errors=True)
+
+
+def apply_sync_overlay(project_id):
+    """Replays the files added, modified or removed by delta syncs on a source tree extracted from the zip.
+
+    The zip predates the syncs, so without this every extraction (including the restore after each executed
+    script) would revert the source to its state at download time. Returns the number of paths changed.
+    """
+    files_path = os.path.join(get_sync_overlay_path(project_id), "files")
+    src_path = get_src_path(project_id)
+    changed = 0
+
+    for root, _, files in os.walk(files_path):
+        for file in files:
+            relative_path = os.path.relpath(os.path.join(root, file), files_path)
+            target = get_member_target(src_path, relative_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(os.path.join(root, file), target)
+            changed += 1
+
+    for relative_path in load_sync_removals(project_id):
+        target = get_member_target(src_path, relative_path)
+        if os.path.isfile(target):
+            os.remove(target)
+            changed += 1
+
+    if changed:
+        log_message(project_id, "DOWNLOAD", f"🔄 Applied {changed} synced change(s) on top of the zip contents.")
+    return changed
+
+
+def get_member_target(src_path, member_name):
+    """Returns the sanitized extraction path of a zip member, mirroring ZipFile.extract."""
+    arcname = member_name.replace("/", os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    parts = (x for x in arcname.split(os.path.sep) if x not in ("", os.path.curdir, os.path.pardir))
+    return os.path.join(src_path, *parts)
+
+
+def file_crc32(path):
+    """Computes the CRC32 of a file by streaming it."""
+    crc = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(EXTRACT_CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def is_member_up_to_date(info, target):
+    """Checks whether a member already exists on disk with matching size and CRC."""
+    if not os.path.isfile(target) or os.path.getsize(target) != info.file_size:
+        return False
+    return file_crc32(target) == info.CRC
+
+
+def is_lazy_member(info):
+    """Checks whether a member can be deferred in lazy mode (large and not an R script)."""
+    return info.file_size > LAZY_SIZE_THRESHOLD and not info.filename.lower().endswith(SCRIPT_EXTENSIONS)
+
+
+def extract_members(zip_file, src_path, members):
+    """Extracts the given members in parallel. Each worker streams its members through its own zip handle.
+
+    Returns a tuple of (extracted, skipped) member counts.
+    """
+    def extract_batch(batch):
+        extracted = skipped = 0
+        with zipfile.ZipFile(zip_file, "r") as zip_ref:
+            for info in batch:
+                target = get_member_target(src_path, info.filename)
+                if info.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                if is_member_up_to_date(info, target):
+                    skipped += 1
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with zip_ref.open(info) as source, open(target, "wb") as dest:
+                    shutil.copyfileobj(source, dest, EXTRACT_CHUNK_SIZE)
+                extracted += 1
+        return extracted, skipped
+
+    # Spread large members over the workers so one batch does not get all the heavy decompression
+    members = sorted(members, key=lambda info: info.compress_size, reverse=True)
+    workers = max(1, min(EXTRACT_WORKERS, len(members)))
+    batches = [members[i::workers] for i in range(workers)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(extract_batch, batches))
+
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
+def extract_deferred_members(project_id, names=None):
+    """Extracts members deferred by lazy mode.
+
+    If `names` is given, only deferred members whose path or file name matches one of them are extracted
+    (e.g. the `readData` entries reported by flowR). Otherwise all deferred members are extracted.
+    """
+    state = load_extract_state(project_id)
+    if not state or not state["deferred"]:
+        return 0
+
+    deferred = set(state["deferred"])
+    if names is not None:
+        wanted = {os.path.normpath(n).lstrip(os.path.sep).lower() for n in names if n}
+        wanted_basenames = {os.path.basename(n) for n in wanted}
+        deferred = {
+            d for d in deferred
+            if os.path.normpath(d).lower() in wanted or os.path.basename(d).lower() in wanted_basenames
+        }
+        if not deferred:
+            return 0
+
+    zip_file = get_zip_file_path(project_id)
+    with zipfile.ZipFile(zip_file, "r") as zip_ref:
+        members = [zip_ref.getinfo(name) for name in deferred]
+
+    log_message(project_id, "DOWNLOAD", f"📦 Extracting {len(members)} deferred member(s) from {zip_file}...")
+    extracted, _ = extract_members(zip_file, get_src_path(project_id), members)
+
+    remaining = set(state["deferred"]) - deferred
+    save_extract_state(project_id, complete=not remaining, deferred=remaining)
+    return extracted
+
+
+def unzip_project(project_id, lazy=False):
+    """Unzips a project from the download directory. Downloads the project if it doesn't exist.
+
+    Members are extracted in parallel and members already on disk with a matching CRC are skipped, so an
+    interrupted extraction resumes where it stopped. With `lazy=True`, large non-script members are deferred
+    until `extract_deferred_members` is called for them.
+    """
     zip_file = get_zip_file_path(project_id)
     project_path = get_project_path(project_id)
     src_path = get_src_path(project_id)
+    state = load_extract_state(project_id)
 
-    if os.path.exists(src_path) and os.listdir(src_path):
+    if is_extracted(project_id):
         log_message(project_id, "DOWNLOAD", f"⏭️ Project '{project_id}' already exists at {src_path}. Skipping download and extraction.")
         return project_path
-    
+
+    if state and not state["complete"] and state["deferred"] and os.path.exists(src_path):
+        # A previous lazy extraction finished but left large members behind
+        if not lazy:
+            extract_deferred_members(project_id)
+        return project_path
+
     if not os.path.exists(zip_file):
         download_project(project_id)
-    
+
     os.makedirs(project_path, exist_ok=True)
-    os.makedirs(src_path, exist_ok=False)
-    
+    os.makedirs(src_path, exist_ok=True)
+
     with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-        log_message(project_id, "DOWNLOAD", f"📦 Extracting {zip_file} to {src_path}...")
-        zip_ref.extractall(src_path)
-    
+        members = zip_ref.infolist()
+
+    deferred = [info.filename for info in members if lazy and is_lazy_member(info)]
+    members = [info for info in members if not (lazy and is_lazy_member(info))]
+
+    save_extract_state(project_id, complete=False, deferred=[])
+    log_message(project_id, "DOWNLOAD", f"📦 Extracting {zip_file} to {src_path} with {EXTRACT_WORKERS} workers...")
+    extracted, skipped = extract_members(zip_file, src_path, members)
+    apply_sync_overlay(project_id)
+    save_extract_state(project_id, complete=not deferred, deferred=deferred)
+
+    log_message(project_id, "DOWNLOAD", f"✅ Extracted {extracted} member(s), skipped {skipped} unchanged member(s), deferred {len(deferred)} large member(s).")
     return project_path
 
 if __name__ == "__main__":
-    download_all_projects()
+    parser = argparse.ArgumentParser(description="Prefetch the zips of all projects listed in the metadata CSV")
+    parser.add_argument("--streams", type=int, default=PREFETCH_STREAMS, help="Concurrent downloads")
+    parser.add_argument("--bandwidth", type=parse_size, help="Combined bandwidth cap per second (e.g. 20M)")
+    parser.add_argument("--order", choices=("file", "longest", "shortest"), default="file",
+                        help="Prefetch in the order the projects will be processed with run.py --order")
+    args = parser.parse_args()
+    download_all_projects(streams=args.streams, bandwidth=args.bandwidth, order=args.order)
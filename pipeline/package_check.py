@@ -0,0 +1,86 @@
+import os
+import subprocess
+from utils import log_message, get_project_path, get_script_dependencies_path
+from flowr_dependency_query import read_script_dependencies
+
+# Checks all packages in one R session and prints one line per package that cannot be loaded
+CHECK_PACKAGES_EXPR = (
+    "pkgs <- commandArgs(trailingOnly = TRUE); "
+    "ok <- vapply(pkgs, function(p) suppressMessages(suppressWarnings(requireNamespace(p, quietly = TRUE))), logical(1)); "
+    "if (any(!ok)) cat(paste0('MISSING\\t', pkgs[!ok], '\\n'), sep = '')"
+)
+
+
+def read_description_imports(project_path):
+    """Reads the package names listed under `Imports:` in the generated DESCRIPTION file."""
+    description_path = os.path.join(project_path, "DESCRIPTION")
+    if not os.path.exists(description_path):
+        return []
+
+    imports = []
+    with open(description_path, "r", encoding="utf-8") as f:
+        in_imports = False
+        for line in f:
+            if line.startswith("Imports:"):
+                in_imports = True
+                line = line[len("Imports:"):]
+            elif in_imports and not line[:1].isspace():
+                break
+            if in_imports:
+                imports.extend(name.strip() for name in line.split(","))
+
+    return [name for name in imports if name]
+
+
+def find_missing_packages(project_id, container_name, packages):
+    """Returns the packages that cannot be loaded in the container, checked in a single R session.
+
+    Returns None if the check itself could not run.
+    """
+    command = ["docker", "exec", container_name, "Rscript", "-e", CHECK_PACKAGES_EXPR] + packages
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        log_message(project_id, "PACKAGE CHECK", f"❌ Package check failed: {result.stderr.strip()}")
+        return None
+
+    missing = (line.split("\t", 1)[1].strip() for line in result.stdout.splitlines() if line.startswith("MISSING\t"))
+    return [name for name in missing if name]
+
+
+def check_package_availability(project_id, flowr_enabled=False):
+    """Checks every DESCRIPTION package in the running container before any script is executed.
+
+    Returns a dict mapping each script (relative to the project source directory) that uses a missing package
+    to the list of its missing packages. Those scripts can be skipped without running them.
+    """
+    suffix = "-f" if flowr_enabled else ""
+    container_name = f"repo2docker-{project_id}{suffix}"
+    packages = read_description_imports(get_project_path(project_id))
+
+    if not packages:
+        log_message(project_id, "PACKAGE CHECK", "ℹ️ No packages listed in DESCRIPTION. Skipping package check.")
+        return {}
+
+    log_message(project_id, "PACKAGE CHECK", f"🔍 Checking {len(packages)} package(s) in container {container_name}...")
+    missing = find_missing_packages(project_id, container_name, packages)
+    if not missing:
+        if missing is not None:
+            log_message(project_id, "PACKAGE CHECK", "✅ All packages are available.")
+        return {}
+
+    log_message(project_id, "PACKAGE CHECK", f"⚠️ Missing package(s): {', '.join(missing)}")
+
+    script_dependencies = read_script_dependencies(get_script_dependencies_path(project_id))
+    if script_dependencies is None:
+        log_message(project_id, "PACKAGE CHECK", "ℹ️ No per-script dependencies recorded. Scripts will not be skipped.")
+        return {}
+
+    missing = set(missing)
+    skipped = {}
+    for script, dependencies in script_dependencies.items():
+        script_missing = sorted(missing.intersection(dependencies["libraries"]))
+        if script_missing:
+            skipped[script] = script_missing
+
+    log_message(project_id, "PACKAGE CHECK", f"⏭️ {len(skipped)} script(s) depend on missing packages and will be skipped.")
+    return skipped
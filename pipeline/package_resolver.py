@@ -0,0 +1,177 @@
+import os
+import re
+import json
+import argparse
+import requests
+from utils import CACHE_DIR
+
+CRAN_URL = "https://cloud.r-project.org"
+BIOC_URL = "https://bioconductor.org/packages/release"
+
+# Package indexes in lookup order: a name found on CRAN is never looked up on Bioconductor
+PACKAGE_INDEXES = {
+    "cran": f"{CRAN_URL}/src/contrib/PACKAGES",
+    "bioc": f"{BIOC_URL}/bioc/src/contrib/PACKAGES",
+    "bioc-annotation": f"{BIOC_URL}/data/annotation/src/contrib/PACKAGES",
+    "bioc-experiment": f"{BIOC_URL}/data/experiment/src/contrib/PACKAGES",
+}
+INDEX_DIR = os.path.join(CACHE_DIR, "package_index")
+INSTALL_PLANS_DIR = os.path.join(CACHE_DIR, "install_plans")
+
+# Packages shipped with R itself, which never need to be installed
+BASE_PACKAGES = {
+    "R", "base", "compiler", "datasets", "graphics", "grDevices", "grid", "methods", "parallel",
+    "splines", "stats", "stats4", "tcltk", "tools", "utils",
+}
+DEPENDENCY_FIELDS = ("Depends", "Imports", "LinkingTo")
+
+
+def update_package_index():
+    """Downloads the CRAN and Bioconductor PACKAGES indexes into the local cache."""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    for source, url in PACKAGE_INDEXES.items():
+        print(f"Downloading {source} package index from {url}...")
+        response = requests.get(url, timeout=120)
+        response.raise_for_status()
+        with open(os.path.join(INDEX_DIR, f"{source}.PACKAGES"), "w", encoding="utf-8") as f:
+            f.write(response.text)
+    print(f"Package indexes saved to {INDEX_DIR}.")
+
+
+def parse_dcf(path):
+    """Parses a DCF file (such as PACKAGES) into a list of records."""
+    records = []
+    record = {}
+    field = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip():
+                if record:
+                    records.append(record)
+                record, field = {}, None
+            elif line[:1].isspace() and field:
+                record[field] += " " + line.strip()
+            elif ":" in line:
+                field, value = line.split(":", 1)
+                record[field] = value.strip()
+    if record:
+        records.append(record)
+    return records
+
+
+def parse_dependency_field(value):
+    """Extracts the package names from a Depends/Imports/LinkingTo field, dropping version constraints."""
+    names = []
+    for entry in value.split(","):
+        name = re.sub(r"\(.*?\)", "", entry).strip()
+        if name and name not in BASE_PACKAGES:
+            names.append(name)
+    return names
+
+
+def load_package_index():
+    """Loads the cached package indexes. Returns None if no index has been downloaded yet."""
+    index = {}
+    for source in PACKAGE_INDEXES:
+        path = os.path.join(INDEX_DIR, f"{source}.PACKAGES")
+        if not os.path.exists(path):
+            continue
+        for record in parse_dcf(path):
+            name = record.get("Package")
+            if not name or name in index:
+                continue
+            dependencies = []
+            for field in DEPENDENCY_FIELDS:
+                dependencies.extend(parse_dependency_field(record.get(field, "")))
+            index[name] = {"source": source, "dependencies": dependencies}
+    return index or None
+
+
+def resolve_closure(names, index):
+    """Maps package names to their source and computes the full transitive closure of their dependencies.
+
+    Returns a dict with:
+    - "sources": source of every requested name ("cran", "bioc", ... or "base")
+    - "unresolved": requested names found in no index
+    - "waves": the closure split into install waves; every package only depends on packages of earlier waves,
+      so the packages of one wave can be installed in parallel
+    - "needs_bioc": whether any package of the closure comes from Bioconductor
+    """
+    sources = {}
+    unresolved = []
+    for name in names:
+        if name in BASE_PACKAGES:
+            sources[name] = "base"
+        elif name in index:
+            sources[name] = index[name]["source"]
+        else:
+            unresolved.append(name)
+
+    # Depth of each package in the dependency graph, computed with an explicit DFS stack to avoid recursion limits
+    levels = {}
+    visiting = set()
+    for root in names:
+        if root not in index or root in levels:
+            continue
+        stack = [(root, iter(index[root]["dependencies"]))]
+        visiting.add(root)
+        while stack:
+            name, dependencies = stack[-1]
+            dep = next((d for d in dependencies if d in index and d not in levels and d not in visiting), None)
+            if dep is not None:
+                visiting.add(dep)
+                stack.append((dep, iter(index[dep]["dependencies"])))
+                continue
+            stack.pop()
+            visiting.discard(name)
+            dep_levels = [levels[d] for d in index[name]["dependencies"] if d in levels]
+            levels[name] = max(dep_levels, default=-1) + 1
+
+    waves = [[] for _ in range(max(levels.values(), default=-1) + 1)]
+    for name, level in sorted(levels.items()):
+        waves[level].append(name)
+
+    needs_bioc = any(index[name]["source"].startswith("bioc") for name in levels)
+    return {"sources": sources, "unresolved": unresolved, "waves": waves, "needs_bioc": needs_bioc}
+
+
+def write_install_plan(project_dir, project_id, resolution):
+    """Writes an install.R that installs the resolved closure wave by wave with parallel builds (Ncpus).
+
+    The plan is also stored as JSON in the cache.
+    """
+    install_path = os.path.join(project_dir, "install.R")
+    with open(install_path, "w", encoding="utf-8") as f:
+        f.write("# Automatically generated install plan. Packages of one wave only depend on earlier waves.\n")
+        f.write("options(Ncpus = max(1L, parallel::detectCores()))\n")
+        if resolution["needs_bioc"]:
+            f.write("if (!requireNamespace(\"BiocManager\", quietly = TRUE)) install.packages(\"BiocManager\")\n")
+            f.write("options(repos = BiocManager::repositories())\n")
+        for i, wave in enumerate(resolution["waves"], start=1):
+            packages = ", ".join(f"\"{name}\"" for name in wave)
+            f.write(f"\n# Wave {i}\n")
+            f.write(f"install.packages(setdiff(c({packages}), rownames(installed.packages())))\n")
+
+    os.makedirs(INSTALL_PLANS_DIR, exist_ok=True)
+    with open(os.path.join(INSTALL_PLANS_DIR, f"{project_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(resolution, f, indent=2)
+
+    return install_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resolve R packages against the cached CRAN/Bioconductor indexes")
+    parser.add_argument("packages", nargs="*", help="Package names to resolve")
+    parser.add_argument("--update-index", action="store_true", help="Download the package indexes into the cache")
+    args = parser.parse_args()
+
+    if args.update_index:
+        update_package_index()
+
+    if args.packages:
+        package_index = load_package_index()
+        if package_index is None:
+            print("❌ No package index found. Run with --update-index first.")
+        else:
+            print(json.dumps(resolve_closure(args.packages, package_index), indent=2))
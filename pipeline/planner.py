@@ -0,0 +1,200 @@
+import os
+import csv
+import json
+import argparse
+import requests
+from utils import CACHE_DIR, STAGE_TIMINGS_FILE, get_zip_file_path, get_src_path, get_script_dependencies_path
+from osf_zip_file_download import get_zip_url
+from flowr_dependency_query import read_script_dependencies
+from project_catalog import get_catalog
+
+FEATURES_FILE = os.path.join(CACHE_DIR, "planner_features.json")  # features of every project seen by the planner
+FEATURE_NAMES = ("zip_mb", "scripts", "dependencies")
+
+# Seconds per unit of each feature plus a fixed per-project cost, used until enough history exists to fit them
+DEFAULT_COST_MODEL = {"intercept": 180.0, "zip_mb": 0.5, "scripts": 30.0, "dependencies": 20.0}
+# Feature values assumed when a feature cannot be determined
+DEFAULT_FEATURES = {"zip_mb": 50.0, "scripts": 5, "dependencies": 10}
+MIN_HISTORY = 10  # projects with a recorded total time needed before fitting the model
+RIDGE = 1e-3  # regularisation keeping the fit stable when features are collinear
+ORDERS = ("file", "longest", "shortest")
+
+
+def load_features():
+    """Loads the cached planner features of all projects."""
+    if not os.path.exists(FEATURES_FILE):
+        return {}
+    with open(FEATURES_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_features(features):
+    """Stores the planner features of all projects."""
+    os.makedirs(os.path.dirname(FEATURES_FILE), exist_ok=True)
+    with open(FEATURES_FILE, "w", encoding="utf-8") as f:
+        json.dump(features, f, indent=2)
+
+
+def get_zip_size(project_id):
+    """Returns the zip size in bytes from the cached download, or from a HEAD request. None if unknown."""
+    zip_path = get_zip_file_path(project_id)
+    if os.path.exists(zip_path):
+        return os.path.getsize(zip_path)
+    try:
+        response = requests.head(get_zip_url(project_id), allow_redirects=True, timeout=30)
+        response.raise_for_status()
+        length = response.headers.get("Content-Length")
+        return int(length) if length else None
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+
+def count_scripts(project_id):
+    """Counts the R/Rmd scripts of the extracted source, falling back to the project catalog. None if unknown."""
+    src_path = get_src_path(project_id)
+    if os.path.isdir(src_path):
+        return sum(
+            1 for _, _, files in os.walk(src_path)
+            for file in files if file.lower().endswith((".r", ".rmd"))
+        )
+    return get_catalog().count_code_files(project_id)
+
+
+def count_dependencies(project_id):
+    """Counts the distinct libraries flowR found in the project's scripts. None if flowR has not run yet."""
+    script_dependencies = read_script_dependencies(get_script_dependencies_path(project_id))
+    if script_dependencies is None:
+        return None
+    return len({name for dependencies in script_dependencies.values() for name in dependencies.get("libraries", [])})
+
+
+def get_project_features(project_id, cached_features):
+    """Determines the cost features of a project. Known values from earlier runs are kept if a source is gone."""
+    zip_size = get_zip_size(project_id)
+    features = dict(cached_features.get(project_id, {}))
+    measured = {
+        "zip_mb": zip_size / (1024 * 1024) if zip_size is not None else None,
+        "scripts": count_scripts(project_id),
+        "dependencies": count_dependencies(project_id),
+    }
+    features.update({name: value for name, value in measured.items() if value is not None})
+    return features
+
+
+def complete_features(features):
+    """Fills features that could not be determined with their defaults."""
+    return {name: features.get(name, DEFAULT_FEATURES[name]) for name in FEATURE_NAMES}
+
+
+def load_total_times():
+    """Returns the mean recorded total processing time of every project."""
+    if not os.path.exists(STAGE_TIMINGS_FILE):
+        return {}
+    totals = {}
+    with open(STAGE_TIMINGS_FILE, "r", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            if row["Stage"] == "TOTAL":
+                totals.setdefault(row["Project ID"], []).append(float(row["Seconds"]))
+    return {project_id: sum(times) / len(times) for project_id, times in totals.items()}
+
+
+def solve_linear_system(matrix, vector):
+    """Solves a small dense linear system by Gaussian elimination with partial pivoting."""
+    n = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(col + 1, n):
+            factor = rows[r][col] / rows[col][col]
+            for c in range(col, n + 1):
+                rows[r][c] -= factor * rows[col][c]
+    solution = [0.0] * n
+    for i in reversed(range(n)):
+        solution[i] = (rows[i][n] - sum(rows[i][c] * solution[c] for c in range(i + 1, n))) / rows[i][i]
+    return solution
+
+
+def fit_cost_model(features, totals):
+    """Fits the per-feature costs to the recorded total times with ridge-regularised least squares.
+
+    Falls back to DEFAULT_COST_MODEL while fewer than MIN_HISTORY projects have both features and a total time,
+    or if the fit yields negative costs.
+    """
+    samples = [(complete_features(features[p]), totals[p]) for p in totals if p in features]
+    if len(samples) < MIN_HISTORY:
+        return dict(DEFAULT_COST_MODEL)
+
+    columns = ("intercept",) + FEATURE_NAMES
+    design = [[1.0] + [float(f[name]) for name in FEATURE_NAMES] for f, _ in samples]
+    targets = [total for _, total in samples]
+    size = len(columns)
+    normal = [[sum(row[i] * row[j] for row in design) + (RIDGE if i == j else 0.0) for j in range(size)] for i in range(size)]
+    rhs = [sum(row[i] * target for row, target in zip(design, targets)) for i in range(size)]
+
+    try:
+        coefficients = solve_linear_system(normal, rhs)
+    except ZeroDivisionError:
+        return dict(DEFAULT_COST_MODEL)
+    if any(c < 0 for c in coefficients):
+        return dict(DEFAULT_COST_MODEL)
+    return dict(zip(columns, coefficients))
+
+
+def estimate_cost(features, model):
+    """Estimates the processing time in seconds of a project from its features."""
+    features = complete_features(features)
+    return model["intercept"] + sum(model[name] * features[name] for name in FEATURE_NAMES)
+
+
+def plan_projects(project_ids, order="file"):
+    """Estimates the cost of every project and orders them.
+
+    `order` is "file" (keep the input order), "longest" (longest first, so the slowest projects and their failures
+    come early) or "shortest" (shortest first, for fast feedback). Projects are processed one after another, so the
+    order does not change the total time. Projects with a recorded total time are estimated from it.
+    Returns a tuple of (list of (project ID, estimated seconds), cost model).
+    """
+    features = load_features()
+    for project_id in project_ids:
+        features[project_id] = get_project_features(project_id, features)
+    save_features(features)
+
+    totals = load_total_times()
+    model = fit_cost_model(features, totals)
+    plan = [(project_id, totals.get(project_id, estimate_cost(features[project_id], model))) for project_id in project_ids]
+
+    if order == "longest":
+        plan.sort(key=lambda item: item[1], reverse=True)
+    elif order == "shortest":
+        plan.sort(key=lambda item: item[1])
+    return plan, model
+
+
+def format_duration(seconds):
+    """Formats seconds as h:mm:ss."""
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def format_plan(plan, model):
+    """Formats the expected schedule of a plan, one project per line, followed by the total time."""
+    fitted = model != DEFAULT_COST_MODEL
+    lines = [f"📋 Cost model ({'fitted on history' if fitted else 'defaults'}): "
+             + ", ".join(f"{name}={value:.2f}" for name, value in model.items())]
+    elapsed = 0.0
+    for i, (project_id, seconds) in enumerate(plan, start=1):
+        lines.append(f"{i:>4}. {project_id:<12} est. {format_duration(seconds)}  "
+                     f"starts {format_duration(elapsed)}  ends {format_duration(elapsed + seconds)}")
+        elapsed += seconds
+    lines.append(f"⏱️ Expected total time for {len(plan)} project(s): {format_duration(elapsed)}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate the processing cost of OSF projects and print the schedule")
+    parser.add_argument("project_ids", nargs="+", help="Project IDs to plan")
+    parser.add_argument("--order", choices=ORDERS, default="longest", help="Order of the schedule")
+    args = parser.parse_args()
+
+    print(format_plan(*plan_projects(args.project_ids, args.order)))
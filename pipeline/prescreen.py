@@ -0,0 +1,93 @@
+import os
+import re
+from utils import log_message, get_src_path, get_script_dependencies_path
+from flowr_dependency_query import read_script_dependencies
+
+# Constructs that always fail in a headless container: (pattern on comment-free code, guard pattern that makes
+# the construct safe, predicted error label from error_analysis.error_patterns, description)
+PRESCREEN_RULES = [
+    (re.compile(r"\bfile\.choose\s*\("), re.compile(r"\binteractive\s*\("),
+     "File Selection Error", "interactive file.choose() call"),
+    (re.compile(r"\brstudioapi\s*::"), re.compile(r"\bisAvailable\s*\("),
+     "RStudio Environment Error", "rstudioapi call"),
+    (re.compile(r"\bsetwd\s*\(\s*[\"'](?:[A-Za-z]:[/\\]|~|/Users/|/home/)"), None,
+     "Invalid File or Directory Path", "setwd() to a path on the author's machine"),
+]
+
+# readData entries reported by flowR that point to the author's machine
+LOCAL_PATH_PATTERN = re.compile(r"^(?:[A-Za-z]:[/\\]|~|/Users/|/home/)")
+
+RMD_CHUNK_PATTERN = re.compile(r"^```\s*\{r[^}]*\}\s*$(.*?)^```\s*$", re.MULTILINE | re.DOTALL | re.IGNORECASE)
+
+
+def strip_r_comments(code):
+    """Removes R comments while keeping `#` characters inside string literals."""
+    lines = []
+    for line in code.splitlines():
+        quote = None
+        escaped = False
+        for i, char in enumerate(line):
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif quote:
+                if char == quote:
+                    quote = None
+            elif char in ("'", '"', "`"):
+                quote = char
+            elif char == "#":
+                line = line[:i]
+                break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def read_script_code(path):
+    """Reads the R code of a script; for Rmd files only the R code chunks are returned."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        content = f.read()
+    if path.lower().endswith(".rmd"):
+        content = "\n".join(RMD_CHUNK_PATTERN.findall(content))
+    return strip_r_comments(content)
+
+
+def predict_failure(code, dependencies=None):
+    """Predicts whether a script will fail headless. Returns a tuple of (error label, evidence) or None."""
+    for pattern, guard, label, description in PRESCREEN_RULES:
+        if pattern.search(code) and not (guard and guard.search(code)):
+            return label, description
+
+    if dependencies:
+        if "rstudioapi" in dependencies.get("libraries", []) and not re.search(r"\bisAvailable\s*\(", code):
+            return "RStudio Environment Error", "rstudioapi library loaded"
+        for source in dependencies.get("readData", []):
+            if source and LOCAL_PATH_PATTERN.match(source):
+                return "Invalid File or Directory Path", f"reads data from local path {source}"
+
+    return None
+
+
+def prescreen_scripts(project_id):
+    """Predicts which scripts of a project cannot run headless, using flowR's per-script analysis and the code.
+
+    Returns a dict mapping each flagged script (relative to the project source directory) to a tuple of
+    (predicted error label, evidence).
+    """
+    src_path = get_src_path(project_id)
+    script_dependencies = read_script_dependencies(get_script_dependencies_path(project_id)) or {}
+
+    predictions = {}
+    for root, _, files in os.walk(src_path):
+        for file in files:
+            if not file.endswith((".R", ".r", ".Rmd", ".rmd")):
+                continue
+            path = os.path.join(root, file)
+            relative_path = os.path.relpath(path, src_path)
+            prediction = predict_failure(read_script_code(path), script_dependencies.get(relative_path))
+            if prediction:
+                predictions[relative_path] = prediction
+                log_message(project_id, "PRESCREEN", f"🔮 {relative_path}: predicted '{prediction[0]}' ({prediction[1]})")
+
+    log_message(project_id, "PRESCREEN", f"✅ Pre-screen flagged {len(predictions)} script(s) that cannot run headless.")
+    return predictions
@@ -0,0 +1,89 @@
+import os
+import csv
+import argparse
+import threading
+from utils import METADATA_DIR
+
+PROJECT_IDS_FILE = os.path.join(METADATA_DIR, "all_project_ids.txt")
+CODE_FILES_FILE = os.path.join(METADATA_DIR, "project_id_r_code_file.csv")  # "Project ID", "R Code File" rows
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_mtime(path):
+    """Returns the modification time of a file, or None if it does not exist."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class ProjectCatalog:
+    """Project IDs and per-project code files from metadata/, parsed once and indexed by project and lowercased file name."""
+
+    def __init__(self, project_ids_file=PROJECT_IDS_FILE, code_files_file=CODE_FILES_FILE):
+        self.project_ids_file = project_ids_file
+        self.code_files_file = code_files_file
+        self.mtimes = (get_mtime(project_ids_file), get_mtime(code_files_file))
+        self.project_ids = []
+        self.code_files = {}  # project ID -> {lowercased file name: file name as listed}
+
+        if self.mtimes[0] is not None:
+            with open(project_ids_file, "r", encoding="utf-8") as f:
+                self.project_ids = [line.strip() for line in f if line.strip()]
+
+        self.has_code_files = self.mtimes[1] is not None
+        if self.has_code_files:
+            with open(code_files_file, "r", encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    project_id = (row.get("Project ID") or "").strip()
+                    file_name = (row.get("R Code File") or "").strip()
+                    if project_id and file_name:
+                        self.code_files.setdefault(project_id, {})[file_name.lower()] = file_name
+
+    def is_stale(self):
+        """Checks whether either metadata file changed since the catalog was loaded."""
+        return self.mtimes != (get_mtime(self.project_ids_file), get_mtime(self.code_files_file))
+
+    def get_code_files(self, project_id):
+        """Returns the code file names listed for a project."""
+        return list(self.code_files.get(project_id, {}).values())
+
+    def count_code_files(self, project_id):
+        """Counts the code files listed for a project. None if the project is not listed."""
+        return len(self.code_files[project_id]) if project_id in self.code_files else None
+
+    def match_files(self, project_id, paths):
+        """Returns the paths whose file name (case-insensitive) is listed for the project, in their original order."""
+        names = self.code_files.get(project_id)
+        if not names:
+            return []
+        return [path for path in paths if os.path.basename(path).lower() in names]
+
+    def get_code_file_project_ids(self):
+        """Returns the projects with listed code files, in the order of the CSV."""
+        return list(self.code_files)
+
+
+def get_catalog():
+    """Returns the shared project catalog, loading it on first use and again whenever the metadata files change."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None or _catalog.is_stale():
+            _catalog = ProjectCatalog()
+        return _catalog
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the project catalog built from metadata/")
+    parser.add_argument("project_ids", nargs="*", help="Project IDs to list the code files of")
+    args = parser.parse_args()
+
+    catalog = get_catalog()
+    if not args.project_ids:
+        print(f"{len(catalog.project_ids)} project IDs in {PROJECT_IDS_FILE}, "
+              f"{len(catalog.code_files)} projects with {sum(map(len, catalog.code_files.values()))} code files in {CODE_FILES_FILE}.")
+    for project_id in args.project_ids:
+        files = catalog.get_code_files(project_id)
+        print(f"{project_id}: {', '.join(files) if files else 'no code files listed'}")
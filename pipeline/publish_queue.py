@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import queue
+import threading
+import subprocess
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from git import Repo
+from utils import CACHE_DIR, log_message
+from retry_policy import with_retries
+from storage_manager import acquire, release
+
+GITHUB_ORG = "code-inspect-binder"
+# Both can point at a stub API server and local bare repositories, e.g. GITHUB_REMOTE_URL=/tmp/remotes/{repo}.git
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+GITHUB_REMOTE_URL = os.getenv("GITHUB_REMOTE_URL", "https://github.com/{org}/{repo}.git")
+PUBLISH_WORKERS = 4  # repositories pushed at once
+PUBLISH_BATCH_SIZE = 20  # jobs collected before repository creation and pushes start
+PUBLISH_BATCH_WAIT = 5  # seconds the dispatcher waits for more jobs before publishing a partial batch
+PUBLISHED_FILE = os.path.join(CACHE_DIR, "published_trees.json")  # tree hash last pushed for every repository
+INITIAL_COMMIT_MESSAGE = "Initial commit for repo2docker project"
+UPDATE_COMMIT_MESSAGE = "Update repo2docker project"
+
+_published_lock = threading.Lock()
+_publish_queue = None
+
+
+def get_github_headers():
+    """Returns the GitHub API headers, or None if no access token is set."""
+    token = os.getenv("GITHUB_ACCESS_TOKEN")
+    return {"Authorization": f"token {token}"} if token else None
+
+
+def raise_for_transient_status(response):
+    """Raises for rate limits and server errors so the retry policy can retry them."""
+    if response.status_code == 429 or response.status_code >= 500:
+        response.raise_for_status()
+    return response
+
+
+def list_org_repos(org, headers):
+    """Lists the names of all repositories of an organization with one paginated listing."""
+    names = set()
+    page = 1
+    while True:
+        response = raise_for_transient_status(requests.get(
+            f"{GITHUB_API_URL}/orgs/{org}/repos", headers=headers, params={"per_page": 100, "page": page}, timeout=30
+        ))
+        response.raise_for_status()
+        repos = response.json()
+        if not repos:
+            return names
+        names.update(repo["name"] for repo in repos)
+        page += 1
+
+
+def create_github_repo(project_id, repo_name, headers, org=GITHUB_ORG):
+    """Creates a GitHub repository under the organization. Returns True if it exists afterwards."""
+    payload = {"name": repo_name, "private": False, "auto_init": True}
+    response = with_retries(project_id, "github", lambda: raise_for_transient_status(
+        requests.post(f"{GITHUB_API_URL}/orgs/{org}/repos", json=payload, headers=headers, timeout=30)
+    ))
+
+    if response.status_code == 201:
+        log_message(project_id, "PUBLISH", f"✅ GitHub repository '{repo_name}' created successfully.")
+        return True
+    elif response.status_code == 422:
+        log_message(project_id, "PUBLISH", f"ℹ️ GitHub repository '{repo_name}' already exists.")
+        return True
+    log_message(project_id, "PUBLISH", f"❌ Failed to create GitHub repository: {response.text}")
+    return False
+
+
+def get_remote_url(repo_name, org=GITHUB_ORG):
+    """Returns the push URL of a repository. Local bare repositories are created on first use."""
+    remote_url = GITHUB_REMOTE_URL.format(org=org, repo=repo_name)
+    local_path = remote_url[len("file://"):] if remote_url.startswith("file://") else remote_url
+    if "://" not in local_path and "@" not in local_path and not os.path.exists(local_path):
+        subprocess.run(["git", "init", "--bare", "-b", "main", local_path], check=True, stdout=subprocess.DEVNULL)
+    return remote_url
+
+
+def load_published():
+    """Loads the tree hash last pushed for every repository."""
+    if not os.path.exists(PUBLISHED_FILE):
+        return {}
+    with open(PUBLISHED_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def record_published(repo_name, tree_hash):
+    """Records the tree hash pushed for a repository."""
+    with _published_lock:
+        published = load_published()
+        published[repo_name] = tree_hash
+        os.makedirs(os.path.dirname(PUBLISHED_FILE), exist_ok=True)
+        tmp_file = f"{PUBLISHED_FILE}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(published, f, indent=2)
+        os.replace(tmp_file, PUBLISHED_FILE)
+
+
+def publish_repository(project_id, project_dir, repo_name):
+    """Commits the project directory and pushes it to the `main` branch of its repository.
+
+    The push is skipped if the tree is identical to the last pushed one. Returns "pushed", "unchanged" or "failed".
+    """
+    try:
+        new_repo = not os.path.isdir(os.path.join(project_dir, ".git"))
+        repo = Repo.init(project_dir) if new_repo else Repo(project_dir)
+        remote_url = get_remote_url(repo_name)
+        if "origin" in [remote.name for remote in repo.remotes]:
+            repo.remotes.origin.set_url(remote_url)
+        else:
+            repo.create_remote("origin", remote_url)
+
+        repo.git.add(all=True)
+        tree_hash = repo.git.write_tree()
+        if load_published().get(repo_name) == tree_hash:
+            log_message(project_id, "PUBLISH", f"⏭️ {repo_name} is unchanged since the last push. Skipping.")
+            return "unchanged"
+
+        if not repo.head.is_valid() or repo.head.commit.tree.hexsha != tree_hash:
+            repo.index.commit(INITIAL_COMMIT_MESSAGE if new_repo else UPDATE_COMMIT_MESSAGE)
+        repo.git.checkout("-B", "main")
+        with_retries(project_id, "git", repo.git.push, "--force", "origin", "main:main")
+        record_published(repo_name, tree_hash)
+        log_message(project_id, "PUBLISH", f"✅ Pushed {project_dir} to {remote_url}.")
+        return "pushed"
+    except Exception as e:
+        log_message(project_id, "PUBLISH", f"❌ Error pushing to GitHub: {e}")
+        return "failed"
+
+
+class PublishQueue:
+    """Publishes repositories in the background: jobs are batched, missing repositories are created per batch
+    and pushes run with bounded concurrency, so publishing never blocks the pipeline stages."""
+
+    def __init__(self, workers=PUBLISH_WORKERS, batch_size=PUBLISH_BATCH_SIZE, batch_wait=PUBLISH_BATCH_WAIT):
+        self.jobs = queue.Queue()
+        self.results = {}
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def enqueue(self, project_id, project_dir, repo_name):
+        """Queues a project directory for publishing to its repository."""
+        # Held from now on, so the disk budget cannot evict the source before it is pushed
+        acquire(project_id, holder="publish")
+        log_message(project_id, "PUBLISH", f"📤 Queued {repo_name} for publishing.")
+        self.jobs.put((project_id, project_dir, repo_name))
+
+    def dispatch(self):
+        stopping = False
+        while not stopping:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                break
+            batch = [job]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    job = self.jobs.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if job is None:
+                    self.jobs.task_done()
+                    stopping = True
+                    break
+                batch.append(job)
+            try:
+                self.publish_batch(batch)
+            except Exception as e:
+                # One bad batch must not stop the dispatcher, or every later job would never be marked done
+                for project_id, _, _ in batch:
+                    if project_id not in self.results:
+                        log_message(project_id, "PUBLISH", f"❌ Publishing failed: {e}")
+                        self.results[project_id] = "failed"
+            finally:
+                for project_id, _, _ in batch:
+                    release(project_id, holder="publish")
+                    self.jobs.task_done()
+
+    def publish_batch(self, batch):
+        """Creates the repositories of a batch that do not exist yet, then pushes the batch."""
+        headers = get_github_headers()
+        if headers is None:
+            for project_id, _, _ in batch:
+                log_message(project_id, "PUBLISH", "❌ GitHub access token not found in environment variables.")
+                self.results[project_id] = "failed"
+            return
+
+        try:
+            existing = with_retries(batch[0][0], "github", list_org_repos, GITHUB_ORG, headers)
+        except Exception as e:
+            log_message(batch[0][0], "PUBLISH", f"⚠️ Could not list the repositories of {GITHUB_ORG}: {e}. Creating each one.")
+            existing = set()
+
+        ready = []
+        for project_id, project_dir, repo_name in batch:
+            try:
+                created = repo_name in existing or create_github_repo(project_id, repo_name, headers)
+            except Exception as e:
+                log_message(project_id, "PUBLISH", f"❌ Could not create GitHub repository '{repo_name}': {e}")
+                created = False
+            if created:
+                ready.append((project_id, project_dir, repo_name))
+            else:
+                self.results[project_id] = "failed"
+
+        for (project_id, _, _), status in zip(ready, self.executor.map(lambda job: publish_repository(*job), ready)):
+            self.results[project_id] = status
+
+    def drain(self):
+        """Waits until every queued job is published. Returns the number of jobs per outcome."""
+        self.jobs.join()
+        counts = {}
+        for status in self.results.values():
+            counts[status] = counts.get(status, 0) + 1
+        self.results = {}
+        return counts
+
+    def close(self):
+        """Stops the dispatcher once the queued jobs are published."""
+        self.jobs.put(None)
+        self.dispatcher.join()
+        self.executor.shutdown()
+
+
+def enqueue_publish(project_id, project_dir, repo_name):
+    """Queues a project for publishing on the shared publish queue, starting it on first use."""
+    global _publish_queue
+    if _publish_queue is None:
+        _publish_queue = PublishQueue()
+    _publish_queue.enqueue(project_id, project_dir, repo_name)
+
+
+def drain_publish_queue():
+    """Waits for all queued publishing jobs and prints their outcome. Does nothing if nothing was queued."""
+    if _publish_queue is None:
+        return {}
+    counts = _publish_queue.drain()
+    print(f"📤 Publishing finished: {', '.join(f'{count} {status}' for status, count in sorted(counts.items())) or 'nothing to publish'}.")
+    return counts
@@ -0,0 +1,106 @@
+import os
+import shutil
+import itertools
+import subprocess
+from utils import PIPELINE_DIR, LOGS_DIR, log_message, get_project_path
+
+R_WORKER_SCRIPT = os.path.join(PIPELINE_DIR, "r_worker.R")
+WORKER_DIR_NAME = ".r_worker"  # scratch directory inside the mounted project directory
+STOP_TIMEOUT = 30  # seconds to wait for the worker to exit before killing it
+
+_job_ids = itertools.count(1)
+
+
+def get_worker_dir(project_id):
+    """Returns the host path of the worker scratch directory (mounted at /data/.r_worker in the container)."""
+    return os.path.join(get_project_path(project_id), WORKER_DIR_NAME)
+
+
+def read_worker_reply(process, prefix):
+    """Reads worker stdout until a protocol line with the given prefix. Returns its fields or None on EOF."""
+    for line in process.stdout:
+        if line.startswith(prefix):
+            return line.rstrip("\n").split("\t")
+    return None
+
+
+def start_r_worker(project_id, container_name):
+    """Starts a warm R session inside the container. Returns the worker process, or None if it failed to start."""
+    worker_dir = get_worker_dir(project_id)
+    os.makedirs(worker_dir, exist_ok=True)
+    shutil.copy(R_WORKER_SCRIPT, os.path.join(worker_dir, "r_worker.R"))
+
+    command = [
+        "docker", "exec", "-i", container_name,
+        "Rscript", f"/data/{WORKER_DIR_NAME}/r_worker.R", "/data/DESCRIPTION"
+    ]
+
+    log_message(project_id, "R EXECUTION", f"🔥 Starting warm R worker in container {container_name}...")
+    worker_log = open(os.path.join(LOGS_DIR, f"{project_id}_r_worker.log"), "w")
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=worker_log, text=True, bufsize=1)
+    worker_log.close()
+
+    reply = read_worker_reply(process, "READY")
+    if not reply:
+        log_message(project_id, "R EXECUTION", f"❌ Warm R worker failed to start. Falling back to cold execution.")
+        stop_r_worker(process, project_id)
+        return None
+
+    log_message(project_id, "R EXECUTION", f"✅ Warm R worker ready. Packages preloaded in {reply[1]} seconds.")
+    return process
+
+
+def run_in_r_worker(process, project_id, kind, script_file, workdir, output_dir, stdout_path, stderr_path, timeout=None):
+    """Runs one script in a forked child of the warm worker. Returns the exit status.
+
+    The child's output is written to the worker scratch directory and moved to the given log paths.
+    Raises RuntimeError if the worker is no longer running.
+    """
+    if process.poll() is not None:
+        raise RuntimeError("R worker is not running")
+
+    job_id = next(_job_ids)
+    container_dir = f"/data/{WORKER_DIR_NAME}"
+    request = [
+        kind, script_file, workdir, output_dir,
+        f"{container_dir}/{job_id}.stdout", f"{container_dir}/{job_id}.stderr",
+        str(timeout or 0),
+    ]
+
+    try:
+        process.stdin.write("\t".join(request) + "\n")
+        process.stdin.flush()
+    except (BrokenPipeError, OSError) as e:
+        raise RuntimeError(f"R worker stopped unexpectedly: {e}")
+
+    reply = read_worker_reply(process, "DONE")
+    if not reply:
+        raise RuntimeError("R worker stopped unexpectedly")
+
+    # The scratch directory lives in the project directory mounted at /data
+    worker_dir = get_worker_dir(project_id)
+    for name, path in ((f"{job_id}.stdout", stdout_path), (f"{job_id}.stderr", stderr_path)):
+        worker_output = os.path.join(worker_dir, name)
+        if os.path.exists(worker_output):
+            shutil.move(worker_output, path)
+        else:
+            open(path, "w").close()
+
+    return int(reply[1])
+
+
+def stop_r_worker(process, project_id):
+    """Stops the warm worker and removes its scratch directory."""
+    try:
+        process.stdin.close()
+    except OSError:
+        pass
+
+    try:
+        process.wait(timeout=STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+    shutil.rmtree(get_worker_dir(project_id), ignore_errors=True)
+    log_message(project_id, "R EXECUTION", "🛑 Warm R worker stopped.")
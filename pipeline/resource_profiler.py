@@ -0,0 +1,86 @@
+import time
+import threading
+import subprocess
+from contextlib import contextmanager
+
+SAMPLE_INTERVAL = 0.5  # seconds between two cgroup samples
+
+# Prints "<cpu usec> <anonymous memory bytes> <bytes written>" from the container's cgroup v2 files every interval
+# until stdin is closed, then prints a final sample.
+SAMPLER_SCRIPT = f"""
+cd /sys/fs/cgroup || exit 1
+sample() {{
+  cpu=$(awk '/^usage_usec/ {{print $2}}' cpu.stat 2>/dev/null)
+  rss=$(awk '/^anon / {{print $2}}' memory.stat 2>/dev/null)
+  written=$([ -f io.stat ] && awk '{{for (i = 2; i <= NF; i++) if (sub(/^wbytes=/, "", $i)) s += $i}} END {{print s + 0}}' io.stat || echo 0)
+  echo "${{cpu:-0}} ${{rss:-0}} ${{written:-0}}"
+}}
+while :; do
+  sample
+  read -t {SAMPLE_INTERVAL} -r _
+  [ $? -gt 128 ] || {{ sample; break; }}
+done
+"""
+
+
+def parse_sample(line):
+    """Parses a sampler line into a tuple of (CPU microseconds, anonymous memory bytes, bytes written)."""
+    try:
+        cpu, rss, written = (int(value) for value in line.split())
+        return cpu, rss, written
+    except ValueError:
+        return None
+
+
+def summarize_samples(samples, wall_seconds):
+    """Computes the resource usage of a run from its first and last samples and the peak memory in between."""
+    if len(samples) < 2:
+        return {"wall_seconds": wall_seconds, "cpu_seconds": None, "peak_rss_bytes": None, "bytes_written": None}
+    return {
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": (samples[-1][0] - samples[0][0]) / 1_000_000,
+        "peak_rss_bytes": max(sample[1] for sample in samples),
+        "bytes_written": samples[-1][2] - samples[0][2],
+    }
+
+
+@contextmanager
+def profile_container(container_name):
+    """Samples a container's cgroup while the body runs and fills the yielded dict with its resource usage.
+
+    The dict receives wall_seconds, cpu_seconds, peak_rss_bytes (peak anonymous memory of the container, which
+    includes the idle process and any warm R session) and bytes_written. Memory is sampled every SAMPLE_INTERVAL
+    seconds, so shorter spikes can be missed. Values that cannot be sampled (e.g. on cgroup v1 hosts) are None.
+    """
+    usage = {}
+    samples = []
+    process = subprocess.Popen(
+        ["docker", "exec", "-i", container_name, "bash", "-c", SAMPLER_SCRIPT],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    first_sample = threading.Event()
+
+    def read_samples():
+        for line in process.stdout:
+            sample = parse_sample(line)
+            if sample:
+                samples.append(sample)
+                first_sample.set()
+        first_sample.set()
+
+    reader = threading.Thread(target=read_samples, daemon=True)
+    reader.start()
+    first_sample.wait(timeout=10)
+
+    start = time.time()
+    try:
+        yield usage
+    finally:
+        wall_seconds = time.time() - start
+        try:
+            process.stdin.close()
+            process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+        reader.join(timeout=5)
+        usage.update(summarize_samples(samples, wall_seconds))
@@ -0,0 +1,31 @@
+import os
+import threading
+import pandas as pd
+from utils import RESULTS_DIR
+
+RESULTS_FILE = os.path.join(RESULTS_DIR, "execution_results.csv")
+
+_frames = {}  # dtype -> ((modification time, size) of the CSV when parsed, DataFrame)
+_frames_lock = threading.Lock()
+
+
+def get_file_stamp(path):
+    """Returns the modification time and size of a file, which change whenever a result is appended."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_results_frame(dtype=None):
+    """Returns the execution results CSV as a DataFrame, parsed again only when the file changed.
+
+    Long-running processes such as the daemon keep the parsed results between projects and submissions instead of
+    re-reading the CSV for every logged script. Callers get a copy they may modify. Raises FileNotFoundError and
+    pandas.errors.EmptyDataError like `pd.read_csv`.
+    """
+    stamp = get_file_stamp(RESULTS_FILE)
+    with _frames_lock:
+        cached = _frames.get(dtype)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, pd.read_csv(RESULTS_FILE, dtype=dtype))
+            _frames[dtype] = cached
+        return cached[1].copy()
@@ -0,0 +1,116 @@
+import os
+import re
+import csv
+import json
+import time
+import random
+import subprocess
+from utils import RESULTS_DIR, log_message
+
+RETRIES_FILE = os.path.join(RESULTS_DIR, "retries.csv")  # every step that needed a retry or failed after retrying
+
+# Per step: attempts (including the first), backoff (seconds before the first retry, doubled after each retry, capped at
+# max_delay) and the error text patterns that mark a failure as transient. Anything else is permanent and not retried.
+RETRY_POLICIES = {
+    "osf": {
+        "attempts": 5, "backoff": 5, "max_delay": 120,
+        "transient": [r"\b429\b", r"\b50[0234]\b", r"Too Many Requests", r"Connection (?:reset|aborted|refused)",
+                      r"Read timed out", r"Max retries exceeded", r"RemoteDisconnected", r"IncompleteRead"],
+    },
+    "build": {
+        "attempts": 3, "backoff": 30, "max_delay": 300,
+        # Matched against the tail of a build log, so status codes are only taken from HTTP contexts: a bare "503"
+        # may be a byte count or line number, and "cannot open URL" alone is R failing on an archived package
+        "transient": [r"Could not resolve host", r"Temporary failure in name resolution", r"Connection (?:reset|timed out|refused)",
+                      r"TLS handshake timeout", r"i/o timeout", r"unexpected EOF", r"Failed to connect to",
+                      r"HTTP status was '50[234]", r"status code:? 50[234]\b", r"returned error: 50[234]\b",
+                      r"\b50[234] (?:Bad Gateway|Service Unavailable|Gateway Time-?out)", r"Timeout of \d+ seconds was reached",
+                      r"toomanyrequests", r"error pulling image configuration", r"Hash Sum mismatch"],
+    },
+    "push": {
+        "attempts": 4, "backoff": 15, "max_delay": 300,
+        "transient": [r"toomanyrequests", r"TLS handshake timeout", r"i/o timeout", r"Connection (?:reset|refused)",
+                      r"unexpected EOF", r"received unexpected HTTP status: 5\d\d", r"net/http"],
+    },
+    "github": {
+        "attempts": 4, "backoff": 10, "max_delay": 120,
+        "transient": [r"\b429\b", r"\b50[0234]\b", r"Connection (?:reset|aborted|refused)", r"Read timed out"],
+    },
+    "git": {
+        "attempts": 4, "backoff": 10, "max_delay": 120,
+        "transient": [r"Could not resolve host", r"Connection (?:reset|timed out|refused)", r"Operation timed out",
+                      r"The requested URL returned error: 5\d\d", r"RPC failed", r"early EOF", r"remote end hung up"],
+    },
+}
+TRANSIENT_HTTP_STATUSES = {429, 500, 502, 503, 504}
+
+
+def load_retry_config(path):
+    """Overrides the attempts, backoff or patterns of steps from a JSON file shaped like RETRY_POLICIES."""
+    with open(path, "r", encoding="utf-8") as f:
+        overrides = json.load(f)
+    for step, policy in overrides.items():
+        RETRY_POLICIES.setdefault(step, {"attempts": 1, "backoff": 0, "max_delay": 0, "transient": []}).update(policy)
+
+
+def get_error_text(error):
+    """Returns the message of an error including the output of a failed subprocess."""
+    parts = [str(error)]
+    if isinstance(error, subprocess.CalledProcessError):
+        for output in (error.stdout, error.stderr):
+            if output:
+                parts.append(output.decode("utf-8", errors="replace") if isinstance(output, bytes) else output)
+    return "\n".join(parts)
+
+
+def is_transient(step, error, extra_text=""):
+    """Classifies an error of a step as transient (worth retrying) or permanent.
+
+    `extra_text` is matched along with the error message, e.g. the tail of a build log.
+    """
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) in TRANSIENT_HTTP_STATUSES:
+        return True
+    if type(error).__name__ in ("ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout", "ChunkedEncodingError"):
+        return True
+    text = f"{get_error_text(error)}\n{extra_text}"
+    return any(re.search(pattern, text, re.IGNORECASE | re.MULTILINE) for pattern in RETRY_POLICIES[step]["transient"])
+
+
+def record_retries(project_id, step, attempts, outcome, error=None):
+    """Appends the retry count and outcome of a step to the retries CSV."""
+    write_header = not os.path.exists(RETRIES_FILE)
+    with open(RETRIES_FILE, "a", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        if write_header:
+            writer.writerow(["Project ID", "Step", "Attempts", "Outcome", "Last Error", "Timestamp"])
+        last_error = get_error_text(error).strip().splitlines()[-1][:300] if error else ""
+        writer.writerow([project_id, step, attempts, outcome, last_error, time.strftime("%Y-%m-%d %H:%M:%S")])
+
+
+def with_retries(project_id, step, func, *args, error_text=None, **kwargs):
+    """Calls `func(*args, **kwargs)` and retries it on transient errors according to the policy of `step`.
+
+    `error_text` optionally maps an error to extra text used for classification, e.g. the tail of a build log.
+    Returns the result of the first successful call; re-raises the last error once it is permanent or the
+    attempts are exhausted. Steps that needed a retry are recorded in the retries CSV.
+    """
+    policy = RETRY_POLICIES[step]
+    for attempt in range(1, policy["attempts"] + 1):
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            transient = is_transient(step, e, error_text(e) if error_text else "")
+            if not transient or attempt == policy["attempts"]:
+                if attempt > 1 or transient:
+                    record_retries(project_id, step, attempt, "failed", e)
+                raise
+            delay = min(policy["max_delay"], policy["backoff"] * 2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+            log_message(project_id, "RETRY", f"🔁 Transient {step} error (attempt {attempt}/{policy['attempts']}): "
+                                              f"{str(e).splitlines()[0] if str(e) else type(e).__name__}. Retrying in {delay:.0f} seconds...")
+            time.sleep(delay)
+        else:
+            if attempt > 1:
+                record_retries(project_id, step, attempt, "succeeded")
+            return result
+
@@ -2,18 +2,36 @@ import os
 import time
 import glob
 import argparse
-from utils import log_message, get_src_path
-from deploy_container import build_and_run
+import threading
+from utils import LOGS_DIR, log_message, get_src_path, get_script_dependencies_path, record_stage_timing
+from deploy_container import build_and_run, stop_project_container, reap_orphaned_containers, MAX_RUNNING_CONTAINERS
 from create_repository import create_repo2docker_files
 from execute_r_files_in_container import execute_r_scripts
-from flowr_dependency_query import extract_dependencies
-from osf_zip_file_download import unzip_project
+from flowr_dependency_query import extract_dependencies, read_dependency_section
+from osf_zip_file_download import unzip_project, extract_deferred_members, prefetch_projects, PrefetchWindow, PREFETCH_WINDOW
 from error_analysis import analyze_project_log
+from package_check import check_package_availability
+from prescreen import prescreen_scripts
+from execution_cache import invalidate_execution_cache
+from storage_manager import hold, release, touch_project, enforce_disk_budget, parse_size
+from planner import plan_projects, format_plan, ORDERS
+from osf_api_file_download import sync_project, has_changes
+from tracing import tracing_session, span, stage_span, PROFILE_KINDS
+from retry_policy import load_retry_config
+from build_monitor import load_build_monitor_config
+from publish_queue import enqueue_publish, drain_publish_queue
+from warehouse import export_project
+from log_store import compress_log
+from project_catalog import get_catalog, PROJECT_IDS_FILE
+from static_dependencies import FAST_PATH_MODES, record_agreement
 
 DOCKERHUB_USERNAME = "meet261"
 
-def run_flowr_dependency_query(project_path):
-    """Extract dependencies using flowr_dependency_query.py if R or Rmd scripts exist."""
+def run_flowr_dependency_query(project_path, fast_path="on"):
+    """Extract dependencies using flowr_dependency_query.py if R or Rmd scripts exist.
+
+    `fast_path` selects whether scripts with only literal library loads skip flowR ("on", "off" or "verify").
+    """
     dependency_file = os.path.join(project_path, "dependencies.txt")
     project_id = os.path.basename(project_path).replace("_repo", "")
     src_path = get_src_path(project_id)
@@ -33,61 +51,135 @@ def run_flowr_dependency_query(project_path):
     log_message(project_id, "DEPENDENCY EXTRACTION", f"📦 Running flowr_dependency_query.py for {src_path}...")
 
     try:
-        extract_dependencies(input_dir=src_path, output_file=dependency_file)
+        stats = {}
+        extract_dependencies(input_dir=src_path, output_file=dependency_file,
+                             script_dependencies_file=get_script_dependencies_path(project_id), fast_path=fast_path, stats=stats)
         log_message(project_id, "DEPENDENCY EXTRACTION", f"✅ Dependencies extracted to {dependency_file}")
+        if fast_path != "off":
+            log_message(project_id, "DEPENDENCY EXTRACTION", f"⚡ {stats.get('static', 0)} script(s) resolved by the static fast path, {stats.get('flowr', 0)} analysed by flowR.")
+        if stats.get("comparisons"):
+            agreed = sum(agreed for agreed, _, _ in stats["comparisons"].values())
+            log_message(project_id, "DEPENDENCY EXTRACTION", f"🔎 Fast path agreed with flowR on {agreed} of {len(stats['comparisons'])} script(s).")
+            record_agreement(project_id, stats["comparisons"])
         return True
     except Exception as e:
         log_message(project_id, "DEPENDENCY EXTRACTION", f"❌ Failed to extract dependencies: {e}")
         return False
 
 
-def process_project(project_id, flowr_enabled=False):
-    """Processes a project with all necessary steps, including Docker Hub push."""
+def process_project(project_id, flowr_enabled=False, lazy_extract=False, warm_r=False, resolve_packages=False,
+                    force_run=False, max_containers=MAX_RUNNING_CONTAINERS, share_images=False, slim_build=False,
+                    use_cache=True, publish=False, fast_path="on", keep_alive=False):
+    """Processes a project with all necessary steps, including Docker Hub push.
+
+    With `publish=True`, the repository (including runtime.txt) is queued for publishing to GitHub once the scripts
+    were executed; the push runs in the background. With `keep_alive=True`, the container is labelled to stay
+    running after the scripts were executed.
+    """
     start_time = time.time()
     log_message(project_id, "PROJECT INIT", f"🚀 Starting processing for project '{project_id}'")
 
     try:
         # Stage 1: Download/Unzip Project
         project_download_start = time.time()
-        project_path = unzip_project(project_id)
+        with stage_span(project_id, "DOWNLOAD"):
+            project_path = unzip_project(project_id, lazy=lazy_extract)
 
         if not project_path:
             log_message(project_id, "DOWNLOAD", f"❌ Failed to download/unzip project '{project_id}'. Skipping further processing.")
             return False
 
+        touch_project(project_id)
         project_download_end = time.time()
+        record_stage_timing(project_id, "DOWNLOAD", project_download_end - project_download_start)
         log_message(project_id, "DOWNLOAD", f"✅ Project downloaded and unzipped successfully in {project_download_end - project_download_start:.2f} seconds.")
 
         # Stage 2: Dependency Extraction
         dep_extraction_start = time.time()
-        if not run_flowr_dependency_query(project_path):
+        with stage_span(project_id, "DEPENDENCY EXTRACTION"):
+            dependencies_extracted = run_flowr_dependency_query(project_path, fast_path=fast_path)
+        if not dependencies_extracted:
             log_message(project_id, "DEPENDENCY EXTRACTION", f"❌ Failed to extract dependencies for project '{project_id}'. Skipping container setup.")
             return False
 
         dep_extraction_end = time.time()
+        record_stage_timing(project_id, "DEPENDENCY EXTRACTION", dep_extraction_end - dep_extraction_start)
         log_message(project_id, "DEPENDENCY EXTRACTION", f"✅ Dependencies extracted successfully in {dep_extraction_end - dep_extraction_start:.2f} seconds.")
 
+        if lazy_extract:
+            # Materialize deferred members that flowR reports as read by the scripts
+            read_data = read_dependency_section(os.path.join(project_path, "dependencies.txt"), "# Data read")
+            with stage_span(project_id, "LAZY EXTRACTION"):
+                extract_deferred_members(project_id, names=read_data)
+
         # Stage 3: Create Repository
         container_setup_start = time.time()
-        if not create_repo2docker_files(project_path, project_id, flowr_enabled=flowr_enabled):
+        with stage_span(project_id, "REPO2DOCKER SETUP"):
+            files_created = create_repo2docker_files(project_path, project_id, flowr_enabled=flowr_enabled, resolve_packages=resolve_packages)
+        if not files_created:
             log_message(project_id, "REPO2DOCKER SETUP", f"❌ Failed to create repo2docker files for project '{project_id}'.")
             return False
 
         container_setup_end = time.time()
+        record_stage_timing(project_id, "REPO2DOCKER SETUP", container_setup_end - container_setup_start)
         log_message(project_id, "REPO2DOCKER SETUP", f"✅ Repo2Docker files created successfully in {container_setup_end - container_setup_start:.2f} seconds.")
 
         # Stage 4: Build, Run and Push Container
-        if not build_and_run(project_id, push=True, dockerhub_username=DOCKERHUB_USERNAME, flowr_enabled=flowr_enabled):
+        build_start = time.time()
+        with stage_span(project_id, "CONTAINER BUILD"):
+            built = build_and_run(project_id, push=True, dockerhub_username=DOCKERHUB_USERNAME, flowr_enabled=flowr_enabled,
+                                  max_running=max_containers, share_images=share_images, slim_build=slim_build,
+                                  keep_alive=keep_alive)
+        if not built:
             return False
+        record_stage_timing(project_id, "CONTAINER BUILD", time.time() - build_start)
+
+        image_name = f"repo2docker-{project_id}{'-f' if flowr_enabled else ''}"
+        touch_project(project_id, kinds=(), image_name=image_name)
+
+        # Stage 5: Check package availability in the container
+        with stage_span(project_id, "PACKAGE CHECK"):
+            missing_deps = check_package_availability(project_id, flowr_enabled=flowr_enabled)
+
+        # Stage 6: Pre-screen scripts that cannot run headless
+        with stage_span(project_id, "PRESCREEN"):
+            predicted_failures = {} if force_run else prescreen_scripts(project_id)
+
+        # Stage 7: Execute R Scripts
+        if lazy_extract:
+            # Scripts may read any file at run time, so the execution stage needs the full tree
+            with stage_span(project_id, "LAZY EXTRACTION"):
+                extract_deferred_members(project_id)
 
-        # Stage 5: Execute R Scripts
-        if not execute_r_scripts(project_id):
+        execution_start = time.time()
+        with stage_span(project_id, "R EXECUTION"):
+            executed = execute_r_scripts(project_id, warm=warm_r, missing_deps=missing_deps, predicted_failures=predicted_failures,
+                                         use_cache=use_cache)
+        if publish:
+            # Queued after execution, since scripts and source restores modify the tree while they run
+            enqueue_publish(project_id, project_path, f"osf_{project_id}{'-f' if flowr_enabled else ''}")
+        if not executed:
             return False
+        record_stage_timing(project_id, "R EXECUTION", time.time() - execution_start)
+
+        touch_project(project_id, kinds=("src",), image_name=image_name)
 
         # 🔍 Run error analysis immediately for the project
-        analyze_project_log(project_id)
+        with stage_span(project_id, "ERROR ANALYSIS"):
+            analyze_project_log(project_id)
+
+        with stage_span(project_id, "WAREHOUSE EXPORT"):
+            try:
+                export_project(project_id)
+            except Exception as e:
+                log_message(project_id, "WAREHOUSE", f"⚠️ Failed to export to the warehouse: {e}")
+
+        # The execution and build logs of this run are finished; keep them as compressed segments
+        for log_name in (f"{project_id}_execution.log", f"{project_id}_repo2docker.log"):
+            compress_log(os.path.join(LOGS_DIR, log_name))
 
         total_time = time.time() - start_time
+        record_stage_timing(project_id, "TOTAL", total_time)
         log_message(project_id, "TOTAL TIME", f"⏳ Total processing time: {total_time:.2f} seconds.")
         return True
 
@@ -95,24 +187,127 @@ def process_project(project_id, flowr_enabled=False):
         log_message(project_id, "ERROR", f"❌ Error occurred: {e}")
         return False
 
-def main():
+def build_parser():
+    """Builds the command line parser shared by run.py and the daemon's submit command."""
     parser = argparse.ArgumentParser(description='Process OSF projects for reproducibility testing.')
     parser.add_argument('input', help='OSF project ID or file containing project IDs')
-    parser.add_argument('--github', action='store_true', help='Create GitHub repositories for the projects')
+    parser.add_argument('--github', action='store_true', help='Publish the generated repositories to GitHub in the background')
     parser.add_argument('--flowr', action='store_true', help='Enable flowR mode with extra setup')
-    args = parser.parse_args()
+    parser.add_argument('--fast-path', choices=FAST_PATH_MODES, default='on', help='Extract literal library loads without flowR (on), always use flowR (off), or run both and record their agreement (verify)')
+    parser.add_argument('--lazy-extract', action='store_true', help='Defer extraction of large non-script files until they are needed')
+    parser.add_argument('--warm-r', action='store_true', help='Execute scripts in forks of a preloaded R session inside the container')
+    parser.add_argument('--resolve-packages', action='store_true', help='Resolve R packages offline and write an ordered install plan before building')
+    parser.add_argument('--force-run', action='store_true', help='Execute scripts even if the pre-screen predicts they cannot run headless')
+    parser.add_argument('--share-images', action='store_true', help='Build one environment image per dependency fingerprint and mount each project source at run time')
+    parser.add_argument('--slim-build', action='store_true', help='Build images from the environment files only and mount the project source at run time')
+    parser.add_argument('--sync', action='store_true', help='Fetch only new or changed files from OSF before processing and invalidate the execution cache of changed projects')
+    parser.add_argument('--no-cache', action='store_true', help='Execute every script even if a cached outcome exists')
+    parser.add_argument('--invalidate-cache', action='store_true', help='Drop the cached execution outcomes of the projects before processing them')
+    parser.add_argument('--keep-alive', action='store_true', help='Keep project containers running after their scripts were executed')
+    parser.add_argument('--max-containers', type=int, default=MAX_RUNNING_CONTAINERS, help='Maximum number of project containers running at once')
+    parser.add_argument('--order', choices=ORDERS, default='file', help='Process projects in input order, longest estimated first or shortest estimated first; projects run one after another, so the total time is the same')
+    parser.add_argument('--plan', action='store_true', help='Print the estimated schedule and total time without processing the projects')
+    parser.add_argument('--retry-config', help='JSON file overriding the retry attempts, backoff and transient error patterns per step')
+    parser.add_argument('--build-monitor-config', help='JSON file overriding the fatal build output patterns that abort a build and the slow install threshold')
+    parser.add_argument('--trace', action='store_true', help='Write nested spans of all stages and subprocesses to a Chrome/Perfetto trace file in logs/traces')
+    parser.add_argument('--profile', action='append', choices=PROFILE_KINDS, default=[], help='Run cProfile (cpu) and/or tracemalloc (memory) around each stage; repeatable')
+    parser.add_argument('--prefetch', type=int, metavar='STREAMS', help='Download the zips of upcoming projects in the background with this many concurrent streams')
+    parser.add_argument('--prefetch-window', type=int, default=PREFETCH_WINDOW, help='Number of upcoming projects the background prefetch may download ahead of the one being processed')
+    parser.add_argument('--bandwidth', type=parse_size, help='Combined bandwidth cap per second of the background prefetch (e.g. 20M)')
+    parser.add_argument('--disk-budget', type=parse_size, help='Evict least recently used downloads, sources and images beyond this size (e.g. 200G)')
+    return parser
+
+def read_project_ids(input_value):
+    """Returns the project IDs of a single ID or of a file with one ID per line."""
+    if os.path.isfile(input_value) and os.path.isfile(PROJECT_IDS_FILE) and os.path.samefile(input_value, PROJECT_IDS_FILE):
+        return list(get_catalog().project_ids)
+    if os.path.isfile(input_value):
+        with open(input_value, "r") as file:
+            return [line.strip() for line in file if line.strip()]
+    return [input_value]
+
+def schedule_projects(project_ids, args):
+    """Orders the project IDs according to --order. Returns the plan when --plan is set, otherwise None."""
+    if not args.plan and args.order == 'file':
+        return project_ids, None
+    plan, model = plan_projects(project_ids, args.order)
+    return [project_id for project_id, _ in plan], format_plan(plan, model) if args.plan else None
+
+def start_prefetch(project_ids, args):
+    """Starts downloading the zips of the scheduled projects in the background if --prefetch is set.
 
-    project_ids = []
-    if os.path.isfile(args.input):
-        with open(args.input, "r") as file:
-            project_ids = [line.strip() for line in file if line.strip()]
-    else:
-        project_ids = [args.input]
+    Returns the thread and the PrefetchWindow to call `begin` on before each project, or (None, None).
+    """
+    if not args.prefetch:
+        return None, None
+    window = PrefetchWindow(args.prefetch_window)
+    thread = threading.Thread(target=prefetch_projects, args=(project_ids,),
+                              kwargs={"streams": args.prefetch, "bandwidth": args.bandwidth, "show_progress": False,
+                                      "window": window}, daemon=True)
+    thread.start()
+    return thread, window
+
+def run_project(project_id, args):
+    """Processes one project with the given command line options, including cache, container and storage cleanup."""
+    if args.sync:
+        with stage_span(project_id, "SYNC"):
+            changes = sync_project(project_id)
+        if changes is None:
+            log_message(project_id, "SYNC", "⚠️ Could not list the OSF storage. Processing the local copy.")
+        elif has_changes(changes):
+            # Scripts may read files flowR does not report, so any change invalidates all cached outcomes
+            invalidate_execution_cache(project_id)
+
+    if args.invalidate_cache:
+        invalidate_execution_cache(project_id)
+
+    with hold(project_id), span(project_id, category="project"):
+        success = process_project(project_id, flowr_enabled=args.flowr, lazy_extract=args.lazy_extract, warm_r=args.warm_r,
+                                  resolve_packages=args.resolve_packages, force_run=args.force_run,
+                                  max_containers=args.max_containers, share_images=args.share_images,
+                                  slim_build=args.slim_build, use_cache=not args.no_cache, publish=args.github,
+                                  fast_path=args.fast_path, keep_alive=args.keep_alive)
+
+        if not args.keep_alive:
+            stop_project_container(project_id, flowr_enabled=args.flowr)
+
+    # Processed, so a zip the background prefetch downloaded for it may be evicted now
+    release(project_id, holder="prefetch")
+
+    if args.disk_budget:
+        with span("STORAGE", category="stage", project_id=project_id):
+            enforce_disk_budget(args.disk_budget)
+
+    return success
+
+def main():
+    args = build_parser().parse_args()
+    project_ids, plan = schedule_projects(read_project_ids(args.input), args)
+    if plan:
+        print(plan)
+        return
+
+    if args.retry_config:
+        load_retry_config(args.retry_config)
+    if args.build_monitor_config:
+        load_build_monitor_config(args.build_monitor_config)
 
     success_count = 0
-    for project_id in project_ids:
-        if process_project(project_id, flowr_enabled=args.flowr):
-            success_count += 1
+    with tracing_session(trace=args.trace, profile=args.profile):
+        with span("reap orphaned containers"):
+            reap_orphaned_containers()
+
+        prefetch, prefetch_window = start_prefetch(project_ids, args)
+        for project_id in project_ids:
+            if prefetch_window:
+                prefetch_window.begin()
+            if run_project(project_id, args):
+                success_count += 1
+        if prefetch:
+            prefetch.join()
+
+        with span("publish queue"):
+            drain_publish_queue()
 
     for project_id in project_ids:
         log_message(project_id, "SUMMARY", f"Processed {len(project_ids)} projects. {success_count} successful, {len(project_ids) - success_count} failed.")
@@ -0,0 +1,247 @@
+import os
+import re
+import csv
+import time
+import argparse
+from utils import RESULTS_DIR
+
+AGREEMENT_FILE = os.path.join(RESULTS_DIR, "fast_path_agreement.csv")  # static vs. flowR libraries per verified script
+FAST_PATH_MODES = ("on", "off", "verify")
+
+# Loaders whose package argument may be a bare name, loaders that take a character string, and pacman's loader
+NAME_LOADERS = {"library", "require"}
+STRING_LOADERS = {"requireNamespace", "loadNamespace", "attachNamespace"}
+MULTI_LOADERS = {"p_load"}
+LOADERS = NAME_LOADERS | STRING_LOADERS | MULTI_LOADERS
+
+# Calls that make flowR report sourced files or read/written data; scripts using them always go to flowR
+IO_CALL_PATTERN = re.compile(
+    r"^(?:source|sys\.source|load|save|save\.image|saveRDS|readRDS|dget|dput|dump|scan|file|url|gzfile|bzfile|"
+    r"unz|sink|readLines|writeLines|read\..+|read_.+|write\..+|write_.+|fread|fwrite|vroom|import|export|"
+    r"download\.file|ggsave|pdf|png|jpeg|tiff|bmp|svg|postscript|cairo_pdf|knit|render|sourceCpp)$"
+)
+# String literals that look like file paths (a directory separator or a file extension). Readers not listed above,
+# e.g. jsonlite::fromJSON("data.json"), still read them, so flowR has to report them for the execution cache key.
+PATH_LITERAL_PATTERN = re.compile(r"/|\\\\|\.[A-Za-z][A-Za-z0-9]{0,7}$")  # "\\" is an escaped backslash
+# Calls that can hide any code or load packages by computed names
+DYNAMIC_CALLS = {"eval", "evalq", "parse", "do.call", "match.fun", "get", "mget"}
+
+RMD_CHUNK_PATTERN = re.compile(r"^\s*```+\s*\{r\b[^}]*\}\s*$(.*?)^\s*```+\s*$", re.MULTILINE | re.DOTALL | re.IGNORECASE)
+RMD_INLINE_PATTERN = re.compile(r"`r ([^`]*)`")
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>[ \t\r\n\f]+|\#[^\n]*)
+  | (?P<raw>[rR]["'](?P<dashes>-*)(?P<open>[(\[{]))
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  | (?P<backtick>`[^`]*`)
+  | (?P<number>(?:0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)[Li]?)
+  | (?P<symbol>(?:[^\W\d_]|\.(?![0-9]))[\w.]*|\.)
+  | (?P<op>:::|::|<<-|->>|<-|->|%[^%\n]*%|\|>|==|!=|<=|>=|&&|\|\||[-+*/^~?:=<>!&|$@(){}\[\],;\\])
+""", re.VERBOSE | re.DOTALL)
+RAW_CLOSERS = {"(": ")", "[": "]", "{": "}"}
+
+
+class TokenizeError(ValueError):
+    """Raised for code the tokenizer cannot split, e.g. an unterminated string."""
+
+
+def tokenize(code):
+    """Splits R code into (kind, value) tokens, dropping whitespace and comments.
+
+    Kinds are "string" (value without quotes), "symbol" (backtick names included), "number" and "op".
+    """
+    tokens = []
+    position = 0
+    while position < len(code):
+        match = TOKEN_PATTERN.match(code, position)
+        if not match:
+            if code[position] in "\"'`":
+                raise TokenizeError(f"unterminated string at offset {position}")
+            raise TokenizeError(f"unexpected character {code[position]!r} at offset {position}")
+        kind = match.lastgroup if match.lastgroup not in ("dashes", "open") else "raw"
+        if kind == "raw":
+            closer = f"{RAW_CLOSERS[match.group('open')]}{match.group('dashes')}{match.group(0)[1]}"
+            end = code.find(closer, match.end())
+            if end == -1:
+                raise TokenizeError(f"unterminated raw string at offset {position}")
+            tokens.append(("string", code[match.end():end]))
+            position = end + len(closer)
+            continue
+        value = match.group(0)
+        if kind == "string":
+            tokens.append(("string", value[1:-1]))
+        elif kind == "backtick":
+            tokens.append(("symbol", value[1:-1]))
+        elif kind != "space":
+            tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+def split_call_arguments(tokens, start):
+    """Splits the arguments of the call whose "(" is at `start`. Returns (list of token lists, index after ")")."""
+    arguments = [[]]
+    depth = 0
+    for i in range(start + 1, len(tokens)):
+        value = tokens[i][1] if tokens[i][0] == "op" else None
+        if value in ("(", "[", "{"):
+            depth += 1
+        elif value in (")", "]", "}"):
+            if depth == 0:
+                return [argument for argument in arguments if argument], i + 1
+            depth -= 1
+        elif value == "," and depth == 0:
+            arguments.append([])
+            continue
+        arguments[-1].append(tokens[i])
+    raise TokenizeError("unbalanced parentheses")
+
+
+def get_package_names(loader, arguments):
+    """Returns the literal package names of a loader call, or None if they are computed at run time."""
+    packages = []
+    for argument in arguments:
+        if len(argument) >= 2 and argument[0][0] in ("symbol", "string") and argument[1] == ("op", "="):
+            name, value = argument[0][1], argument[2:]
+            if name == "character.only" and value not in ([("symbol", "FALSE")], [("symbol", "F")]):
+                return None
+            if name == "char" and (len(value) != 1 or value[0][0] != "string"):
+                return None
+            if name in ("package", "pkg", "char"):
+                packages.append(value)
+        else:
+            packages.append(argument)
+
+    names = []
+    for package in packages if loader in MULTI_LOADERS else packages[:1]:
+        if len(package) != 1:
+            return None
+        kind, value = package[0]
+        if kind != "string" and not (kind == "symbol" and loader not in STRING_LOADERS):
+            return None
+        names.append(value)
+    return names
+
+
+def read_r_code(path):
+    """Reads the R code of a script; for Rmd files the R chunks and inline R expressions."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        content = f.read()
+    if path.lower().endswith(".rmd"):
+        content = "\n".join(RMD_CHUNK_PATTERN.findall(content) + RMD_INLINE_PATTERN.findall(content))
+    return content
+
+
+def extract_static_dependencies(path):
+    """Extracts the libraries of a script without flowR when all of them are loaded literally.
+
+    Handles `library(x)`, `require("x")`, `requireNamespace("x")`, `p_load(x, y)` and `x::f` uses. Returns a tuple
+    of (dependencies in the shape of `parse_dependency_results`, None), or (None, reason) if the script reads,
+    writes or sources files, mentions a string that looks like a file path or loads packages dynamically, so flowR
+    has to analyse it.
+    """
+    try:
+        tokens = tokenize(read_r_code(path))
+    except (OSError, TokenizeError) as e:
+        return None, str(e)
+
+    libraries = []
+    loader_end = 0  # index after the arguments of the last loader call, whose strings are package names
+    for i, (kind, value) in enumerate(tokens):
+        calls = i + 1 < len(tokens) and tokens[i + 1] == ("op", "(")
+        if kind == "string" and value in LOADERS:
+            return None, f"loader '{value}' named as a string"
+        if kind == "string" and i >= loader_end and PATH_LITERAL_PATTERN.search(value):
+            return None, f"string '{value}' looks like a file path"
+        if kind != "symbol" or (i > 0 and tokens[i - 1] in (("op", "$"), ("op", "@"))):
+            continue
+        if i + 1 < len(tokens) and tokens[i + 1] in (("op", "::"), ("op", ":::")):
+            libraries.append(value)
+        if value in LOADERS:
+            if not calls:
+                return None, f"'{value}' used without a direct call"
+            try:
+                arguments, loader_end = split_call_arguments(tokens, i + 1)
+            except TokenizeError as e:
+                return None, str(e)
+            names = get_package_names(value, arguments)
+            if names is None:
+                return None, f"'{value}' call with a computed package name"
+            libraries.extend(names)
+        elif calls and value in DYNAMIC_CALLS:
+            return None, f"dynamic '{value}' call"
+        elif calls and IO_CALL_PATTERN.match(value):
+            return None, f"'{value}' call reads, writes or sources files"
+
+    return {
+        "libraries": list(dict.fromkeys(libraries)),
+        "sourcedFiles": [],
+        "readData": [],
+        "writtenData": [],
+    }, None
+
+
+def compare_libraries(static_dependencies, flowr_dependencies):
+    """Compares the libraries found by the fast path with flowR's. Returns (agreed, static only, flowR only)."""
+    static_libraries = set(static_dependencies["libraries"])
+    flowr_libraries = {name for name in flowr_dependencies["libraries"] if name}
+    return static_libraries == flowr_libraries, sorted(static_libraries - flowr_libraries), sorted(flowr_libraries - static_libraries)
+
+
+def record_agreement(project_id, comparisons):
+    """Appends the fast path vs. flowR comparison of every verified script to the agreement CSV."""
+    if not comparisons:
+        return
+    write_header = not os.path.exists(AGREEMENT_FILE)
+    os.makedirs(os.path.dirname(AGREEMENT_FILE), exist_ok=True)
+    with open(AGREEMENT_FILE, "a", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        if write_header:
+            writer.writerow(["Project ID", "R/Rmd Script", "Agreed", "Static Only", "flowR Only", "Timestamp"])
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        for script, (agreed, static_only, flowr_only) in sorted(comparisons.items()):
+            writer.writerow([project_id, script, agreed, " ".join(static_only), " ".join(flowr_only), timestamp])
+
+
+def report_agreement(top=10):
+    """Prints how often the fast path agreed with flowR, and the packages behind most disagreements."""
+    if not os.path.exists(AGREEMENT_FILE):
+        print(f"ℹ️ No comparisons recorded yet. Run the pipeline with `--fast-path verify` to fill {AGREEMENT_FILE}.")
+        return
+
+    latest = {}
+    with open(AGREEMENT_FILE, "r", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            latest[(row["Project ID"], row["R/Rmd Script"])] = row  # later runs of a script replace earlier ones
+
+    agreed = sum(row["Agreed"] == "True" for row in latest.values())
+    projects = len({project_id for project_id, _ in latest})
+    print(f"Fast path agreed with flowR on {agreed} of {len(latest)} scripts ({agreed / len(latest):.1%}) in {projects} projects.")
+
+    for column in ("Static Only", "flowR Only"):
+        counts = {}
+        for row in latest.values():
+            for name in row[column].split():
+                counts[name] = counts.get(name, 0) + 1
+        if counts:
+            ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top]
+            print(f"{column}: {', '.join(f'{name} ({count})' for name, count in ranked)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Static library extraction, the fast path before flowR")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    extract_parser = subparsers.add_parser("extract", help="Print the libraries of scripts, or why they need flowR")
+    extract_parser.add_argument("scripts", nargs="+", help="R or Rmd scripts")
+    agreement_parser = subparsers.add_parser("agreement", help="Summarize the recorded fast path vs. flowR comparisons")
+    agreement_parser.add_argument("--top", type=int, default=10, help="Packages listed per disagreement kind")
+    args = parser.parse_args()
+
+    if args.command == "agreement":
+        report_agreement(args.top)
+    else:
+        for script in args.scripts:
+            dependencies, reason = extract_static_dependencies(script)
+            if dependencies is None:
+                print(f"{script}: needs flowR ({reason})")
+            else:
+                print(f"{script}: {', '.join(dependencies['libraries']) or 'no libraries'}")
@@ -0,0 +1,227 @@
+import os
+import re
+import glob
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from contextlib import contextmanager
+from utils import CACHE_DIR, DOWNLOADS_DIR, REPOS_DIR, log_message, is_process_alive
+
+USAGE_FILE = os.path.join(CACHE_DIR, "storage_usage.json")  # last use of every zip, source tree and image
+LOCKS_DIR = os.path.join(CACHE_DIR, "locks")  # one lock file per project held by a running stage
+IMAGE_PREFIX = "repo2docker-"
+SHARED_IMAGE_PREFIX = "repo2docker-env-"  # environment images shared by projects with the same fingerprint
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(value):
+    """Parses a human readable size such as `200G` or `512M` into bytes."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", value, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def format_size(size):
+    """Formats a byte count for log messages."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def load_usage():
+    """Loads the recorded last use of every artifact."""
+    if not os.path.exists(USAGE_FILE):
+        return {}
+    with open(USAGE_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def touch(kind, name):
+    """Records that a zip, source tree or image (`kind` is "zip", "src" or "image") was just used."""
+    usage = load_usage()
+    usage[f"{kind}:{name}"] = time.time()
+    os.makedirs(os.path.dirname(USAGE_FILE), exist_ok=True)
+    tmp_file = f"{USAGE_FILE}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(usage, f, indent=2)
+    os.replace(tmp_file, USAGE_FILE)
+
+
+def touch_project(project_id, kinds=("zip", "src"), image_name=None):
+    """Records the use of a project's stored artifacts."""
+    for kind in kinds:
+        touch(kind, project_id)
+    if image_name:
+        touch("image", image_name)
+
+
+def get_lock_path(project_id, holder=None):
+    """Returns the path to the lock file of a project, one per holder (e.g. "publish") besides the main stages."""
+    return os.path.join(LOCKS_DIR, f"{project_id}.{holder}.lock" if holder else f"{project_id}.lock")
+
+
+def acquire(project_id, holder=None):
+    """Marks a project as in use by this process until `release` is called."""
+    os.makedirs(LOCKS_DIR, exist_ok=True)
+    with open(get_lock_path(project_id, holder), "w") as f:
+        f.write(str(os.getpid()))
+
+
+def release(project_id, holder=None):
+    """Removes a mark set by `acquire`."""
+    lock_path = get_lock_path(project_id, holder)
+    if os.path.exists(lock_path):
+        os.remove(lock_path)
+
+
+@contextmanager
+def hold(project_id, holder=None):
+    """Marks a project as in use by this process so its artifacts are never evicted meanwhile.
+
+    Background work that outlives the project's stages, such as publishing, holds it under its own `holder` name.
+    """
+    acquire(project_id, holder)
+    try:
+        yield
+    finally:
+        release(project_id, holder)
+
+
+def is_held(project_id):
+    """Checks whether a live process holds the project under any holder name."""
+    for lock_path in [get_lock_path(project_id)] + glob.glob(get_lock_path(project_id, "*")):
+        try:
+            with open(lock_path) as f:
+                if is_process_alive(int(f.read().strip())):
+                    return True
+        except (OSError, ValueError):
+            continue
+    return False
+
+
+def get_directory_size(path):
+    """Returns the total size of the files in a directory tree."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+    return total
+
+
+def list_images():
+    """Lists the pipeline's local image tags as (name, image ID, size). Returns an empty list if Docker is unavailable."""
+    try:
+        result = subprocess.run(
+            ["docker", "image", "ls", "--filter", f"reference={IMAGE_PREFIX}*", "--format", "{{.Repository}}"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return []
+
+    images = []
+    for name in sorted(set(result.stdout.split())):
+        inspect = subprocess.run(
+            ["docker", "image", "inspect", "--format", "{{.Id}} {{.Size}}", name],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        if inspect.returncode == 0:
+            image_id, size = inspect.stdout.split()
+            images.append((name, image_id, int(size)))
+    return images
+
+
+def get_image_project_id(image_name):
+    """Returns the project ID of a project image tag, or None for a shared environment image."""
+    if image_name.startswith(SHARED_IMAGE_PREFIX):
+        return None
+    project_id = image_name[len(IMAGE_PREFIX):]
+    return project_id[:-len("-f")] if project_id.endswith("-f") else project_id
+
+
+def list_artifacts():
+    """Lists all evictable artifacts as dicts with kind, name, project IDs, size and last use.
+
+    Tags of the same image form one artifact: a shared environment image is used by every project tagged from it,
+    and removing only some of its tags would free no space.
+    """
+    usage = load_usage()
+    artifacts = []
+
+    for zip_file in glob.glob(os.path.join(DOWNLOADS_DIR, "*.zip")):
+        project_id = os.path.basename(zip_file)[:-len(".zip")]
+        artifacts.append({"kind": "zip", "name": project_id, "project_ids": [project_id], "path": zip_file,
+                          "size": os.path.getsize(zip_file), "last_used": usage.get(f"zip:{project_id}", os.path.getmtime(zip_file))})
+
+    for src_path in glob.glob(os.path.join(REPOS_DIR, "*_repo", "*_src")):
+        project_id = os.path.basename(src_path)[:-len("_src")]
+        artifacts.append({"kind": "src", "name": project_id, "project_ids": [project_id], "path": src_path,
+                          "size": get_directory_size(src_path), "last_used": usage.get(f"src:{project_id}", os.path.getmtime(src_path))})
+
+    tags = {}
+    for image_name, image_id, size in list_images():
+        tags.setdefault(image_id, (size, []))[1].append(image_name)
+    for size, names in tags.values():
+        project_ids = [project_id for project_id in map(get_image_project_id, names) if project_id]
+        artifacts.append({"kind": "image", "name": " ".join(names), "names": names, "project_ids": project_ids,
+                          "path": None, "size": size, "last_used": max(usage.get(f"image:{name}", 0) for name in names)})
+
+    return artifacts
+
+
+def evict(artifact):
+    """Deletes one artifact. Returns True if it was removed."""
+    if artifact["kind"] == "image":
+        result = subprocess.run(["docker", "image", "rm"] + artifact["names"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return result.returncode == 0
+    if artifact["kind"] == "src":
+        shutil.rmtree(artifact["path"], ignore_errors=True)
+    else:
+        os.remove(artifact["path"])
+    return True
+
+
+def enforce_disk_budget(budget):
+    """Evicts the least recently used zips, source trees and images until their total size fits in `budget` bytes.
+
+    Artifacts of projects held by a running stage are never evicted, including shared images one of them is tagged
+    from. Returns the number of bytes reclaimed.
+    Image sizes include layers shared with other images, so the reclaimed space for images is an upper bound.
+    """
+    artifacts = list_artifacts()
+    total = sum(a["size"] for a in artifacts)
+    if total <= budget:
+        return 0
+
+    reclaimed = 0
+    for artifact in sorted(artifacts, key=lambda a: a["last_used"]):
+        if total - reclaimed <= budget:
+            break
+        if any(is_held(project_id) for project_id in artifact["project_ids"]):
+            continue
+        if evict(artifact):
+            reclaimed += artifact["size"]
+            message = f"🧹 Evicted {artifact['kind']} '{artifact['name']}' ({format_size(artifact['size'])})."
+            if artifact["project_ids"]:
+                for project_id in artifact["project_ids"]:
+                    log_message(project_id, "STORAGE", message)
+            else:
+                print(message)
+
+    print(f"🧹 Reclaimed {format_size(reclaimed)}. Stored artifacts now use {format_size(total - reclaimed)} of a {format_size(budget)} budget.")
+    return reclaimed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evict least recently used downloads, source trees and images")
+    parser.add_argument("budget", help="Disk budget, e.g. 200G")
+    args = parser.parse_args()
+
+    enforce_disk_budget(parse_size(args.budget))
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import cProfile
+import threading
+import subprocess
+import tracemalloc
+from contextlib import contextmanager
+from utils import LOGS_DIR
+
+TRACES_DIR = os.path.join(LOGS_DIR, "traces")
+PROFILE_KINDS = ("cpu", "memory")
+TOP_ALLOCATIONS = 25  # allocation sites listed in each memory report
+
+_trace_file = None
+_trace_lock = threading.Lock()
+_profile_kinds = ()
+_profile_dir = None
+_original_popen = subprocess.Popen
+
+
+def now_us():
+    """Returns the current time in microseconds, the unit of the Chrome trace format."""
+    return time.perf_counter_ns() // 1000
+
+
+def write_event(event):
+    """Appends an event to the trace file. Does nothing when tracing is off."""
+    if _trace_file is None:
+        return
+    event.setdefault("pid", os.getpid())
+    event.setdefault("tid", threading.get_ident())
+    with _trace_lock:
+        _trace_file.write(json.dumps(event) + ",\n")
+        _trace_file.flush()
+
+
+@contextmanager
+def span(name, category="pipeline", **args):
+    """Records the body as a complete event. Spans opened inside the body nest under it in the trace viewer."""
+    if _trace_file is None:
+        yield
+        return
+    start = now_us()
+    try:
+        yield
+    finally:
+        write_event({"name": name, "cat": category, "ph": "X", "ts": start, "dur": now_us() - start, "args": args})
+
+
+@contextmanager
+def profile_stage(project_id, stage):
+    """Runs cProfile and/or tracemalloc around the body, as enabled for the tracing session.
+
+    CPU profiles are written as `<project>_<stage>.prof` (viewable as a flame graph with snakeviz or flameprof),
+    allocation reports as `<project>_<stage>.allocations.txt`.
+    """
+    if not _profile_kinds:
+        yield
+        return
+
+    name = f"{project_id}_{stage.lower().replace(' ', '_')}"
+    profiler = cProfile.Profile() if "cpu" in _profile_kinds else None
+    trace_memory = "memory" in _profile_kinds and not tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(_profile_dir, f"{name}.prof"))
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(os.path.join(_profile_dir, f"{name}.allocations.txt"), "w", encoding="utf-8") as f:
+                f.write(f"Peak traced memory: {peak / (1024 * 1024):.2f} MB\n\n")
+                for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                    f.write(f"{statistic}\n")
+
+
+@contextmanager
+def stage_span(project_id, stage):
+    """Traces and, if enabled, profiles one pipeline stage of a project."""
+    with span(stage, category="stage", project_id=project_id), profile_stage(project_id, stage):
+        yield
+
+
+class TracedPopen(_original_popen):
+    """Popen that records every subprocess from its start until its exit status is collected."""
+
+    def __init__(self, args, *popen_args, **kwargs):
+        self._trace_start = now_us()
+        self._trace_tid = threading.get_ident()
+        self._trace_recorded = False
+        argv = [str(arg) for arg in args] if isinstance(args, (list, tuple)) else [str(args)]
+        self._trace_name = " ".join(os.path.basename(arg) if i == 0 else arg for i, arg in enumerate(argv[:2]))
+        self._trace_command = " ".join(argv)
+        super().__init__(args, *popen_args, **kwargs)
+
+    def _record_exit(self):
+        if self._trace_recorded or self.returncode is None:
+            return
+        self._trace_recorded = True
+        write_event({
+            "name": self._trace_name, "cat": "subprocess", "ph": "X", "ts": self._trace_start,
+            "dur": now_us() - self._trace_start, "tid": self._trace_tid,
+            "args": {"command": self._trace_command[:1000], "returncode": self.returncode},
+        })
+
+    def wait(self, timeout=None):
+        returncode = super().wait(timeout=timeout)
+        self._record_exit()
+        return returncode
+
+    def poll(self):
+        returncode = super().poll()
+        self._record_exit()
+        return returncode
+
+
+@contextmanager
+def tracing_session(trace=False, profile=()):
+    """Enables tracing and per-stage profiling for the body.
+
+    With `trace=True`, spans and every subprocess are written to `logs/traces/trace-<timestamp>.json` in the Chrome
+    trace event format, which chrome://tracing and ui.perfetto.dev load directly. `profile` lists the profilers
+    ("cpu", "memory") to run around each stage; their reports go to a directory next to the trace file.
+    """
+    global _trace_file, _profile_kinds, _profile_dir
+    if not trace and not profile:
+        yield None
+        return
+
+    os.makedirs(TRACES_DIR, exist_ok=True)
+    run_name = f"trace-{time.strftime('%Y%m%d-%H%M%S')}"
+    trace_path = os.path.join(TRACES_DIR, f"{run_name}.json") if trace else None
+
+    if profile:
+        _profile_dir = os.path.join(TRACES_DIR, run_name)
+        os.makedirs(_profile_dir, exist_ok=True)
+        _profile_kinds = tuple(profile)
+    if trace_path:
+        _trace_file = open(trace_path, "w", encoding="utf-8")
+        _trace_file.write("[\n")  # the trace format allows the closing bracket to be missing if the run is killed
+        write_event({"name": "process_name", "ph": "M", "args": {"name": "osf-to-binder"}})
+        subprocess.Popen = TracedPopen
+
+    try:
+        yield trace_path
+    finally:
+        if trace_path:
+            subprocess.Popen = _original_popen
+            with _trace_lock:
+                _trace_file.write(json.dumps({"name": "trace_end", "ph": "i", "ts": now_us(), "pid": os.getpid(), "s": "g"}) + "\n]\n")
+                _trace_file.close()
+                _trace_file = None
+            print(f"🧭 Trace written to {trace_path}. Open it in chrome://tracing or https://ui.perfetto.dev.")
+        if profile:
+            print(f"🔬 Stage profiles written to {_profile_dir}.")
+            _profile_kinds, _profile_dir = (), None
+
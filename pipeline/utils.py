@@ -1,5 +1,7 @@
 import os
+import csv
 import time
+from log_store import SECTION_END, rotate_if_needed
 
 PIPELINE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -8,6 +10,29 @@ REPOS_DIR = "repos"
 RESULTS_DIR = "results"
 DOWNLOADS_DIR = "downloads"
 METADATA_DIR = "metadata"
+CACHE_DIR = "cache"
+STAGE_TIMINGS_FILE = os.path.join(RESULTS_DIR, "stage_timings.csv")  # wall time of every pipeline stage per project
+
+_log_listeners = []  # callables receiving (project_id, log_entry) for every logged message
+_osf_client = None
+
+
+def add_log_listener(listener):
+    """Registers a callable that receives `(project_id, log_entry)` for every logged message."""
+    _log_listeners.append(listener)
+
+def remove_log_listener(listener):
+    """Unregisters a log listener."""
+    if listener in _log_listeners:
+        _log_listeners.remove(listener)
+
+def get_osf_client():
+    """Returns a shared OSF client, so its HTTP session is reused across projects."""
+    global _osf_client
+    if _osf_client is None:
+        from osfclient import OSF
+        _osf_client = OSF()
+    return _osf_client
 
 
 def log_message(project_id, stage, message, execution_log=False):
@@ -26,6 +51,44 @@ def log_message(project_id, stage, message, execution_log=False):
     log_file = os.path.join(LOGS_DIR, f"{project_id}{'_execution' if execution_log else ''}.log")
     with open(log_file, "a", encoding="utf-8") as f:
         f.write(log_entry + "\n")
+    # Execution logs rotate only after a section separator, so a script section never spans two segments
+    rotate_if_needed(log_file, at_boundary=not execution_log or message.endswith(SECTION_END))
+
+    for listener in list(_log_listeners):
+        listener(project_id, log_entry)
+
+def record_stage_timing(project_id, stage, seconds):
+    """Appends the wall time of a pipeline stage to the stage timings CSV."""
+    write_header = not os.path.exists(STAGE_TIMINGS_FILE)
+    with open(STAGE_TIMINGS_FILE, "a", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        if write_header:
+            writer.writerow(["Project ID", "Stage", "Seconds", "Timestamp"])
+        writer.writerow([project_id, stage, f"{seconds:.2f}", time.strftime("%Y-%m-%d %H:%M:%S")])
+
+def is_process_alive(pid):
+    """Checks whether a process with the given PID exists on this host."""
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # the process exists but belongs to another user
+
+def get_process_start_time(pid):
+    """Returns the start time of a process in clock ticks since boot, or None if it is unknown (e.g. not on Linux).
+
+    Together with the PID it identifies a process even after its PID was reused.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name in parentheses may contain spaces; the start time is the 22nd field overall
+    fields = stat[stat.rfind(")") + 2:].split()
+    return int(fields[19]) if len(fields) > 19 and fields[19].isdigit() else None
 
 def get_project_path(project_id):
     """Returns the path to the project repo directory."""
@@ -38,3 +101,7 @@ def get_src_path(project_id):
 def get_zip_file_path(project_id):
     """Returns the path to the project zip file."""
     return os.path.join(DOWNLOADS_DIR, f"{project_id}.zip")
+
+def get_script_dependencies_path(project_id):
+    """Returns the path to the cached per-script flowR dependencies of a project."""
+    return os.path.join(CACHE_DIR, "dependencies", f"{project_id}.json")
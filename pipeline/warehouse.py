@@ -0,0 +1,159 @@
+import os
+import shutil
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from utils import RESULTS_DIR, STAGE_TIMINGS_FILE, log_message, get_script_dependencies_path
+from flowr_dependency_query import read_script_dependencies
+from results_store import load_results_frame
+
+WAREHOUSE_DIR = os.path.join(RESULTS_DIR, "warehouse")  # one Parquet partition per table and project
+RESULTS_FILE = os.path.join(RESULTS_DIR, "execution_results.csv")
+MIN_PACKAGE_SCRIPTS = 5  # scripts a package must be loaded by to appear in the failure correlations
+
+
+def get_partition_path(table, project_id):
+    """Returns the hive-style partition directory of a project in a table."""
+    return os.path.join(WAREHOUSE_DIR, table, f"project_id={project_id}")
+
+
+def write_partition(table, project_id, df):
+    """Replaces the partition of a project in a table, so re-exporting a project never duplicates rows."""
+    partition_path = get_partition_path(table, project_id)
+    if os.path.exists(partition_path):
+        shutil.rmtree(partition_path)
+    if df.empty:
+        return
+    os.makedirs(partition_path, exist_ok=True)
+    # Text columns are typed explicitly, so a column that is empty for one project is not written as null type
+    df = df.astype({column: "string" for column in df.columns if df[column].dtype == object})
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), os.path.join(partition_path, "part-0.parquet"))
+
+
+def read_results(project_id):
+    """Reads the execution results of a project, including error labels and resource usage."""
+    if not os.path.exists(RESULTS_FILE):
+        return pd.DataFrame()
+    df = load_results_frame(dtype=str)
+    df = df[df["Project ID"] == project_id].drop(columns=["Project ID"])
+    df.columns = [column.lower().replace("/", "_").replace(" ", "_").replace("(", "").replace(")", "") for column in df.columns]
+    for column in ("wall_time_s", "cpu_time_s", "peak_rss_mb", "bytes_written"):
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+    return df
+
+
+def read_stage_timings(project_id):
+    """Reads the recorded stage timings of a project."""
+    if not os.path.exists(STAGE_TIMINGS_FILE):
+        return pd.DataFrame()
+    df = pd.read_csv(STAGE_TIMINGS_FILE, dtype={"Project ID": str})
+    df = df[df["Project ID"] == project_id]
+    return pd.DataFrame({"stage": df["Stage"], "seconds": df["Seconds"].astype(float), "timestamp": df["Timestamp"]})
+
+
+def read_dependencies(project_id):
+    """Flattens the per-script flowR dependencies of a project into (script, kind, name) rows."""
+    script_dependencies = read_script_dependencies(get_script_dependencies_path(project_id)) or {}
+    rows = [
+        {"script_path": script, "r_rmd_script": os.path.basename(script), "kind": kind, "name": name}
+        for script, dependencies in script_dependencies.items()
+        for kind, names in dependencies.items()
+        for name in names if name
+    ]
+    return pd.DataFrame(rows, columns=["script_path", "r_rmd_script", "kind", "name"])
+
+
+def export_project(project_id):
+    """Exports the results, stage timings and dependencies of a project to the warehouse."""
+    write_partition("results", project_id, read_results(project_id))
+    write_partition("stage_timings", project_id, read_stage_timings(project_id))
+    write_partition("dependencies", project_id, read_dependencies(project_id))
+    log_message(project_id, "WAREHOUSE", f"🗄️ Exported results, stage timings and dependencies to {WAREHOUSE_DIR}.")
+
+
+def export_all():
+    """Backfills the warehouse with every project in the results CSV."""
+    project_ids = pd.read_csv(RESULTS_FILE, usecols=["Project ID"], dtype=str)["Project ID"].dropna().unique()
+    for project_id in project_ids:
+        export_project(project_id)
+    print(f"🗄️ Exported {len(project_ids)} project(s) to {WAREHOUSE_DIR}.")
+
+
+def load_table(table):
+    """Loads a warehouse table with its project_id partition column. Returns an empty frame if it has no data.
+
+    Partitions exported at different times may have different columns (e.g. error labels added later), so the
+    schema is unified across all files instead of being inferred from the first one.
+    """
+    path = os.path.join(WAREHOUSE_DIR, table)
+    if not os.path.isdir(path) or not os.listdir(path):
+        return pd.DataFrame()
+    partition_schema = pa.schema([("project_id", pa.string())])
+    partitioning = ds.partitioning(partition_schema, flavor="hive")
+    dataset = ds.dataset(path, format="parquet", partitioning=partitioning)
+    schema = pa.unify_schemas([pq.read_schema(file) for file in dataset.files] + [partition_schema],
+                              promote_options="permissive")
+    return ds.dataset(path, format="parquet", partitioning=partitioning, schema=schema).to_table().to_pandas()
+
+
+def summarize(top=15):
+    """Prints success rates, failure categories, package failure correlations and stage times from the warehouse."""
+    results = load_table("results")
+    if results.empty:
+        print("ℹ️ The warehouse is empty. Run `warehouse.py export --all` first.")
+        return
+
+    executed = results[~results["execution_status"].str.startswith("Skipped")]
+    failed = executed["execution_status"] == "Failed"
+    print(f"Projects: {results['project_id'].nunique()}  Scripts: {len(results)}  Executed: {len(executed)}")
+    print(f"Script success rate: {1 - failed.mean():.1%}")
+    per_project = executed.assign(failed=failed).groupby("project_id")["failed"].max()
+    print(f"Projects with all executed scripts successful: {1 - per_project.mean():.1%}")
+
+    print("\nExecution status:")
+    print(results["execution_status"].value_counts().to_string())
+
+    if "reason" in results.columns:
+        print("\nFailure categories:")
+        categories = results[results["execution_status"] != "Successful"].groupby(["reason", "error_message"]).size()
+        print(categories.sort_values(ascending=False).head(top).to_string())
+
+    dependencies = load_table("dependencies")
+    if not dependencies.empty:
+        libraries = dependencies[dependencies["kind"] == "libraries"][["project_id", "r_rmd_script", "name"]].drop_duplicates()
+        outcomes = executed.assign(failed=failed)[["project_id", "r_rmd_script", "failed"]]
+        usage = libraries.merge(outcomes, on=["project_id", "r_rmd_script"])
+        if not usage.empty:
+            overall = outcomes["failed"].mean()
+            packages = usage.groupby("name")["failed"].agg(scripts="size", failure_rate="mean")
+            packages = packages[packages["scripts"] >= MIN_PACKAGE_SCRIPTS]
+            packages["lift"] = packages["failure_rate"] / overall if overall else float("nan")
+            print(f"\nPackages most associated with failures (used by >= {MIN_PACKAGE_SCRIPTS} scripts, overall failure rate {overall:.1%}):")
+            print(packages.sort_values(["lift", "scripts"], ascending=False).head(top).to_string(float_format=lambda v: f"{v:.2f}"))
+
+    timings = load_table("stage_timings")
+    if not timings.empty:
+        print("\nStage times (seconds):")
+        print(timings.groupby("stage")["seconds"].describe()[["count", "50%", "mean", "max"]].to_string(float_format=lambda v: f"{v:.1f}"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar warehouse of execution results for corpus-wide summaries")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export projects to the warehouse")
+    export_parser.add_argument("project_ids", nargs="*", help="Project IDs to export")
+    export_parser.add_argument("--all", action="store_true", help="Export every project in the results CSV")
+    summary_parser = subparsers.add_parser("summary", help="Print corpus-wide summaries from the warehouse")
+    summary_parser.add_argument("--top", type=int, default=15, help="Rows per ranking")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        summarize(args.top)
+    elif args.all:
+        export_all()
+    else:
+        for project_id in args.project_ids:
+            export_project(project_id)